@@ -0,0 +1,97 @@
+"""
+Recall and latency of the IVF index against exact search, offline, on
+synthetic clustered 768-dimension vectors (embeddings of real text cluster by
+topic; uniform random vectors would not).
+
+    python -m bench.ann_recall --rows 100000 --queries 200 --k 10
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from services.llm.ann import IVFIndex
+from services.llm.index import search_rows, top_k_scores
+from services.store.vectors import VectorMatrix, normalize_rows
+
+
+def synthetic_vectors(rows: int, dim: int, clusters: int, spread: float, rng) -> np.ndarray:
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, rows)]
+    vectors += rng.normal(scale=spread, size=(rows, dim)).astype(np.float32)
+    return normalize_rows(vectors)
+
+
+def latencies(fn, queries) -> tuple[list, np.ndarray]:
+    results, times = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        times.append(time.perf_counter() - start)
+    return results, np.asarray(times) * 1000
+
+
+def recall(results, truth) -> float:
+    hits = sum(len(set(ids.tolist()) & set(exact.tolist())) for (ids, _), exact in zip(results, truth))
+    return hits / sum(len(exact) for exact in truth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--spread", type=float, default=2.0, help="noise around each cluster center")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--probes", default="1,4,8,16,32,64")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix = synthetic_vectors(args.rows, args.dim, args.clusters, args.spread, rng)
+    # Queries near stored rows, like a question close to a passage
+    noise = rng.normal(scale=0.5 / np.sqrt(args.dim), size=(args.queries, args.dim)).astype(np.float32)
+    queries = normalize_rows(matrix[rng.integers(0, args.rows, args.queries)] + noise)
+
+    exact, exact_ms = latencies(lambda q: top_k_scores(matrix, q, args.k), queries)
+    truth = [ids for ids, _ in exact]
+    vectors = VectorMatrix(matrix)
+
+    start = time.perf_counter()
+    ann = IVFIndex.train(vectors)
+    build_s = time.perf_counter() - start
+
+    print(f"{args.rows} rows x {args.dim} dims, {len(ann.lists)} lists, recall@{args.k} over {args.queries} queries")
+    print(f"build           : {build_s:8.2f} s")
+    print(f"exact           : p50 {np.percentile(exact_ms, 50):7.2f} ms  p95 {np.percentile(exact_ms, 95):7.2f} ms")
+    for n_probe in [int(p) for p in args.probes.split(",")]:
+        ann.n_probe = n_probe
+        results, ms = latencies(lambda q: search_rows(vectors, q, args.k, ann), queries)
+        print(f"ivf probes={n_probe:<4}: p50 {np.percentile(ms, 50):7.2f} ms  p95 {np.percentile(ms, 95):7.2f} ms"
+              f"  recall {recall(results, truth):.3f}")
+
+    # Train on 90% of the rows, then insert the rest the way a new PDF is added
+    split = int(args.rows * 0.9)
+    partial = IVFIndex.train(vectors.take(slice(0, split)))
+    start = time.perf_counter()
+    partial.add(vectors.take(slice(split, None)), split)
+    add_ms = (time.perf_counter() - start) * 1000
+    results, _ = latencies(lambda q: search_rows(vectors, q, args.k, partial), queries)
+    print(f"add {args.rows - split} rows  : {add_ms:8.1f} ms  recall {recall(results, truth):.3f}"
+          f" (probes={partial.n_probe}, no retraining)")
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "bench.npz")
+        start = time.perf_counter()
+        ann.save(path)
+        save_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        IVFIndex.load(path)
+        load_ms = (time.perf_counter() - start) * 1000
+    print(f"save / load     : {save_ms:8.1f} ms / {load_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
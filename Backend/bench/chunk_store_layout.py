@@ -0,0 +1,75 @@
+"""
+Compare the legacy inline layout (vectors as float lists inside the `pdfs`
+document) with the binary chunk store, offline, using BSON encode/decode.
+
+    python -m bench.chunk_store_layout --chunks 5000 --dim 768
+"""
+import argparse
+import time
+
+import bson
+import numpy as np
+from bson import ObjectId
+
+from services.store.chunk_store import _chunk_doc, decode_vectors
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=768)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.chunks, args.dim)).astype(np.float32)
+    text = "lorem ipsum dolor sit amet " * 30
+    embedding_data = [
+        {"index": i, "chunk": text, "vector": vectors[i].tolist()}
+        for i in range(args.chunks)
+    ]
+    pdf_id = ObjectId()
+
+    legacy_doc = {"_id": pdf_id, "filename": "bench.pdf", "embeddings": embedding_data}
+    legacy_bytes = bson.encode(legacy_doc)
+
+    chunk_docs = [_chunk_doc(pdf_id, item, fmt="float32") for item in embedding_data]
+    chunk_bytes = [bson.encode(doc) for doc in chunk_docs]
+    meta_bytes = bson.encode({"_id": pdf_id, "filename": "bench.pdf", "chunk_count": args.chunks})
+
+    def load_legacy():
+        doc = bson.decode(legacy_bytes)
+        np.asarray([e["vector"] for e in doc["embeddings"]], dtype=np.float32)
+
+    def load_chunks():
+        docs = [bson.decode(raw) for raw in chunk_bytes]
+        decode_vectors([d["vector"] for d in docs], args.dim)
+
+    def load_legacy_meta():
+        bson.decode(legacy_bytes)
+
+    def load_meta():
+        bson.decode(meta_bytes)
+
+    mb = 1024 * 1024
+    print(f"{args.chunks} chunks x {args.dim} dims")
+    print(f"legacy pdfs document : {len(legacy_bytes) / mb:8.2f} MB "
+          f"({'over' if len(legacy_bytes) > 16 * mb else 'under'} the 16 MB limit)")
+    print(f"chunk store documents: {sum(map(len, chunk_bytes)) / mb:8.2f} MB "
+          f"({len(chunk_bytes[0]) / 1024:.1f} KB per chunk)")
+    print(f"load vectors  legacy : {timed(load_legacy) * 1000:8.1f} ms")
+    print(f"load vectors  chunks : {timed(load_chunks) * 1000:8.1f} ms")
+    print(f"metadata read legacy : {timed(load_legacy_meta) * 1000:8.1f} ms")
+    print(f"metadata read chunks : {timed(load_meta) * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
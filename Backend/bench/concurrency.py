@@ -0,0 +1,85 @@
+"""
+Requests/sec of the /llm upstream pattern (one query embedding, one LLM call)
+under the sync execution model (handlers on Starlette's 40-thread pool,
+blocking requests clients) versus the async one (coroutines on one event
+loop, shared aiohttp sessions), against the local fake Ollama server.
+
+    python -m bench.concurrency --sessions 50 100 250 500 --generate-ms 200
+
+Mongo is left out on purpose: both models make the same queries, and the
+difference measured here is how many slow upstream calls can be in flight.
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from bench.fake_ollama import spawn_fake_ollama
+from services.llm.embedding import AsyncEmbeddingClient, EmbeddingClient
+
+STARLETTE_THREADPOOL = 40
+
+
+def run_sync(url: str, sessions: int, turns: int) -> float:
+    embedder = EmbeddingClient(base_url=url, concurrency=STARLETTE_THREADPOOL)
+    http = requests.Session()
+    http.mount("http://", HTTPAdapter(pool_maxsize=STARLETTE_THREADPOOL))
+
+    def handle(n):
+        embedder.embed(f"question {n}")
+        http.post(f"{url}/api/generate", json={"prompt": f"prompt {n}"}, timeout=60).raise_for_status()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=STARLETTE_THREADPOOL) as pool:
+        list(pool.map(handle, range(sessions * turns)))
+    elapsed = time.perf_counter() - start
+    embedder.close()
+    http.close()
+    return sessions * turns / elapsed
+
+
+async def run_async(url: str, sessions: int, turns: int) -> float:
+    embedder = AsyncEmbeddingClient(base_url=url, max_connections=sessions)
+    http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=sessions))
+
+    async def session(s):
+        for turn in range(turns):
+            n = s * turns + turn
+            await embedder.embed(f"question {n}")
+            async with http.post(f"{url}/api/generate", json={"prompt": f"prompt {n}"}) as response:
+                response.raise_for_status()
+                await response.read()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[session(s) for s in range(sessions)])
+    elapsed = time.perf_counter() - start
+    await embedder.aclose()
+    await http.close()
+    return sessions * turns / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[50, 100, 250, 500])
+    parser.add_argument("--turns", type=int, default=3, help="questions per chat session")
+    parser.add_argument("--embed-ms", type=float, default=10.0)
+    parser.add_argument("--generate-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    server, url = spawn_fake_ollama(latency_ms=args.embed_ms, generate_ms=args.generate_ms)
+    try:
+        print(f"{'sessions':>8}  {'sync req/s':>10}  {'async req/s':>11}")
+        for sessions in args.sessions:
+            sync_rps = run_sync(url, sessions, args.turns)
+            async_rps = asyncio.run(run_async(url, sessions, args.turns))
+            print(f"{sessions:>8}  {sync_rps:>10.1f}  {async_rps:>11.1f}")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Prompt context size against CONTEXT_TOKEN_BUDGET. A synthetic PDF is
+ingested (QA pairs included) against the stand-ins of bench.suite, its
+questions are retrieved once with CONTEXT_CANDIDATES matches each, and the
+context is then packed at each budget. For every budget it reports the
+estimated tokens sent, those left out as overlap or duplicates and as over
+the budget, the packing time, and the hit rate: questions whose target
+identifier made it into the context. The context of the previous fixed
+rules (top 3 QA pairs and top 3 chunks cut at 500 characters) is measured
+the same way for comparison.
+
+The stand-in's vectors are random, so neither rule set's minimum scores
+mean anything here; both take every candidate, ranked as retrieved.
+
+    python -m bench.context_budget --pages 100 --budgets 200 400 800 1600
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bench.fake_ollama import spawn_fake_ollama
+from bench.suite import bench_ingest, configure, create_user, percentiles
+from bench.synthetic_pdf import page_code
+
+
+def legacy_context(retrieved: dict) -> str:
+    """The context as built before the packer, less the minimum scores"""
+    parts = []
+    relevant_qa = retrieved["qa_matches"][:3]
+    if relevant_qa:
+        parts.append("Previously answered questions from the document:")
+        for idx, qa in enumerate(relevant_qa, 1):
+            parts += [f"\n{idx}. Q: {qa['question']}", f"   A: {qa['answer']}", f"   (Relevance: {qa['score']:.2f})"]
+    relevant_chunks = retrieved["chunk_matches"][:3]
+    if relevant_chunks:
+        parts.append("\n\nRelevant sections from the document:")
+        for idx, chunk in enumerate(relevant_chunks, 1):
+            parts += [f"\n{idx}. {chunk['chunk'][:500]}...", f"   (Relevance: {chunk['score']:.2f})"]
+    return "\n".join(parts)
+
+
+def summarize(contexts: list[str], codes: list[str], times_ms: list[float], stats: list[dict] = None) -> dict:
+    from services.llm.context import estimate_tokens
+
+    tokens = [estimate_tokens(context) for context in contexts]
+    result = {
+        "tokens_p50": int(np.percentile(tokens, 50)),
+        "tokens_mean": round(float(np.mean(tokens)), 1),
+        "hit_rate": round(sum(code in context for code, context in zip(codes, contexts)) / len(codes), 3),
+        **percentiles(times_ms),
+    }
+    if stats:
+        result["duplicate_mean"] = round(float(np.mean([s["context_duplicate_tokens"] for s in stats])), 1)
+        result["over_budget_mean"] = round(float(np.mean([s["context_over_budget_tokens"] for s in stats])), 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[200, 400, 800, 1600])
+    parser.add_argument("--mongo-url")
+    parser.add_argument("--out")
+    args = parser.parse_args()
+    args.llm_ms = 0.0
+
+    workdir = tempfile.mkdtemp(prefix="chatpdf-bench-")
+    ollama, args.ollama_url = spawn_fake_ollama(latency_ms=1.0)
+    os.environ["QA_STAGE"] = "inline"
+    configure(args, workdir)
+    try:
+        from conf.confilg import CONTEXT_CANDIDATES
+        from conf.repository import find_user_pdf
+        from services.llm import context
+        from services.llm.context import pack_context
+        from services.llm.llm import embed_question, search_pdf
+
+        context.QA_MIN_SCORE = context.CHUNK_MIN_SCORE = float("-inf")
+        user_id, _ = create_user("reader")
+        ingest, pdf_id = bench_ingest(user_id, args.pages, workdir)
+        pdf = find_user_pdf(user_id, pdf_id)
+        pages = np.random.default_rng(args.pages).integers(0, args.pages, args.queries)
+        codes = [page_code(args.pages, p) for p in pages]
+        questions = [f"What does section {p + 1} say about item {code}?" for p, code in zip(pages, codes)]
+        retrieved = [search_pdf(pdf, embed_question(question), CONTEXT_CANDIDATES, question) for question in questions]
+    finally:
+        ollama.terminate()
+
+    def timed(build):
+        contexts, times = [], []
+        for matches in retrieved:
+            start = time.perf_counter()
+            contexts.append(build(matches))
+            times.append((time.perf_counter() - start) * 1000)
+        return contexts, times
+
+    results = {"pdf": ingest, "candidates": CONTEXT_CANDIDATES}
+    legacy, times = timed(legacy_context)
+    results["legacy"] = summarize(legacy, codes, times)
+    for budget in args.budgets:
+        packed, times = timed(lambda matches: pack_context(matches, budget))
+        results[f"budget_{budget}"] = summarize([context for context, _ in packed], codes, times,
+                                                [stats for _, stats in packed])
+
+    print(f"{ingest['pages']} pages, {ingest['chunks']} chunks, {ingest['qa_pairs']} QA pairs, "
+          f"{CONTEXT_CANDIDATES} candidates per kind")
+    print(f"{'context':<12} {'tokens p50':>10} {'mean':>7} {'duplicate':>9} {'over':>7} {'hit rate':>8} {'p50 ms':>7}")
+    for name, row in results.items():
+        if isinstance(row, dict) and "tokens_p50" in row:
+            print(f"{name:<12} {row['tokens_p50']:>10} {row['tokens_mean']:>7.0f} {row.get('duplicate_mean', 0):>9.0f} "
+                  f"{row.get('over_budget_mean', 0):>7.0f} {row['hit_rate']:>8.2f} {row['p50_ms']:>7.2f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
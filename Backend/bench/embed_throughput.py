@@ -0,0 +1,70 @@
+"""
+Compare serial single-input embedding against the batched, pooled client.
+
+    python -m bench.embed_throughput --chunks 2000 --latency-ms 20
+"""
+import argparse
+import time
+
+import requests
+
+from bench.fake_ollama import start_fake_ollama
+from services.llm.embedding import EmbeddingClient
+
+
+def run_serial(url: str, texts: list[str]) -> float:
+    """The old path: a fresh requests.post per chunk"""
+    start = time.perf_counter()
+    for text in texts:
+        response = requests.post(
+            f"{url}/api/embeddings",
+            json={"model": "nomic-embed-text", "prompt": text},
+            timeout=30,
+        )
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def run_batched(url: str, texts: list[str], batch_size: int, concurrency: int) -> float:
+    client = EmbeddingClient(base_url=url, batch_size=batch_size, concurrency=concurrency)
+    try:
+        start = time.perf_counter()
+        vectors = client.embed_many(texts)
+        elapsed = time.perf_counter() - start
+        assert len(vectors) == len(texts)
+        return elapsed
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--per-input-ms", type=float, default=1.0)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--skip-serial", action="store_true")
+    args = parser.parse_args()
+
+    server = start_fake_ollama(latency_ms=args.latency_ms, per_input_ms=args.per_input_ms)
+    texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 30 for i in range(args.chunks)]
+
+    try:
+        if not args.skip_serial:
+            before = server.request_count
+            elapsed = run_serial(server.url, texts)
+            print(f"serial : {elapsed:7.2f}s  {len(texts) / elapsed:8.1f} chunks/s  "
+                  f"{server.request_count - before} requests")
+
+        before = server.request_count
+        elapsed = run_batched(server.url, texts, args.batch_size, args.concurrency)
+        print(f"batched: {elapsed:7.2f}s  {len(texts) / elapsed:8.1f} chunks/s  "
+              f"{server.request_count - before} requests "
+              f"(batch={args.batch_size}, concurrency={args.concurrency})")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
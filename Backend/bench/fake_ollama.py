@@ -0,0 +1,161 @@
+"""
+Local stand-in for Ollama's embedding API so throughput can be measured offline.
+
+    python -m bench.fake_ollama --port 11434 --latency-ms 20 --per-input-ms 2
+
+Serves POST /api/embed (batch) and POST /api/embeddings (legacy single input).
+Vectors are deterministic per input text. POST /api/generate returns a canned
+completion after --generate-ms, as a stand-in for an LLM call.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@lru_cache(maxsize=4096)
+def fake_vector(text: str, dim: int = 768) -> tuple[float, ...]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return tuple(v / norm for v in vector)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        server.count_request()
+
+        if self.path == "/api/embed":
+            inputs = payload.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            server.simulate_latency(len(inputs))
+            self._send_json(200, {
+                "model": payload.get("model"),
+                "embeddings": [fake_vector(text, server.dim) for text in inputs],
+            })
+        elif self.path == "/api/embeddings":
+            server.simulate_latency(1)
+            self._send_json(200, {"embedding": fake_vector(payload.get("prompt", ""), server.dim)})
+        elif self.path == "/api/generate":
+            server.simulate_generate()
+            prompt = payload.get("prompt", "")
+            self._send_json(200, {
+                "model": payload.get("model"),
+                "response": f"Fake answer for a {len(prompt)}-character prompt.",
+                "done": True,
+            })
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    request_queue_size = 1024
+
+    def __init__(self, address, latency_ms: float = 0.0, per_input_ms: float = 0.0, dim: int = 768,
+                 generate_ms: float = 0.0):
+        super().__init__(address, FakeOllamaHandler)
+        self.latency_ms = latency_ms
+        self.generate_ms = generate_ms
+        self.per_input_ms = per_input_ms
+        self.dim = dim
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    def simulate_latency(self, inputs: int):
+        delay = (self.latency_ms + self.per_input_ms * inputs) / 1000.0
+        if delay > 0:
+            time.sleep(delay)
+
+    def simulate_generate(self):
+        if self.generate_ms > 0:
+            time.sleep(self.generate_ms / 1000.0)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_fake_ollama(port: int = 0, **kwargs) -> FakeOllamaServer:
+    """Start the fake server on a background thread; port 0 picks a free port"""
+    server = FakeOllamaServer(("127.0.0.1", port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def spawn_fake_ollama(port: int = 0, latency_ms: float = 0.0, per_input_ms: float = 0.0,
+                      dim: int = 768, generate_ms: float = 0.0):
+    """
+    Run the fake server in a child process, so its CPU work doesn't share
+    the GIL with the client being measured. Returns (process, url).
+    """
+    if port == 0:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+    process = subprocess.Popen([
+        sys.executable, "-m", "bench.fake_ollama", "--port", str(port),
+        "--latency-ms", str(latency_ms), "--per-input-ms", str(per_input_ms),
+        "--dim", str(dim), "--generate-ms", str(generate_ms),
+    ], stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama embedding server")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--per-input-ms", type=float, default=2.0)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--generate-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(
+        ("127.0.0.1", args.port),
+        latency_ms=args.latency_ms,
+        per_input_ms=args.per_input_ms,
+        dim=args.dim,
+        generate_ms=args.generate_ms,
+    )
+    print(f"Fake Ollama listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,84 @@
+"""
+Build cost, size and query latency of the BM25 lexical index next to
+vector search, offline, on synthetic chunks: filler prose with a rare
+identifier (a part number) planted in one chunk per query. Reports how
+often the planted chunk is the top result for vector-only, hybrid and
+lexical-only retrieval, and the hybrid latency with the lexical pre-filter.
+
+    python -m bench.hybrid_search --rows 20000 --queries 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+import services.llm.index as index
+from bench.ann_recall import latencies, synthetic_vectors
+from services.llm.index import search_hybrid, search_rows
+from services.llm.lexical import LexicalIndex
+from services.store.vectors import VectorMatrix, normalize_rows
+
+WORDS = ("warranty service terms customer product replacement period coverage repair damage claim "
+         "notice delivery invoice payment contract supplier order shipment return policy").split()
+
+
+def synthetic_chunks(rows: int, words: int, rng) -> list[str]:
+    vocab = np.asarray(WORDS + [f"term{i}" for i in range(2000)])
+    return [" ".join(vocab[rng.zipf(1.3, words) % len(vocab)]) for _ in range(rows)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--words", type=int, default=150, help="words per chunk")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--signal", type=float, default=0.8, help="weight of the planted chunk in each query vector")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts = synthetic_chunks(args.rows, args.words, rng)
+    targets = rng.choice(args.rows, args.queries, replace=False)
+    questions = []
+    for n, row in enumerate(targets.tolist()):
+        part = f"XK-{4000 + n}-B"
+        texts[row] += f" replace valve part {part}"
+        questions.append(f"what is part {part}?")
+
+    matrix = synthetic_vectors(args.rows, args.dim, 500, 2.0, rng)
+    vectors = VectorMatrix(matrix)
+    # An embedding barely tells identifiers apart: the question lands
+    # between its chunk and another chunk on a similar topic
+    others = matrix[rng.integers(0, args.rows, args.queries)]
+    queries = normalize_rows(args.signal * matrix[targets] + others)
+
+    start = time.perf_counter()
+    lexical = LexicalIndex.build(texts)
+    build_s = time.perf_counter() - start
+
+    def hit_rate(results) -> float:
+        return float(np.mean([len(ids) and ids[0] == row for (ids, *_), row in zip(results, targets)]))
+
+    pairs = list(zip(queries, questions))
+    print(f"{args.rows} chunks x {args.words} words, {args.queries} identifier questions, top {args.k}")
+    print(f"lexical build   : {build_s:8.2f} s  {lexical.nbytes / args.rows:6.0f} B/row "
+          f"(vectors {vectors.nbytes / args.rows:.0f} B/row)")
+    runs = [
+        ("vector only", lambda p: search_rows(vectors, p[0], args.k)),
+        ("hybrid", lambda p: search_hybrid(vectors, lexical, p[0], p[1], args.k)),
+        ("lexical only", lambda p: search_hybrid(vectors, lexical, None, p[1], args.k)),
+    ]
+    for name, fn in runs:
+        results, ms = latencies(fn, pairs)
+        print(f"{name:16}: p50 {np.percentile(ms, 50):7.2f} ms  p95 {np.percentile(ms, 95):7.2f} ms"
+              f"  planted chunk first {hit_rate(results):.3f}")
+
+    index.LEXICAL_PREFILTER_ROWS = 0
+    results, ms = latencies(runs[1][1], pairs)
+    print(f"{'hybrid prefilter':16}: p50 {np.percentile(ms, 50):7.2f} ms  p95 {np.percentile(ms, 95):7.2f} ms"
+          f"  planted chunk first {hit_rate(results):.3f}")
+
+
+if __name__ == "__main__":
+    main()
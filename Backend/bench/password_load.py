@@ -0,0 +1,140 @@
+"""
+Login throughput and /llm latency while a login storm is running, with
+bcrypt run in the request threads (PASSWORD_WORKERS=0, as before) and in
+the password process pool. Each mode runs in a child process of its own,
+as settings are read at import, against the same local stand-ins as
+bench.suite (mongomock, fake Ollama, LLM_PROVIDER=fake).
+
+    python -m bench.password_load --logins 64 --llm-clients 8 --seconds 20
+
+For each mode, /llm is measured alone first and then with `--logins`
+clients logging in back to back. A refused login (503) is retried after
+--retry-ms, as a client honouring Retry-After would.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.fake_ollama import spawn_fake_ollama
+from bench.suite import percentiles
+
+
+def run_for(seconds: float, clients: int, step) -> list:
+    """Call step() from `clients` threads until `seconds` have passed; returns what the calls returned"""
+    deadline = time.perf_counter() + seconds
+    results, lock = [], threading.Lock()
+
+    def loop():
+        while time.perf_counter() < deadline:
+            result = step()
+            with lock:
+                results.append(result)
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(loop) for _ in range(clients)]:
+            future.result()
+    return results
+
+
+def run_mode(args):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    from bench.suite import bench_ingest, configure, create_user, serve_app
+
+    workdir = tempfile.mkdtemp(prefix="chatpdf-bench-")
+    configure(args, workdir)
+    from services.user.passwords import start_password_pool
+
+    user_id, token = create_user("reader")
+    _, pdf_id = bench_ingest(user_id, 20, workdir)
+    start_password_pool()
+    server, url = serve_app()
+
+    http = requests.Session()
+    http.mount("http://", HTTPAdapter(pool_maxsize=args.logins + args.llm_clients))
+    for n in range(args.users):
+        http.post(f"{url}/signup", json={"userName": f"u{n}", "email": f"u{n}@example.com", "password": "password-123"},
+                  timeout=120).raise_for_status()
+
+    counter = iter(range(10 ** 9))
+
+    def ask():
+        start = time.perf_counter()
+        response = http.post(f"{url}/llm", headers={"Authorization": f"Bearer {token}"},
+                             json={"user_question": f"question {next(counter)} about the report", "pdf_id": str(pdf_id)},
+                             timeout=120)
+        return (time.perf_counter() - start) * 1000, response.status_code
+
+    def login():
+        n = next(counter) % args.users
+        response = http.post(f"{url}/login", json={"email": f"u{n}@example.com", "password": "password-123"}, timeout=120)
+        if response.status_code == 503:
+            time.sleep(args.retry_ms / 1000)
+        return response.status_code
+
+    alone = run_for(args.seconds / 2, args.llm_clients, ask)
+
+    logins = []
+    storm = threading.Thread(target=lambda: logins.extend(run_for(args.seconds, args.logins, login)))
+    storm.start()
+    time.sleep(args.seconds / 4)
+    mixed = run_for(args.seconds / 2, args.llm_clients, ask)
+    storm.join()
+
+    server.should_exit = True
+    http.close()
+    return {
+        "llm_alone": percentiles([ms for ms, _ in alone]),
+        "llm_mixed": percentiles([ms for ms, _ in mixed]),
+        "llm_errors": sum(status != 200 for _, status in alone + mixed),
+        "logins_per_s": round(sum(status == 200 for status in logins) / args.seconds, 1),
+        "logins_refused": sum(status == 503 for status in logins),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64, help="concurrent login clients")
+    parser.add_argument("--llm-clients", type=int, default=8)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=20.0, help="length of the login storm")
+    parser.add_argument("--rounds", type=int, default=12, help="BCRYPT_ROUNDS")
+    parser.add_argument("--workers", type=int, default=2, help="PASSWORD_WORKERS for the pool mode")
+    parser.add_argument("--queue-limit", type=int, default=16)
+    parser.add_argument("--retry-ms", type=float, default=100.0)
+    parser.add_argument("--llm-ms", type=float, default=50.0, help="fake LLM latency per call")
+    parser.add_argument("--mongo-url")
+    parser.add_argument("--mode", choices=["inline", "pool"], help=argparse.SUPPRESS)
+    parser.add_argument("--ollama-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+
+    ollama, ollama_url = spawn_fake_ollama(latency_ms=5.0, per_input_ms=0.5)
+    try:
+        print(f"{'mode':<7} {'logins/s':>8} {'refused':>7}  {'/llm p50/p95/p99 alone (ms)':>28}  {'with logins (ms)':>22}")
+        for mode in ("inline", "pool"):
+            env = {**os.environ, "BCRYPT_ROUNDS": str(args.rounds), "PASSWORD_QUEUE_LIMIT": str(args.queue_limit),
+                   "PASSWORD_WORKERS": "0" if mode == "inline" else str(args.workers)}
+            output = subprocess.run([sys.executable, "-m", "bench.password_load", *sys.argv[1:], "--mode", mode,
+                                     "--ollama-url", ollama_url], env=env, capture_output=True, text=True, check=True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            alone, mixed = result["llm_alone"], result["llm_mixed"]
+            print(f"{mode:<7} {result['logins_per_s']:>8.1f} {result['logins_refused']:>7}  "
+                  f"{alone['p50_ms']:>8.0f} {alone['p95_ms']:>8.0f} {alone['p99_ms']:>8.0f}    "
+                  f"{mixed['p50_ms']:>6.0f} {mixed['p95_ms']:>6.0f} {mixed['p99_ms']:>6.0f}")
+    finally:
+        ollama.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Cold-start cost of the API: import time of route.py (python -X importtime),
+summed by top-level package, and the time from starting a server process
+until /healthz (live) and /readyz (ready) first answer 200, with and without
+WARMUP. The server runs against the stand-ins of bench.suite (mongomock
+unless --mongo-url, fake Ollama, LLM_PROVIDER=fake).
+
+    python -m bench.startup --runs 5 --out startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+from bench.fake_ollama import spawn_fake_ollama
+from bench.suite import free_port
+
+
+def import_times(runs: int, top: int) -> dict:
+    """Median total import time of route.py and the packages that cost the most"""
+    totals, packages = [], {}
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import route"],
+                                capture_output=True, text=True, check=True).stderr
+        run_packages = {}
+        for line in output.splitlines():
+            if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+                continue
+            own, cumulative, name = line[len("import time:"):].split("|")
+            package = name.strip().split(".")[0]
+            run_packages[package] = run_packages.get(package, 0) + int(own)
+            if name.strip() == "route":
+                totals.append(int(cumulative) / 1000)
+        for package, us in run_packages.items():
+            packages.setdefault(package, []).append(us / 1000)
+
+    ranked = sorted(((statistics.median(ms), package) for package, ms in packages.items()), reverse=True)
+    return {
+        "route_ms": round(statistics.median(totals), 1),
+        "packages_ms": {package: round(ms, 1) for ms, package in ranked[:top]},
+    }
+
+
+def time_to_ready(args, warmup: bool) -> dict:
+    """Seconds from spawning the server until /healthz and /readyz answer 200"""
+    port = free_port()
+    env = {**os.environ, "WARMUP": "1" if warmup else "0"}
+    command = [sys.executable, "-m", "bench.startup", "--serve", str(port), "--ollama-url", args.ollama_url]
+    if args.mongo_url:
+        command += ["--mongo-url", args.mongo_url]
+
+    started = time.perf_counter()
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {}
+    try:
+        while "ready_s" not in result and time.perf_counter() - started < args.timeout:
+            for name, path in (("live_s", "/healthz"), ("ready_s", "/readyz")):
+                if name in result:
+                    continue
+                try:
+                    if requests.get(f"http://127.0.0.1:{port}{path}", timeout=1).status_code == 200:
+                        result[name] = round(time.perf_counter() - started, 3)
+                except requests.ConnectionError:
+                    break
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+def serve(args):
+    import tempfile
+    import uvicorn
+    from bench.suite import configure
+
+    configure(args, tempfile.mkdtemp(prefix="chatpdf-bench-"))
+    from route import app
+    uvicorn.run(app, host="127.0.0.1", port=args.serve, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="packages to list by import time")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--mongo-url")
+    parser.add_argument("--out")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ollama-url", help=argparse.SUPPRESS)
+    parser.add_argument("--llm-ms", type=float, default=0.0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    imports = import_times(args.runs, args.top)
+    print(f"import route: {imports['route_ms']:.0f} ms (median of {args.runs})")
+    for package, ms in imports["packages_ms"].items():
+        print(f"  {package:<24} {ms:>7.1f} ms")
+
+    ollama, args.ollama_url = spawn_fake_ollama(latency_ms=5.0)
+    results = {"imports": imports}
+    try:
+        for warmup in (False, True):
+            runs = [time_to_ready(args, warmup) for _ in range(args.runs)]
+            key = "warmup" if warmup else "no_warmup"
+            results[key] = {name: round(statistics.median(run[name] for run in runs), 3)
+                            for name in ("live_s", "ready_s") if all(name in run for run in runs)}
+            print(f"{key:<10} live {results[key].get('live_s', float('nan')):.2f} s  "
+                  f"ready {results[key].get('ready_s', float('nan')):.2f} s")
+    finally:
+        ollama.terminate()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
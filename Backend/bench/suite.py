@@ -0,0 +1,392 @@
+"""
+Offline end-to-end benchmark suite. Everything runs locally: synthetic
+PDFs (bench.synthetic_pdf), an in-memory Mongo stand-in (mongomock, unless
+--mongo-url points at a real server), the fake Ollama server in a child
+process, and LLM_PROVIDER=fake in place of Gemini. It measures:
+
+- ingest: injestPdf throughput (pages/s, chunks/s) per PDF size, plus the
+  time until the chunks were queryable
+- retrieval: retrieve_relevant_content latency against chunk count, with a
+  precomputed question embedding, plus the cold index load
+- llm: POST /llm p50/p95/p99 and requests/s at each concurrency, through
+  the app served by uvicorn
+- history: GET /sessions/{pdf_id}/messages (the chat history) latency
+  against the number of stored messages
+
+Results are written as JSON; --compare prints the change against an
+earlier results file, with the metrics where lower is better
+(latencies) and higher is better (throughput) marked accordingly.
+
+    pip install mongomock uvicorn
+    python -m bench.suite --pages 10 100 500 2000 --out bench-results.json
+    python -m bench.suite --out new.json --compare bench-results.json
+
+Settings are read from the environment when the app's modules are first
+imported, so they are set here before importing anything from the app.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from bench.fake_ollama import spawn_fake_ollama
+from bench.synthetic_pdf import page_code, write_pdf
+
+
+def percentiles(times_ms) -> dict:
+    times = np.asarray(times_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2)}
+
+
+def configure(args, workdir: str):
+    """Environment for the app, before its config module is imported"""
+    os.environ.update({
+        "OLLAMA_URL": args.ollama_url,
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY_MS": str(args.llm_ms),
+        "EMBED_CACHE_STORE": "memory",
+        "ANN_INDEX_PATH": os.path.join(workdir, "ann"),
+        "ASYNC_MODE": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    if args.mongo_url:
+        os.environ["Mongo_DB"] = args.mongo_url
+        return
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("The in-memory Mongo stand-in needs mongomock (pip install mongomock), or pass --mongo-url")
+    import conf.db
+    conf.db.MongoClient = mongomock.MongoClient
+
+
+def create_user(name: str) -> tuple[str, str]:
+    """A user id and a bearer token for it"""
+    from conf.db import user_collection
+    from jwt_Str.access import create_access_token
+
+    user_id = str(user_collection.insert_one({"userName": name, "email": f"{name}@example.com"}).inserted_id)
+    return user_id, create_access_token({"user_id": user_id, "email": f"{name}@example.com"}, timedelta(hours=12))
+
+
+def bench_ingest(user_id: str, pages: int, workdir: str) -> tuple[dict, object]:
+    from conf.repository import insert_pdf
+    from services.llm.llm import injestPdf
+
+    path = os.path.join(workdir, f"synthetic-{pages}.pdf")
+    size = write_pdf(path, pages, seed=pages)
+    pdf_id = insert_pdf({
+        "filename": os.path.basename(path),
+        "filePath": path,
+        "size": size,
+        "user_id": user_id,
+        "uploaded_at": datetime.utcnow(),
+    })["_id"]
+
+    queryable = {}
+
+    def progress(state, **fields):
+        if fields.get("queryable") and "seconds" not in queryable:
+            queryable["seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = injestPdf(user_id, progress=progress, pdf_id=pdf_id)
+    seconds = time.perf_counter() - start
+    if result.get("status") != "success":
+        raise RuntimeError(f"Ingesting {pages} pages failed: {result}")
+
+    chunks = result["chunks_created"]
+    return {
+        "pages": pages,
+        "chunks": chunks,
+        "qa_pairs": result["qa_pairs_created"],
+        "seconds": round(seconds, 3),
+        "queryable_seconds": round(queryable.get("seconds", seconds), 3),
+        "pages_per_s": round(pages / seconds, 2),
+        "chunks_per_s": round(chunks / seconds, 2),
+    }, pdf_id
+
+
+def bench_retrieval(user_id: str, pdf_id, pages: int, queries: int) -> dict:
+    from conf.repository import find_user_pdf
+    from services.llm.index import invalidate_index
+    from services.llm.llm import embed_question, retrieve_relevant_content
+
+    pdf = find_user_pdf(user_id, pdf_id)
+    questions = [f"What does section {p + 1} say about item {page_code(pages, p)}?"
+                 for p in np.random.default_rng(pages).integers(0, pages, queries)]
+    vectors = [embed_question(question) for question in questions]
+
+    invalidate_index(pdf_id)
+    start = time.perf_counter()
+    retrieve_relevant_content(user_id, questions[0], query=vectors[0], pdf=pdf)
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    times, hits = [], 0
+    for question, vector in zip(questions, vectors):
+        start = time.perf_counter()
+        retrieved = retrieve_relevant_content(user_id, question, query=vector, pdf=pdf)
+        times.append((time.perf_counter() - start) * 1000)
+        code = question.split("item ")[1].rstrip("?")
+        hits += any(code in match["chunk"] for match in retrieved["chunk_matches"])
+
+    return {
+        "chunks": pdf_chunks(pdf),
+        "pages": pages,
+        "queries": queries,
+        "cold_ms": round(cold_ms, 2),
+        **percentiles(times),
+        "hit_rate": round(hits / queries, 3),
+    }
+
+
+def pdf_chunks(pdf: dict) -> int:
+    from services.llm.index import get_index
+    return len(get_index(pdf).chunk_ids)
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def serve_app():
+    """The FastAPI app on uvicorn in a background thread; returns (server, base url)"""
+    import uvicorn
+    from route import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def bench_llm(url: str, token: str, pdf_id, pages: int, concurrency: int, requests_count: int) -> dict:
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    http = requests.Session()
+    http.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+    headers = {"Authorization": f"Bearer {token}"}
+    rng = np.random.default_rng(concurrency)
+    # Distinct questions, so the answer cache doesn't serve them
+    questions = [f"Question {concurrency}-{n}: what covers item {page_code(pages, p)}?"
+                 for n, p in enumerate(rng.integers(0, pages, requests_count))]
+
+    def ask(question):
+        start = time.perf_counter()
+        response = http.post(f"{url}/llm", json={"user_question": question, "pdf_id": str(pdf_id)},
+                             headers=headers, timeout=120)
+        elapsed = (time.perf_counter() - start) * 1000
+        return elapsed, response.status_code == 200 and "error" not in response.json()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(ask, questions))
+    elapsed = time.perf_counter() - start
+    http.close()
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests_count,
+        "rps": round(requests_count / elapsed, 2),
+        **percentiles([ms for ms, _ in results]),
+        "errors": sum(not ok for _, ok in results),
+    }
+
+
+def seed_history(user_id: str, messages: int):
+    """`messages` stored messages for one new PDF id, written as insert_message would"""
+    from bson import ObjectId
+    from conf.db import message_collection, session_collection
+
+    pdf_id = ObjectId()
+    first = datetime.utcnow() - timedelta(seconds=messages)
+    docs = [{
+        "user_id": user_id,
+        "pdf_id": pdf_id,
+        "question": f"Question {n} about the document?",
+        "answer": f"Answer {n}: " + "details " * 40,
+        "context_used": "context " * 120,
+        "created_at": first + timedelta(seconds=n),
+    } for n in range(messages)]
+    for start in range(0, messages, 10000):
+        message_collection.insert_many(docs[start:start + 10000])
+    session_collection.update_one(
+        {"user_id": user_id, "pdf_id": pdf_id},
+        {"$set": {"message_count": messages, "first_message": first, "last_message": docs[-1]["created_at"]}},
+        upsert=True,
+    )
+    return pdf_id
+
+
+def bench_history(url: str, token: str, user_id: str, messages: int, requests_count: int) -> dict:
+    import requests
+
+    pdf_id = seed_history(user_id, messages)
+    headers = {"Authorization": f"Bearer {token}"}
+    with requests.Session() as http:
+        first_page, next_page = [], []
+        for _ in range(requests_count):
+            start = time.perf_counter()
+            page = http.get(f"{url}/sessions/{pdf_id}/messages", headers=headers, timeout=60)
+            first_page.append((time.perf_counter() - start) * 1000)
+            page.raise_for_status()
+            cursor = page.json().get("next_cursor")
+            if cursor:
+                start = time.perf_counter()
+                http.get(f"{url}/sessions/{pdf_id}/messages", params={"cursor": cursor},
+                         headers=headers, timeout=60).raise_for_status()
+                next_page.append((time.perf_counter() - start) * 1000)
+
+    result = {"messages": messages, "requests": requests_count, **percentiles(first_page)}
+    if next_page:
+        result["next_page_p50_ms"] = percentiles(next_page)["p50_ms"]
+    return result
+
+
+def lower_is_better(name: str) -> bool | None:
+    """Whether a metric improves by going down, None for counts that aren't measurements"""
+    if name.endswith("_ms") or name.endswith("seconds") or name == "errors":
+        return True
+    if name.endswith("_per_s") or name in ("rps", "hit_rate"):
+        return False
+    return None
+
+
+def flatten(results: dict) -> dict:
+    """`section.key=value.metric` -> number for each measurement, for comparing runs"""
+    keys = {"ingest": "pages", "retrieval": "chunks", "llm": "concurrency", "history": "messages"}
+    metrics = {}
+    for section, key in keys.items():
+        for row in results.get(section, []):
+            for name, value in row.items():
+                if lower_is_better(name) is not None:
+                    metrics[f"{section}.{key}={row[key]}.{name}"] = value
+    return metrics
+
+
+def compare(old: dict, new: dict):
+    old_metrics, new_metrics = flatten(old), flatten(new)
+    print(f"\n{'metric':<48} {'old':>10} {'new':>10} {'change':>8}")
+    for metric, value in new_metrics.items():
+        if metric not in old_metrics:
+            continue
+        before = old_metrics[metric]
+        change = (value - before) / before * 100 if before else 0.0
+        verdict = ""
+        if abs(change) >= 5:
+            verdict = "better" if (change < 0) == lower_is_better(metric.rsplit(".", 1)[-1]) else "worse"
+        print(f"{metric:<48} {before:>10g} {value:>10g} {change:>+7.1f}% {verdict}")
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500],
+                        help="synthetic PDF sizes, 10 to 2000 pages")
+    parser.add_argument("--queries", type=int, default=200, help="retrieval queries per PDF")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--llm-requests", type=int, default=200, help="/llm requests per concurrency level")
+    parser.add_argument("--messages", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--history-requests", type=int, default=50)
+    parser.add_argument("--embed-ms", type=float, default=5.0, help="fake Ollama latency per call")
+    parser.add_argument("--embed-per-input-ms", type=float, default=0.5)
+    parser.add_argument("--llm-ms", type=float, default=200.0, help="fake LLM latency per call")
+    parser.add_argument("--mongo-url", help="a real MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["ingest", "retrieval", "llm", "history"])
+    parser.add_argument("--out", default="bench-results.json")
+    parser.add_argument("--compare", help="an earlier results file to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="chatpdf-bench-")
+    ollama, args.ollama_url = spawn_fake_ollama(latency_ms=args.embed_ms, per_input_ms=args.embed_per_input_ms)
+    configure(args, workdir)
+    results = {
+        "meta": {
+            "started": datetime.utcnow().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "mongo": "real" if args.mongo_url else "mongomock",
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "mongo_url", "ollama_url")},
+        },
+        "ingest": [], "retrieval": [], "llm": [], "history": [],
+    }
+
+    try:
+        from conf.repository import ensure_indexes
+        ensure_indexes()
+        user_id, token = create_user("bench")
+
+        pdfs = []
+        if "ingest" not in args.skip or "retrieval" not in args.skip or "llm" not in args.skip:
+            for pages in args.pages:
+                row, pdf_id = bench_ingest(user_id, pages, workdir)
+                pdfs.append((pages, pdf_id))
+                if "ingest" not in args.skip:
+                    results["ingest"].append(row)
+                    print(f"ingest     {pages:>5} pages  {row['chunks']:>6} chunks  "
+                          f"{row['pages_per_s']:>8.1f} pages/s  {row['chunks_per_s']:>8.1f} chunks/s")
+
+        if "retrieval" not in args.skip:
+            for pages, pdf_id in pdfs:
+                row = bench_retrieval(user_id, pdf_id, pages, args.queries)
+                results["retrieval"].append(row)
+                print(f"retrieval  {row['chunks']:>6} chunks  p50 {row['p50_ms']:.2f} ms  "
+                      f"p95 {row['p95_ms']:.2f} ms  p99 {row['p99_ms']:.2f} ms  cold {row['cold_ms']:.0f} ms")
+
+        if "llm" not in args.skip or "history" not in args.skip:
+            server, url = serve_app()
+            try:
+                if "llm" not in args.skip:
+                    pages, pdf_id = pdfs[-1]
+                    for concurrency in args.concurrency:
+                        row = bench_llm(url, token, pdf_id, pages, concurrency, args.llm_requests)
+                        results["llm"].append(row)
+                        print(f"llm        c={concurrency:<4} {row['rps']:>7.1f} req/s  p50 {row['p50_ms']:.0f} ms  "
+                              f"p95 {row['p95_ms']:.0f} ms  p99 {row['p99_ms']:.0f} ms  errors {row['errors']}")
+                if "history" not in args.skip:
+                    for messages in args.messages:
+                        row = bench_history(url, token, user_id, messages, args.history_requests)
+                        results["history"].append(row)
+                        print(f"history    {messages:>6} messages  p50 {row['p50_ms']:.2f} ms  "
+                              f"p95 {row['p95_ms']:.2f} ms  p99 {row['p99_ms']:.2f} ms")
+            finally:
+                server.should_exit = True
+    finally:
+        ollama.terminate()
+
+    results["metrics"] = flatten(results)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
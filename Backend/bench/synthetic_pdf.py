@@ -0,0 +1,96 @@
+"""
+Synthetic text PDFs for the benchmarks, written directly (no PDF library):
+one Helvetica text stream per page, so pypdf extracts them like any
+text-born PDF. Pages mix common words with a seeded pseudo-vocabulary, and
+line 0 of every page names a unique identifier, `page_code(seed, page)`,
+that retrieval questions can target.
+
+    python -m bench.synthetic_pdf out.pdf --pages 500
+"""
+import argparse
+import random
+
+COMMON = (
+    "the of and to in is for that with on as by this are be from at or an it which "
+    "these each when all data system report section value terms policy period "
+    "customer service process result model table figure rate cost level"
+).split()
+
+LINES_PER_PAGE = 40
+WORDS_PER_LINE = 12
+
+
+def page_code(seed: int, page: int) -> str:
+    return f"ref-{seed}-{page:05d}"
+
+
+def _vocabulary(rng: random.Random, size: int) -> list[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(size)]
+
+
+def page_lines(rng: random.Random, vocabulary: list[str], seed: int, page: int) -> list[str]:
+    lines = [f"Section {page + 1} covers item {page_code(seed, page)} and its {rng.choice(vocabulary)} terms."]
+    for _ in range(LINES_PER_PAGE - 1):
+        words = [rng.choice(COMMON) if rng.random() < 0.4 else rng.choice(vocabulary) for _ in range(WORDS_PER_LINE)]
+        lines.append(" ".join(words).capitalize() + ".")
+    return lines
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _content(lines: list[str]) -> bytes:
+    ops = ["BT", "/F1 10 Tf", "14 TL", "40 800 Td"]
+    ops += [f"({_escape(line)}) Tj T*" for line in lines]
+    ops.append("ET")
+    return "\n".join(ops).encode("latin-1")
+
+
+def write_pdf(path: str, pages: int, seed: int = 0, vocabulary_size: int = 5000) -> int:
+    """Write a `pages`-page PDF to `path`; returns its size in bytes"""
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng, vocabulary_size)
+
+    # 1 catalog, 2 page tree, 3 font, then a page and a content stream per page
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for page in range(pages):
+        page_number, content_number = len(objects) + 1, len(objects) + 2
+        stream = _content(page_lines(rng, vocabulary, seed, page))
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_number} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        kids.append(f"{page_number} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+    return len(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic text PDF")
+    parser.add_argument("path")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    size = write_pdf(args.path, args.pages, args.seed)
+    print(f"Wrote {args.pages} pages ({size / 1024:.0f} KiB) to {args.path}")
@@ -0,0 +1,85 @@
+"""
+Memory, storage and recall of the float32 / float16 / int8 vector formats,
+offline, on synthetic clustered 768-dimension vectors. Recall@k is measured
+against exact float32 search, for the compact scores alone and after
+re-ranking the top RERANK_FACTOR x k rows with the float32 originals.
+
+    python -m bench.vector_formats --rows 50000 --queries 200 --k 10
+"""
+import argparse
+import time
+
+import bson
+import numpy as np
+from bson import ObjectId
+
+from bench.ann_recall import recall, synthetic_vectors
+import services.llm.index as index
+from services.llm.index import search_rows, top_k_scores
+from services.store.chunk_store import decode_matrix, vector_fields
+from services.store.vectors import VECTOR_DTYPES, VectorMatrix, normalize_rows
+
+
+def stored_bytes(vector, fmt: str, keep_full: bool) -> int:
+    doc = {"pdf_id": ObjectId(), "generation": "g", "kind": "chunk", "index": 0, "text": "",
+           **vector_fields(vector, fmt, keep_full=keep_full)}
+    return len(bson.encode(doc))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--spread", type=float, default=2.0)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    args = parser.parse_args()
+    index.RERANK_FACTOR = args.rerank_factor
+
+    rng = np.random.default_rng(0)
+    raw = synthetic_vectors(args.rows, args.dim, args.clusters, args.spread, rng)
+    full = normalize_rows(raw)
+    noise = rng.normal(scale=0.5 / np.sqrt(args.dim), size=(args.queries, args.dim)).astype(np.float32)
+    queries = normalize_rows(full[rng.integers(0, args.rows, args.queries)] + noise)
+    truth = [top_k_scores(full, q, args.k)[0] for q in queries]
+
+    def originals(rows):
+        return {row: raw[row] for row in rows}
+
+    print(f"{args.rows} rows x {args.dim} dims, recall@{args.k} over {args.queries} queries, "
+          f"re-rank {args.rerank_factor}x")
+    print(f"{'format':8} {'memory/row':>10} {'doc':>8} {'doc+f32':>8} {'load':>8} "
+          f"{'p50':>8} {'recall':>7} {'p50 rr':>8} {'recall rr':>9}")
+    for fmt in VECTOR_DTYPES:
+        docs = [vector_fields(raw[i], fmt, keep_full=fmt == "float32") for i in range(min(args.rows, 2000))]
+        start = time.perf_counter()
+        decode_matrix(docs, fmt)
+        load_ms = (time.perf_counter() - start) * 1000 * args.rows / len(docs)
+
+        matrix = VectorMatrix.from_dense(full, fmt)
+        results, times = [], []
+        for q in queries:
+            start = time.perf_counter()
+            results.append(search_rows(matrix, q, args.k))
+            times.append(time.perf_counter() - start)
+        line = (f"{fmt:8} {matrix.nbytes / args.rows:8.0f} B {stored_bytes(raw[0], fmt, False):6d} B "
+                f"{stored_bytes(raw[0], fmt, True):6d} B {load_ms:6.0f} ms "
+                f"{np.median(times) * 1000:5.2f} ms {recall(results, truth):7.3f}")
+
+        if fmt != "float32":
+            results, times = [], []
+            for q in queries:
+                start = time.perf_counter()
+                results.append(search_rows(matrix, q, args.k, full_vectors=originals))
+                times.append(time.perf_counter() - start)
+            line += f" {np.median(times) * 1000:5.2f} ms {recall(results, truth):9.3f}"
+        print(line)
+    print("doc: stored chunk document with the vector only in that format; doc+f32: with the float32 "
+          "vector kept for re-ranking; load: decoding every row from stored documents; "
+          "rr: re-ranked, excluding the query that fetches the float32 rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,3 +6,125 @@ import os
 load_dotenv()
 
 Mongo_DB = os.getenv("Mongo_DB")
+
+# Ollama embedding service
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_RETRIES = int(os.getenv("EMBED_RETRIES", "3"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "60"))
+
+# Retrieval
+INDEX_CACHE_SIZE = int(os.getenv("INDEX_CACHE_SIZE", "64"))
+# Cross-document indexes, one per user
+LIBRARY_CACHE_SIZE = int(os.getenv("LIBRARY_CACHE_SIZE", "16"))
+# exact scores every row; ivf searches chunk matrices of ANN_MIN_ROWS or more
+# rows through an inverted-file index, probing ANN_PROBES lists per query
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "exact")  # exact | ivf
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "20000"))
+ANN_PROBES = int(os.getenv("ANN_PROBES", "16"))
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", "cache/ann")
+# Vector format per kind: float32 | float16 | int8. Compact formats are
+# stored and searched as such; the best RERANK_FACTOR x top_k rows are then
+# re-scored with the float32 originals, kept unless VECTOR_KEEP_FULL=0
+CHUNK_VECTOR_FORMAT = os.getenv("CHUNK_VECTOR_FORMAT", "float32")
+QA_VECTOR_FORMAT = os.getenv("QA_VECTOR_FORMAT", "float32")
+VECTOR_KEEP_FULL = os.getenv("VECTOR_KEEP_FULL", "1") == "1"
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))
+# Hybrid retrieval: cosine + LEXICAL_WEIGHT x BM25 query-term coverage. On
+# matrices of LEXICAL_PREFILTER_ROWS rows or more only the best
+# LEXICAL_PREFILTER_CANDIDATES lexical matches are vector-scored. A question
+# whose embedding takes longer than QUERY_EMBED_TIMEOUT seconds is answered
+# from lexical matches alone
+LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "0.3"))
+LEXICAL_PREFILTER_ROWS = int(os.getenv("LEXICAL_PREFILTER_ROWS", "50000"))
+LEXICAL_PREFILTER_CANDIDATES = int(os.getenv("LEXICAL_PREFILTER_CANDIDATES", "5000"))
+QUERY_EMBED_TIMEOUT = float(os.getenv("QUERY_EMBED_TIMEOUT", "2.0"))
+
+# Background ingestion
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_JOB_STORE = os.getenv("INGEST_JOB_STORE", "mongo")  # mongo | memory
+INGEST_STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", "1800"))
+
+# QA-pair generation. The document is split into runs of pages of about
+# QA_SECTION_CHARS characters (at most QA_MAX_SECTIONS, spread over the
+# document) and each is sent to the LLM for QA_PAIRS_PER_SECTION pairs, up
+# to QA_CONCURRENCY calls at a time. Questions with a token overlap of
+# QA_DEDUP_SIMILARITY or more with an earlier one are dropped.
+# QA_STAGE=deferred makes the chunks queryable before QA generation
+# finishes: the ingest job is then in the qa_pending state, answering from
+# chunks alone, until it is done. inline publishes both together; off skips
+# QA generation
+QA_STAGE = os.getenv("QA_STAGE", "deferred")  # deferred | inline | off
+QA_SECTION_CHARS = int(os.getenv("QA_SECTION_CHARS", "12000"))
+QA_MAX_SECTIONS = int(os.getenv("QA_MAX_SECTIONS", "32"))
+QA_PAIRS_PER_SECTION = int(os.getenv("QA_PAIRS_PER_SECTION", "5"))
+QA_CONCURRENCY = int(os.getenv("QA_CONCURRENCY", "4"))
+QA_DEDUP_SIMILARITY = float(os.getenv("QA_DEDUP_SIMILARITY", "0.8"))
+
+# Embedding cache
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "20000"))
+EMBED_CACHE_STORE = os.getenv("EMBED_CACHE_STORE", "mongo")  # mongo | disk | memory | none
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "cache/embeddings")
+
+# Answer cache for /llm
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))  # entries per PDF
+ANSWER_CACHE_PDFS = int(os.getenv("ANSWER_CACHE_PDFS", "1024"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# Prompt context for /llm: the CONTEXT_CANDIDATES best QA pairs and chunks
+# are retrieved, overlapping neighbour chunks merged, passages sharing
+# CONTEXT_DEDUP_SIMILARITY of their terms with a more relevant one dropped,
+# and the rest packed by relevance into CONTEXT_TOKEN_BUDGET estimated tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "5"))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.8"))
+
+# Serve /llm, /upload, /inset and /sessions with async handlers
+ASYNC_MODE = os.getenv("ASYNC_MODE", "0") == "1"
+
+# LLM gateway
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")  # gemini | fake
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash-exp")
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3"))
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+
+# Password hashing: bcrypt at cost BCRYPT_ROUNDS, in PASSWORD_WORKERS
+# processes (0 hashes in the calling thread) niced by PASSWORD_WORKER_NICE.
+# Stored hashes of another cost are rehashed at login. With
+# PASSWORD_QUEUE_LIMIT hashes running or waiting, /signup and /login answer
+# 503 instead of queueing more
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "16"))
+PASSWORD_WORKER_NICE = int(os.getenv("PASSWORD_WORKER_NICE", "10"))
+
+# Startup. With WARMUP=1 the embedding model is loaded into Ollama and the
+# indexes of the WARMUP_PDFS most recently chatted-about PDFs are built in
+# the background once the app has started; /readyz answers 503 until then.
+# /readyz also pings Mongo, for at most READY_TIMEOUT seconds
+WARMUP = os.getenv("WARMUP", "0") == "1"
+WARMUP_PDFS = int(os.getenv("WARMUP_PDFS", "20"))
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
+
+# Uploads
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024
+
+# Logging: records written on every request keep LOG_SAMPLE_RATE of those
+# below WARNING
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+# Profiling: requests carrying an X-Profile-Token header equal to
+# PROFILE_ADMIN_TOKEN are profiled, and 1 in PROFILE_SAMPLE_EVERY others
+# (0 = none). Stacks are sampled every PROFILE_INTERVAL_MS; the last
+# PROFILE_KEEP profiles are kept, saved under PROFILE_PATH. The /profiles
+# endpoints need the same token and are off without one
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_PATH = os.getenv("PROFILE_PATH", "cache/profiles")
@@ -1,10 +1,120 @@
-from pymongo import MongoClient
+from contextvars import ContextVar
+
+from pymongo import MongoClient, monitoring
 from conf.confilg import Mongo_DB
+from services.monitoring.metrics import MONGO_ERRORS, MONGO_SECONDS, record_stage
+
+DB_NAME = 'chat_pdf'
+
+
+class QueryCounter:
+    """Number of database commands issued while it is the current counter"""
+
+    def __init__(self):
+        self.count = 0
+        self.commands = []
+
+
+_query_counter: ContextVar[QueryCounter | None] = ContextVar("query_counter", default=None)
+
+
+def start_query_count() -> QueryCounter:
+    """
+    Start counting commands for the current request. The counter object is
+    shared with threadpool workers that copy the context, so sync endpoints
+    and the code they call are all counted.
+    """
+    counter = QueryCounter()
+    _query_counter.set(counter)
+    return counter
+
+
+class _QueryListener(monitoring.CommandListener):
+    def started(self, event):
+        counter = _query_counter.get()
+        if counter is not None:
+            counter.count += 1
+            counter.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        record_stage("db", event.duration_micros / 1e6, MONGO_SECONDS, command=event.command_name)
+
+    def failed(self, event):
+        record_stage("db", event.duration_micros / 1e6, MONGO_SECONDS, command=event.command_name)
+        MONGO_ERRORS.inc(command=event.command_name)
+
+
+_query_listener = _QueryListener()
+
+# Clients are opened by the FastAPI lifespan handler (open_clients) and
+# closed on shutdown. Scripts that run outside the app get the sync client
+# lazily on first use.
+_client = None
+_async_client = None
+
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        _client = MongoClient(Mongo_DB, event_listeners=[_query_listener])
+    return _client
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        # motor runs commands on its own executor threads, which don't carry
+        # the request context, so async-mode queries are not counted
+        _async_client = AsyncIOMotorClient(Mongo_DB)
+    return _async_client
+
+
+def get_db():
+    return get_client()[DB_NAME]
+
+
+def get_async_db():
+    return get_async_client()[DB_NAME]
+
+
+def open_clients(use_async: bool = False):
+    get_client()
+    if use_async:
+        get_async_client()
+
+
+def close_clients():
+    global _client, _async_client
+    if _async_client is not None:
+        _async_client.close()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+class _LazyCollection:
+    """Collection handle that resolves against the current client on use"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+    def __repr__(self):
+        return f"<collection {DB_NAME}.{self.name}>"
+
 
-client = MongoClient(Mongo_DB)
-db= client['chat_pdf']
+def async_collection(name):
+    return get_async_db()[name]
 
 
-user_collection = db['users']
-pdf_collection = db ['pdfs']
-message_collection = db['messages']
+user_collection = _LazyCollection('users')
+pdf_collection = _LazyCollection('pdfs')
+message_collection = _LazyCollection('messages')
+chunk_collection = _LazyCollection('chunks')
+job_collection = _LazyCollection('jobs')
+embedding_cache_collection = _LazyCollection('embedding_cache')
+session_collection = _LazyCollection('chat_sessions')
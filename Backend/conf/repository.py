@@ -0,0 +1,245 @@
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from conf.db import async_collection, message_collection, pdf_collection, session_collection, user_collection
+
+# Projections. Request handlers read PDF metadata only; vectors and QA pairs
+# live in the chunk store and are loaded by the retrieval index when needed.
+PDF_META_PROJECTION = {"embeddings": 0, "qa_embeddings": 0, "qa_pairs": 0, "page_hashes": 0}
+# Ingestion also needs the page hashes of the previous run
+INGEST_PROJECTION = {"embeddings": 0, "qa_embeddings": 0, "qa_pairs": 0}
+ID_PROJECTION = {"_id": 1}
+USER_LOGIN_PROJECTION = {"email": 1, "password": 1, "userName": 1}
+MESSAGE_PROJECTION = {"question": 1, "answer": 1, "created_at": 1, "cached": 1}
+SESSION_PROJECTION = {"pdf_id": 1, "message_count": 1, "last_message": 1}
+LIBRARY_PROJECTION = {
+    "filename": 1, "processed_at": 1, "chunk_generation": 1, "vector_store": 1, "chunk_count": 1,
+}
+
+# Newest upload first when a request doesn't name a PDF
+LATEST_UPLOAD = [("uploaded_at", DESCENDING), ("_id", DESCENDING)]
+
+_indexes_ready = False
+
+
+def ensure_indexes():
+    """Create the indexes request paths rely on; called once at startup"""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    from services.store.chunk_store import ensure_indexes as ensure_chunk_indexes
+
+    user_collection.create_index([("email", ASCENDING)])
+    pdf_collection.create_index([("user_id", ASCENDING), ("uploaded_at", DESCENDING), ("_id", DESCENDING)])
+    pdf_collection.create_index([("ingested_hash", ASCENDING)])
+    message_collection.create_index(
+        [("user_id", ASCENDING), ("pdf_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]
+    )
+    message_collection.create_index([("pdf_id", ASCENDING)])
+    session_collection.create_index([("user_id", ASCENDING), ("pdf_id", ASCENDING)], unique=True)
+    session_collection.create_index(
+        [("user_id", ASCENDING), ("last_message", DESCENDING), ("_id", DESCENDING)]
+    )
+    # Most recent sessions of all users, for the startup warm-up
+    session_collection.create_index([("last_message", DESCENDING), ("_id", DESCENDING)])
+    ensure_chunk_indexes()
+    _indexes_ready = True
+
+
+def _with_str_id(doc: dict, inserted_id) -> dict:
+    # insert_one adds the ObjectId to the dict it was given; return a copy
+    # with a JSON-friendly id instead of reading the document back
+    return {**doc, "_id": str(inserted_id)}
+
+
+def find_user_by_email(email: str, projection=USER_LOGIN_PROJECTION) -> dict | None:
+    user = user_collection.find_one({"email": email}, projection)
+    if user is not None:
+        user["_id"] = str(user["_id"])
+    return user
+
+
+def email_exists(email: str) -> bool:
+    return user_collection.find_one({"email": email}, ID_PROJECTION) is not None
+
+
+def insert_user(user: dict) -> dict:
+    result = user_collection.insert_one(user)
+    return _with_str_id(user, result.inserted_id)
+
+
+def replace_password_hash(user_id, old_hash: str, new_hash: str):
+    """Store a rehashed password, unless the password changed meanwhile"""
+    user_collection.update_one({"_id": as_object_id(user_id), "password": old_hash}, {"$set": {"password": new_hash}})
+
+
+def insert_pdf(pdf: dict) -> dict:
+    result = pdf_collection.insert_one(pdf)
+    return _with_str_id(pdf, result.inserted_id)
+
+
+def as_object_id(value):
+    """ObjectId for an id from a URL or token, None if it can't be one"""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+
+def _user_pdf_query(user_id, pdf_id):
+    if pdf_id is None:
+        return {"user_id": user_id}
+    return {"_id": as_object_id(pdf_id), "user_id": user_id}
+
+
+def update_user_pdf(user_id, pdf_id, fields: dict) -> bool:
+    result = pdf_collection.update_one(_user_pdf_query(user_id, pdf_id), {"$set": fields})
+    return result.matched_count > 0
+
+
+async def aupdate_user_pdf(user_id, pdf_id, fields: dict) -> bool:
+    result = await async_collection("pdfs").update_one(_user_pdf_query(user_id, pdf_id), {"$set": fields})
+    return result.matched_count > 0
+
+
+def find_user_pdf(user_id, pdf_id=None, projection=PDF_META_PROJECTION) -> dict | None:
+    """
+    One of the user's PDFs, by id, or the most recent upload when pdf_id is
+    None. Read once per request and passed to whatever needs it.
+    """
+    if pdf_id is not None and as_object_id(pdf_id) is None:
+        return None
+    return pdf_collection.find_one(_user_pdf_query(user_id, pdf_id), projection, sort=LATEST_UPLOAD)
+
+
+async def afind_user_pdf(user_id, pdf_id=None, projection=PDF_META_PROJECTION) -> dict | None:
+    if pdf_id is not None and as_object_id(pdf_id) is None:
+        return None
+    return await async_collection("pdfs").find_one(_user_pdf_query(user_id, pdf_id), projection, sort=LATEST_UPLOAD)
+
+
+def find_ingested_blob(content_hash: str) -> dict | None:
+    """The most recent PDF record whose current chunks were built from this file content"""
+    return pdf_collection.find_one(
+        {"ingested_hash": content_hash, "vector_store": "chunks", "chunk_count": {"$gt": 0}},
+        INGEST_PROJECTION,
+        sort=[("processed_at", DESCENDING)],
+    )
+
+
+def find_library_pdfs(user_id) -> list[dict]:
+    """Metadata of every processed PDF of a user, for the cross-document index"""
+    return list(pdf_collection.find({"user_id": user_id, "chunk_count": {"$gt": 0}}, LIBRARY_PROJECTION))
+
+
+def _user_query(user_id):
+    return {"_id": as_object_id(user_id) or user_id}
+
+
+def bump_library_version(user_id, version):
+    """Record that one of the user's PDFs was (re-)ingested at `version`"""
+    user_collection.update_one(_user_query(user_id), {"$max": {"library_version": version}})
+
+
+def find_library_version(user_id):
+    """Version of the user's processed PDFs as a whole; None if nothing was ingested"""
+    user = user_collection.find_one(_user_query(user_id), {"library_version": 1}) or {}
+    return user.get("library_version")
+
+
+async def afind_library_version(user_id):
+    user = await async_collection("users").find_one(_user_query(user_id), {"library_version": 1}) or {}
+    return user.get("library_version")
+
+
+def _session_update(message: dict):
+    """Keep the per-PDF chat summary current as each message is written"""
+    return (
+        {"user_id": message["user_id"], "pdf_id": message["pdf_id"]},
+        {
+            "$inc": {"message_count": 1},
+            "$max": {"last_message": message["created_at"]},
+            "$setOnInsert": {"first_message": message["created_at"]},
+        },
+    )
+
+
+def insert_message(message: dict):
+    result = message_collection.insert_one(message)
+    try:
+        session_collection.update_one(*_session_update(message), upsert=True)
+    except DuplicateKeyError:
+        # A concurrent first message of the session inserted it first
+        session_collection.update_one(*_session_update(message))
+    return result
+
+
+async def ainsert_message(message: dict):
+    result = await async_collection("messages").insert_one(message)
+    sessions = async_collection("chat_sessions")
+    try:
+        await sessions.update_one(*_session_update(message), upsert=True)
+    except DuplicateKeyError:
+        await sessions.update_one(*_session_update(message))
+    return result
+
+
+def _before(field: str, after) -> dict:
+    """Keyset filter for (field, _id) descending pages, after = last item seen"""
+    if after is None:
+        return {}
+    value, last_id = after
+    return {"$or": [{field: {"$lt": value}}, {field: value, "_id": {"$lt": last_id}}]}
+
+
+def _sessions_query(user_id, after):
+    return {"user_id": user_id, **_before("last_message", after)}
+
+
+def _messages_query(user_id, pdf_id, after):
+    return {"user_id": user_id, "pdf_id": pdf_id, **_before("created_at", after)}
+
+
+SESSION_SORT = [("last_message", DESCENDING), ("_id", DESCENDING)]
+MESSAGE_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+
+def find_sessions(user_id, limit: int, after=None) -> list[dict]:
+    cursor = session_collection.find(_sessions_query(user_id, after), SESSION_PROJECTION)
+    return list(cursor.sort(SESSION_SORT).limit(limit))
+
+
+async def afind_sessions(user_id, limit: int, after=None) -> list[dict]:
+    cursor = async_collection("chat_sessions").find(_sessions_query(user_id, after), SESSION_PROJECTION)
+    return await cursor.sort(SESSION_SORT).limit(limit).to_list(length=limit)
+
+
+def find_messages(user_id, pdf_id, limit: int, after=None) -> list[dict]:
+    cursor = message_collection.find(_messages_query(user_id, pdf_id, after), MESSAGE_PROJECTION)
+    return list(cursor.sort(MESSAGE_SORT).limit(limit))
+
+
+async def afind_messages(user_id, pdf_id, limit: int, after=None) -> list[dict]:
+    cursor = async_collection("messages").find(_messages_query(user_id, pdf_id, after), MESSAGE_PROJECTION)
+    return await cursor.sort(MESSAGE_SORT).limit(limit).to_list(length=limit)
+
+
+def find_pdf_names(pdf_ids: list) -> dict:
+    """Filenames for one page of sessions"""
+    docs = pdf_collection.find({"_id": {"$in": pdf_ids}}, {"filename": 1})
+    return {doc["_id"]: doc.get("filename") for doc in docs}
+
+
+async def afind_pdf_names(pdf_ids: list) -> dict:
+    docs = await async_collection("pdfs").find({"_id": {"$in": pdf_ids}}, {"filename": 1}).to_list(length=None)
+    return {doc["_id"]: doc.get("filename") for doc in docs}
+
+
+def find_recent_pdfs(limit: int) -> list[dict]:
+    """Metadata of the PDFs with the most recent chat messages, most recent first"""
+    sessions = session_collection.find({}, {"pdf_id": 1}).sort(SESSION_SORT).limit(limit)
+    pdf_ids = list(dict.fromkeys(session["pdf_id"] for session in sessions))
+    pdfs = {pdf["_id"]: pdf for pdf in pdf_collection.find({"_id": {"$in": pdf_ids}, "chunk_count": {"$gt": 0}}, PDF_META_PROJECTION)}
+    return [pdfs[pdf_id] for pdf_id in pdf_ids if pdf_id in pdfs]
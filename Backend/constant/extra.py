@@ -1,17 +1,33 @@
-from models.model import User
-from pypdf import PdfReader 
 from passlib.context import CryptContext
-from conf.db import user_collection ,pdf_collection
 
-def extract_text_from_pdf(file_path):
-    reader = PdfReader(file_path)
-    text = ""
+from conf.confilg import BCRYPT_ROUNDS
+
+def open_pdf(file_path):
+    # pypdf is imported on first use: only ingestion needs it, and it is
+    # a tenth of a second of every process's startup otherwise
+    from pypdf import PdfReader
+    return PdfReader(file_path)
+
+
+def iter_pdf_pages(reader):
+    """Yield page texts one at a time; pages are parsed lazily by PdfReader"""
     for page in reader.pages:
-        text += page.extract_text()
-    return text
+        yield page.extract_text() or ""
+
+
+def extract_text_from_pdf(file_path):
+    return "".join(iter_pdf_pages(open_pdf(file_path)))
 
 
-pwd = CryptContext(schemes=['bcrypt'], deprecated='auto')
+# Hashes of any other cost need an update, so changing BCRYPT_ROUNDS moves
+# stored passwords to the new cost as users log in
+pwd = CryptContext(
+    schemes=['bcrypt'],
+    deprecated='auto',
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 def hashPassword(password:str):
     return pwd.hash(password)
@@ -19,28 +35,7 @@ def hashPassword(password:str):
 def verify_password(password:str , has_Password:str):
     return pwd.verify(password ,has_Password)
 
-# def save_user (user:User):
-#     return user_collection.insert_one(user.dict())
-    
-
-def get_user_by_email(email: str) -> User | None:
-    data = user_collection.find_one({"email": email})
-    if data is not None:
-        data["_id"] = str(data['_id'])
-    return data
-
-def save_user(user: dict):
-    result = user_collection.insert_one(user)
-    saved_user = user_collection.find_one({"_id": result.inserted_id})
-    # Convert ObjectId to str for JSON
-    saved_user["_id"] = str(saved_user["_id"])
-    return saved_user
-
-
-def save_pdf(user: dict):
-    result = pdf_collection.insert_one(user)
-    saved_user = pdf_collection.find_one({"_id": result.inserted_id})
-    # Convert ObjectId to str for JSON
-    saved_user["_id"] = str(saved_user["_id"])
-    return saved_user
+def verify_and_update_password(password: str, has_Password: str):
+    """(valid, new hash or None); a new hash when the stored one has another cost"""
+    return pwd.verify_and_update(password, has_Password)
 
@@ -40,7 +40,8 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def verify_token(token: str = Depends(oauth2_scheme)):
+# async so FastAPI runs it on the event loop instead of a threadpool thread
+async def verify_token(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         if payload is None:
@@ -1,22 +1,116 @@
-from fastapi import FastAPI, Depends, File, Form, HTTPException, UploadFile
-from datetime import datetime
-from bson import ObjectId
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, File, Header, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import time
 
+from conf.confilg import ASYNC_MODE, UPLOAD_MAX_BYTES
+from conf.db import close_clients, open_clients, start_query_count
+from conf.repository import ensure_indexes
 from jwt_Str.access import verify_token
-from services.llm.llm import injestPdf, takeLLMresponse
-from services.file.fileService import get_File_histroy, getFileText, upload_file
-from services.user.dto import ChatRequest, LoginResponseDTO, UserSignupDTO, UserLoginDTO, UserResponseDTO
+from services.jobs.ingest import cancel_ingest_job, get_ingest_job, submit_ingest
+from services.jobs.queue import shutdown_ingest_queue
+from services.llm.llm import streamLLMresponse, takeLLMresponse
+from services.llm.llm_async import atakeLLMresponse
+from services.llm.answer_cache import answer_cache
+from services.llm.gateway import get_llm_gateway
+from services.llm.embedding import close_async_embedding_client, get_async_embedding_client, get_embedding_client
+from services.file.blob_store import init_blob_store
+from services.file.fileService import aupload_file, upload_file
+from services.history.sessions import alist_messages, alist_sessions, list_messages, list_sessions
+from services.monitoring.health import mark_started, mark_stopping, readiness
+from services.monitoring.logs import get_logger
+from services.monitoring.metrics import HTTP_SECONDS, render, start_request_timings
+from services.monitoring.profiler import find_profile, finish_profile, is_admin, profile_trigger, recent_profiles, start_profile
+from services.user.passwords import shutdown_password_pool
+from services.user.dto import ChatRequest, LoginResponseDTO, UserSignupDTO, UserLoginDTO
 from services.user.user_service import User_Service
 from fastapi.middleware.cors import CORSMiddleware
-from conf.db import message_collection  # Add this import
 
-app = FastAPI(title="chat_pdf", version ="0.1")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    open_clients(use_async=ASYNC_MODE)
+    ensure_indexes()
+    init_blob_store()
+    if ASYNC_MODE:
+        get_async_embedding_client()
+    mark_started()
+    yield
+    mark_stopping()
+    shutdown_ingest_queue()
+    shutdown_password_pool()
+    if ASYNC_MODE:
+        await close_async_embedding_client()
+    close_clients()
+
+
+app = FastAPI(title="chat_pdf", version ="0.1", lifespan=lifespan)
+
+log = get_logger("http", sampled=True)
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    # Database commands and per-stage time of this request, returned as
+    # headers; the request latency goes to /metrics
+    counter = start_query_count()
+    timings = start_request_timings()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    HTTP_SECONDS.observe(time.perf_counter() - timings.started,
+                         method=request.method, route=path, status=response.status_code)
+    response.headers["X-DB-Queries"] = str(counter.count)
+    response.headers["Server-Timing"] = timings.header()
+    log.info("%s %s %d %s", request.method, path, response.status_code, response.headers["Server-Timing"])
+    return response
+
+async def _profile_body(body, profile):
+    # The profile ends once the body is sent, so streamed answers are covered
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        await asyncio.to_thread(finish_profile, profile)
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # Opt-in: admin-triggered or 1 in PROFILE_SAMPLE_EVERY requests; the
+    # rest only pay for the check
+    path = request.url.path
+    if path.startswith("/profiles") or path in ("/metrics", "/healthz", "/readyz"):
+        return await call_next(request)
+    trigger = profile_trigger(request.headers.get("x-profile-token"))
+    if trigger is None:
+        return await call_next(request)
+
+    profile = start_profile(f"{request.method} {path}", trigger)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        await asyncio.to_thread(finish_profile, profile)
+        raise
+    response.body_iterator = _profile_body(response.body_iterator, profile)
+    response.headers["X-Profile-Id"] = profile.id
+    return response
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Refuse oversized uploads before the body is read; uploads without a
+    # Content-Length are cut off by the blob store while they stream
+    if request.url.path == "/upload":
+        length = request.headers.get("content-length")
+        # Allow for the multipart framing around the file
+        if length and length.isdigit() and int(length) > UPLOAD_MAX_BYTES + 64 * 1024:
+            return JSONResponse(status_code=413, content={"detail": "File is larger than the upload limit"})
+    return await call_next(request)
 
 origins = [
     "http://localhost:5173",  
     "http://127.0.0.1:5173",
 ]
 
+# Added last so it wraps the middlewares above, and their own responses
+# (a 413 from limit_upload_size) carry the CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,      
@@ -43,20 +137,123 @@ def login(login: UserLoginDTO):
 
 @app.get("/me")
 def validToken(current_user:dict= Depends(verify_token)):
-    print("current user",current_user)
+    log.debug("current user %s", current_user.get("user_id"))
+
+if ASYNC_MODE:
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...), pdf_id: str | None = None, current_user:dict= Depends(verify_token)):
+        return await aupload_file(file, current_user["user_id"], pdf_id)
+
+    @app.post("/inset")
+    async def chat(pdf_id: str | None = None, current_user:dict= Depends(verify_token)):
+        # Only queues the job; the Mongo writes for that are short
+        return await asyncio.to_thread(submit_ingest, current_user['user_id'], pdf_id)
+else:
+    @app.post("/upload")
+    def upload(file: UploadFile = File(...), pdf_id: str | None = None, current_user:dict= Depends(verify_token)):
+        return upload_file(file, current_user["user_id"], pdf_id)
+
+    @app.post("/inset")
+    def chat(pdf_id: str | None = None, current_user:dict= Depends(verify_token)):
+        return submit_ingest(current_user['user_id'], pdf_id)
+
+@app.get("/ingest/{job_id}")
+def ingest_status(job_id: str, current_user:dict= Depends(verify_token)):
+    return get_ingest_job(job_id, current_user['user_id'])
+
+@app.delete("/ingest/{job_id}")
+def ingest_cancel(job_id: str, current_user:dict= Depends(verify_token)):
+    return cancel_ingest_job(job_id, current_user['user_id'])
+
+if ASYNC_MODE:
+    @app.post("/llm")
+    async def chat(data:ChatRequest , current_user:dict= Depends(verify_token)):
+        return await atakeLLMresponse(current_user['user_id'],data.user_question, data.pdf_id, data.scope)
+else:
+    @app.post("/llm")
+    def chat(data:ChatRequest , current_user:dict= Depends(verify_token)):
+        return takeLLMresponse(current_user['user_id'],data.user_question, data.pdf_id, data.scope)
+
+@app.post("/llm/stream")
+def chat_stream(data:ChatRequest , current_user:dict= Depends(verify_token)):
+    return StreamingResponse(
+        streamLLMresponse(current_user['user_id'], data.user_question, data.pdf_id, data.scope),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/cache-stats")
+def cache_stats(current_user:dict= Depends(verify_token)):
+    embedding_cache = get_embedding_client().cache
+    return {
+        "answer_cache": answer_cache.stats(),
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+    }
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness: answered on the event loop, so a busy threadpool can't fail it
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    ready, checks = readiness()
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, **checks})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text format, unauthenticated like other scrape targets
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+def profile_admin(x_profile_token: str | None = Header(None)):
+    # Hidden unless PROFILE_ADMIN_TOKEN is set and given
+    if not is_admin(x_profile_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+def _profile_or_404(profile_id: str):
+    profile = find_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@app.get("/profiles", dependencies=[Depends(profile_admin)])
+def list_profiles():
+    return {"profiles": [profile.summary(top=5) for profile in recent_profiles()]}
+
+@app.get("/profiles/{profile_id}", dependencies=[Depends(profile_admin)])
+def get_profile(profile_id: str):
+    return _profile_or_404(profile_id).summary()
+
+@app.get("/profiles/{profile_id}/speedscope", dependencies=[Depends(profile_admin)])
+def get_profile_speedscope(profile_id: str):
+    # Opens in https://www.speedscope.app
+    return JSONResponse(
+        _profile_or_404(profile_id).speedscope(),
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.speedscope.json"'},
+    )
+
+@app.get("/profiles/{profile_id}/folded", response_class=PlainTextResponse, dependencies=[Depends(profile_admin)])
+def get_profile_folded(profile_id: str):
+    # Collapsed stacks for flamegraph.pl
+    return PlainTextResponse(_profile_or_404(profile_id).folded())
 
-@app.post("/upload")
-def upload(file: UploadFile = File(...),current_user:dict= Depends(verify_token)):
-    return upload_file(file, current_user["user_id"])
+@app.get("/llm/stats")
+def llm_stats(current_user:dict= Depends(verify_token)):
+    return get_llm_gateway().stats()
 
-@app.post("/inset")
-def chat(current_user:dict= Depends(verify_token)):
-    return injestPdf(current_user['user_id'])
+if ASYNC_MODE:
+    @app.get("/sessions")
+    async def get_sessions(cursor: str | None = None, limit: int | None = None, current_user: dict = Depends(verify_token)):
+        return await alist_sessions(current_user['user_id'], cursor, limit)
 
-@app.post("/llm")
-def chat(data:ChatRequest , current_user:dict= Depends(verify_token)):
-    return takeLLMresponse(current_user['user_id'],data.user_question)
+    @app.get("/sessions/{pdf_id}/messages")
+    async def get_session_messages(pdf_id: str, cursor: str | None = None, limit: int | None = None, current_user: dict = Depends(verify_token)):
+        return await alist_messages(current_user['user_id'], pdf_id, cursor, limit)
+else:
+    @app.get("/sessions")
+    def get_sessions(cursor: str | None = None, limit: int | None = None, current_user: dict = Depends(verify_token)):
+        return list_sessions(current_user['user_id'], cursor, limit)
 
-@app.get("/chat-history")
-def get_chat_history(current_user: dict = Depends(verify_token)):
-    return get_File_histroy(current_user['user_id'])
\ No newline at end of file
+    @app.get("/sessions/{pdf_id}/messages")
+    def get_session_messages(pdf_id: str, cursor: str | None = None, limit: int | None = None, current_user: dict = Depends(verify_token)):
+        return list_messages(current_user['user_id'], pdf_id, cursor, limit)
@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+
+from fastapi import HTTPException
+
+from conf.confilg import UPLOAD_MAX_BYTES
+
+# Uploads are stored once per distinct content, as blobs/<sha256>.pdf. The
+# hash is computed while the upload streams to a temporary file in fixed-size
+# blocks, and the temporary file is renamed into place when it is complete,
+# so a blob path always holds a whole file.
+UPLOAD_FOLDER = "uploads"
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, "blobs")
+TMP_FOLDER = os.path.join(UPLOAD_FOLDER, "tmp")
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+
+def init_blob_store():
+    """Create the store's folders; called once at startup"""
+    os.makedirs(BLOB_FOLDER, exist_ok=True)
+    os.makedirs(TMP_FOLDER, exist_ok=True)
+
+
+def blob_path(content_hash: str) -> str:
+    return os.path.join(BLOB_FOLDER, f"{content_hash}.pdf")
+
+
+def _too_large(max_bytes: int):
+    return HTTPException(
+        status_code=413,
+        detail=f"File is larger than the {max_bytes / (1024 * 1024):g} MB upload limit",
+    )
+
+
+class _BlobWriter:
+    """Hashes and writes one upload block by block, enforcing the size limit"""
+
+    def __init__(self, max_bytes: int = UPLOAD_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.sha = hashlib.sha256()
+        fd, self.tmp_path = tempfile.mkstemp(dir=TMP_FOLDER, suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, block: bytes):
+        self.size += len(block)
+        if self.size > self.max_bytes:
+            raise _too_large(self.max_bytes)
+        self.sha.update(block)
+        self.file.write(block)
+
+    def commit(self) -> dict:
+        self.file.close()
+        content_hash = self.sha.hexdigest()
+        path = blob_path(content_hash)
+        if os.path.exists(path):
+            # Same content is already stored
+            os.remove(self.tmp_path)
+        else:
+            os.replace(self.tmp_path, path)
+        return {"content_hash": content_hash, "path": path, "size": self.size}
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def store_upload(fileobj, max_bytes: int = UPLOAD_MAX_BYTES) -> dict:
+    """Stream a file object into the blob store; returns {content_hash, path, size}"""
+    writer = _BlobWriter(max_bytes)
+    try:
+        while block := fileobj.read(UPLOAD_BLOCK_SIZE):
+            writer.write(block)
+        return writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+async def astore_upload(upload, max_bytes: int = UPLOAD_MAX_BYTES) -> dict:
+    """store_upload for an UploadFile on the event loop; disk writes go to a thread"""
+    writer = _BlobWriter(max_bytes)
+    try:
+        while block := await upload.read(UPLOAD_BLOCK_SIZE):
+            await asyncio.to_thread(writer.write, block)
+        return await asyncio.to_thread(writer.commit)
+    except BaseException:
+        writer.abort()
+        raise
@@ -1,46 +1,60 @@
 from datetime import datetime
-import os
-import shutil
 from fastapi import HTTPException, UploadFile
 # from conf.db import pdf_collection
-from constant.extra import extract_text_from_pdf, save_pdf, save_user
-from models.model import User
-from conf.db import pdf_collection , message_collection
+from constant.extra import extract_text_from_pdf
+from conf.db import async_collection
+from conf.repository import ID_PROJECTION, afind_user_pdf, aupdate_user_pdf, find_user_pdf, insert_pdf, update_user_pdf
+from services.file.blob_store import astore_upload, store_upload
+from services.monitoring.logs import get_logger
 
+log = get_logger("file", sampled=True)
 
-UPLOAD_FOLDER = "uploads"  
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def upload_file(file : UploadFile , user_id):
-    if not file :
-        return {"error": "not found file"}
-    
-    file_path = os.path.join(UPLOAD_FOLDER , file.filename)
-    print(file_path)
-
-    with open (file_path , "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    pdf = {
+def pdf_record(file: UploadFile, user_id, blob: dict) -> dict:
+    return {
     "filename": file.filename,
-    "filePath": file_path,
+    "filePath": blob["path"],
+    "content_hash": blob["content_hash"],
+    "size": blob["size"],
     "user_id": user_id,
     "uploaded_at": datetime.utcnow()
     }
-    save_pdf(pdf)
 
 
+def upload_response(file: UploadFile, blob: dict, pdf_id) -> dict:
     return {
         'file Name': file.filename,
-        'saved path': file_path
+        'saved path': blob["path"],
+        'pdf_id': pdf_id,
+        'content_hash': blob["content_hash"],
     }
 
 
-def getFileText(user_id):
-    print(user_id)
+def upload_file(file : UploadFile , user_id, pdf_id=None):
+    """
+    Store an uploaded PDF in the content-addressed blob store. With pdf_id
+    the upload is a revision of that PDF: its record points at the new
+    file, and the next ingest reuses the chunks of unchanged pages.
+    """
+    if not file :
+        return {"error": "not found file"}
+    if pdf_id and not find_user_pdf(user_id, pdf_id, projection=ID_PROJECTION):
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    blob = store_upload(file.file)
+    log.debug("Stored upload at %s", blob["path"])
+
+    pdf = pdf_record(file, user_id, blob)
+    if pdf_id:
+        update_user_pdf(user_id, pdf_id, pdf)
+    else:
+        pdf_id = insert_pdf(pdf)['_id']
 
-    pdf= pdf_collection.find_one({"user_id":user_id})
-    print(pdf)
+    return upload_response(file, blob, pdf_id)
+
+
+def getFileText(user_id, pdf_id=None):
+    pdf= find_user_pdf(user_id, pdf_id)
     if not pdf :
         return {"error": "not found"}
     
@@ -48,67 +62,22 @@ def getFileText(user_id):
 
     text = extract_text_from_pdf(file_path)
     return text
-    
-def get_File_histroy(user_id):
-    try:
-        if not user_id:
-            raise HTTPException(status_code=401, detail="User ID not found in token")
-        
-       
-        pipeline = [
-            {"$match": {"user_id": user_id}},
-            {"$sort": {"created_at": -1}},
-            {
-                "$group": {
-                    "_id": "$pdf_id",
-                    "messages": {
-                        "$push": {
-                            "question": "$question",
-                            "answer": "$answer",
-                            "created_at": "$created_at"
-                        }
-                    },
-                    "last_message": {"$first": "$created_at"}
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "pdfs",
-                    "localField": "_id",
-                    "foreignField": "_id",
-                    "as": "pdf_info"
-                }
-            },
-            {
-                "$match": {
-                    "pdf_info": {"$ne": []}  
-                }
-            },
-            {"$unwind": "$pdf_info"},
-            {
-                "$project": {
-                    "filename": "$pdf_info.filename",
-                    "messages": 1,
-                    "last_message": 1
-                }
-            },
-            {"$sort": {"last_message": -1}}
-        ]
-        
-        sessions = list(message_collection.aggregate(pipeline))
-        
-        # Handle empty results
-        if not sessions:
-            return {"sessions": []}
-        
-        # Convert ObjectId and datetime to strings for JSON serialization
-        for session in sessions:
-            session["_id"] = str(session["_id"])
-            session["last_message"] = session["last_message"].isoformat()
-            for msg in session["messages"]:
-                msg["created_at"] = msg["created_at"].isoformat()
-        
-        return {"sessions": sessions}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching chat history: {str(e)}")
\ No newline at end of file
+
+
+async def aupload_file(file : UploadFile , user_id, pdf_id=None):
+    """Async upload_file: streams the upload into the blob store and writes the record with motor"""
+    if not file :
+        return {"error": "not found file"}
+    if pdf_id and not await afind_user_pdf(user_id, pdf_id, projection=ID_PROJECTION):
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    blob = await astore_upload(file)
+
+    pdf = pdf_record(file, user_id, blob)
+    if pdf_id:
+        await aupdate_user_pdf(user_id, pdf_id, pdf)
+    else:
+        result = await async_collection("pdfs").insert_one(pdf)
+        pdf_id = str(result.inserted_id)
+
+    return upload_response(file, blob, pdf_id)
@@ -0,0 +1,41 @@
+"""
+One-off build of the chat_sessions summaries from existing messages.
+Messages written after this change keep their summary current themselves.
+
+    python -m services.history.backfill
+"""
+from pymongo import UpdateOne
+
+from conf.db import message_collection, session_collection
+from conf.repository import ensure_indexes
+
+
+def main():
+    ensure_indexes()
+    groups = message_collection.aggregate([
+        {"$group": {
+            "_id": {"user_id": "$user_id", "pdf_id": "$pdf_id"},
+            "message_count": {"$sum": 1},
+            "first_message": {"$min": "$created_at"},
+            "last_message": {"$max": "$created_at"},
+        }},
+    ], allowDiskUse=True)
+    ops = [
+        UpdateOne(
+            {"user_id": group["_id"]["user_id"], "pdf_id": group["_id"]["pdf_id"]},
+            {"$set": {
+                "message_count": group["message_count"],
+                "first_message": group["first_message"],
+                "last_message": group["last_message"],
+            }},
+            upsert=True,
+        )
+        for group in groups
+    ]
+    if ops:
+        session_collection.bulk_write(ops, ordered=False)
+    print(f"Backfilled {len(ops)} chat sessions")
+
+
+if __name__ == "__main__":
+    main()
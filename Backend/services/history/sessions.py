@@ -0,0 +1,121 @@
+import base64
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+from conf.repository import (
+    afind_messages,
+    afind_pdf_names,
+    afind_sessions,
+    find_messages,
+    find_pdf_names,
+    find_sessions,
+)
+
+# Chat history is read a page at a time. Sessions are the per-PDF summaries
+# in chat_sessions (updated as messages are written), newest first; messages
+# are read from one session, newest first. Cursors are opaque keyset
+# positions (timestamp + _id of the last item returned), so a page costs one
+# index range scan however much history a user has.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(value: datetime, last_id) -> str:
+    raw = f"{value.isoformat()}|{last_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str | None):
+    if not cursor:
+        return None
+    try:
+        value, last_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(value), ObjectId(last_id)
+    except (ValueError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def page_size(limit: int | None) -> int:
+    return min(max(1, limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+
+
+# Questions asked across all of a user's PDFs are kept under pdf_id None
+LIBRARY_SESSION = "all"
+LIBRARY_SESSION_NAME = "All documents"
+
+
+def parse_pdf_id(pdf_id: str) -> ObjectId | None:
+    if pdf_id == LIBRARY_SESSION:
+        return None
+    try:
+        return ObjectId(pdf_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+def _page(docs: list, limit: int, field: str):
+    """Trim the lookahead item and build the next cursor"""
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = encode_cursor(docs[-1][field], docs[-1]["_id"]) if has_more else None
+    return docs, next_cursor
+
+
+def _sessions_page(docs, names, limit):
+    docs, next_cursor = _page(docs, limit, "last_message")
+    names = {**names, None: LIBRARY_SESSION_NAME}
+    sessions = [
+        {
+            "_id": str(doc["pdf_id"]) if doc["pdf_id"] is not None else LIBRARY_SESSION,
+            "filename": names[doc["pdf_id"]],
+            "message_count": doc.get("message_count", 0),
+            "last_message": doc["last_message"].isoformat(),
+        }
+        # Sessions whose PDF was deleted are left out
+        for doc in docs if doc.get("pdf_id") in names
+    ]
+    return {"sessions": sessions, "next_cursor": next_cursor}
+
+
+def _messages_page(docs, limit):
+    docs, next_cursor = _page(docs, limit, "created_at")
+    messages = [
+        {
+            "question": doc["question"],
+            "answer": doc["answer"],
+            "created_at": doc["created_at"].isoformat(),
+            **({"cached": doc["cached"]} if doc.get("cached") else {}),
+        }
+        for doc in docs
+    ]
+    return {"messages": messages, "next_cursor": next_cursor}
+
+
+def list_sessions(user_id, cursor: str | None = None, limit: int | None = None):
+    limit = page_size(limit)
+    docs = find_sessions(user_id, limit + 1, decode_cursor(cursor))
+    names = find_pdf_names([doc["pdf_id"] for doc in docs[:limit]]) if docs else {}
+    return _sessions_page(docs, names, limit)
+
+
+async def alist_sessions(user_id, cursor: str | None = None, limit: int | None = None):
+    limit = page_size(limit)
+    docs = await afind_sessions(user_id, limit + 1, decode_cursor(cursor))
+    names = await afind_pdf_names([doc["pdf_id"] for doc in docs[:limit]]) if docs else {}
+    return _sessions_page(docs, names, limit)
+
+
+def list_messages(user_id, pdf_id: str, cursor: str | None = None, limit: int | None = None):
+    limit = page_size(limit)
+    docs = find_messages(user_id, parse_pdf_id(pdf_id), limit + 1, decode_cursor(cursor))
+    return _messages_page(docs, limit)
+
+
+async def alist_messages(user_id, pdf_id: str, cursor: str | None = None, limit: int | None = None):
+    limit = page_size(limit)
+    docs = await afind_messages(user_id, parse_pdf_id(pdf_id), limit + 1, decode_cursor(cursor))
+    return _messages_page(docs, limit)
@@ -0,0 +1,30 @@
+from fastapi import HTTPException
+
+from conf.repository import ID_PROJECTION, find_user_pdf
+from services.jobs.queue import get_ingest_queue, public_job
+from services.monitoring.profiler import current_trigger
+
+
+def submit_ingest(user_id, pdf_id=None):
+    pdf = find_user_pdf(user_id, pdf_id, projection=ID_PROJECTION)
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found. Please upload a PDF first.")
+    # A profiled /inset profiles the ingestion it queues as well
+    job = get_ingest_queue().submit(pdf["_id"], user_id, profile=current_trigger())
+    return public_job(job)
+
+
+def _owned_job(job_id: str, user_id):
+    job = get_ingest_queue().get(job_id)
+    if not job or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job
+
+
+def get_ingest_job(job_id: str, user_id):
+    return public_job(_owned_job(job_id, user_id))
+
+
+def cancel_ingest_job(job_id: str, user_id):
+    _owned_job(job_id, user_id)
+    return public_job(get_ingest_queue().cancel(job_id))
@@ -0,0 +1,176 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+
+from conf.confilg import INGEST_JOB_STORE, INGEST_WORKERS
+from services.jobs.store import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    FINAL_STATES,
+    QUEUED,
+    MemoryJobStore,
+    MongoJobStore,
+)
+from services.monitoring.logs import get_logger
+from services.monitoring.profiler import profiled
+
+
+log = get_logger("jobs")
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callback when a job has been cancelled"""
+
+
+class IngestQueue:
+    """
+    Runs ingestion jobs on a bounded thread pool. `run` is called as
+    run(job, progress) and must call progress(state, **fields) between
+    stages; progress raises JobCancelled once the job is cancelled.
+    """
+
+    def __init__(self, run, store=None, workers: int = INGEST_WORKERS):
+        self.run = run
+        self.store = store or MemoryJobStore()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest")
+        self._cancel_events = {}
+        self._lock = threading.Lock()
+
+    def submit(self, pdf_id, user_id, profile: str | None = None) -> dict:
+        """
+        Queue ingestion of a PDF, or return the job already running for it.
+        A job with a `profile` trigger runs under the sampling profiler.
+        """
+        with self._lock:
+            existing = self.store.find_active(pdf_id)
+            if existing:
+                return existing
+
+            now = datetime.utcnow()
+            job = {
+                "_id": uuid.uuid4().hex,
+                "pdf_id": pdf_id,
+                "user_id": user_id,
+                "state": QUEUED,
+                "chunks_total": 0,
+                "chunks_done": 0,
+                "result": None,
+                "error": None,
+                "profile": profile,
+                "created_at": now,
+                "updated_at": now,
+            }
+            self.store.create(job)
+            self._cancel_events[job["_id"]] = threading.Event()
+
+        self._executor.submit(self._execute, job)
+        return job
+
+    def get(self, job_id: str) -> dict | None:
+        return self.store.get(job_id)
+
+    def cancel(self, job_id: str) -> dict | None:
+        """
+        Request cancellation. A queued job never starts; a running job stops
+        at its next progress report.
+        """
+        job = self.store.get(job_id)
+        if not job or job["state"] in FINAL_STATES:
+            return job
+        event = self._cancel_events.get(job_id)
+        if event:
+            event.set()
+        if job["state"] == QUEUED or event is None:
+            # Not started yet, or running in another process which picks the
+            # cancelled state up at its next progress report
+            self._finish(job_id, CANCELLED)
+        return self.store.get(job_id)
+
+    def _cancelled_elsewhere(self, job_id: str) -> bool:
+        # Cancel requests can land on another worker process, which can only
+        # mark the shared job record
+        job = self.store.get(job_id)
+        return job is not None and job["state"] == CANCELLED
+
+    def _update(self, job_id: str, fields: dict):
+        fields["updated_at"] = datetime.utcnow()
+        self.store.update(job_id, fields)
+
+    def _finish(self, job_id: str, state: str, **fields):
+        self._update(job_id, {"state": state, "finished_at": datetime.utcnow(), **fields})
+        with self._lock:
+            self._cancel_events.pop(job_id, None)
+
+    def _execute(self, job: dict):
+        job_id = job["_id"]
+        event = self._cancel_events.get(job_id)
+        if event is None or event.is_set():
+            return
+
+        def progress(state: str, **fields):
+            if event.is_set() or self._cancelled_elsewhere(job_id):
+                raise JobCancelled()
+            self._update(job_id, {"state": state, **fields})
+
+        profiling = profiled(f"ingest job {job_id}", job["profile"]) if job.get("profile") else nullcontext()
+        try:
+            with profiling:
+                result = self.run(job, progress)
+        except JobCancelled:
+            log.info("Ingest job %s cancelled", job_id)
+            self._finish(job_id, CANCELLED)
+            return
+        except Exception as e:
+            log.error("Ingest job %s failed: %s", job_id, e)
+            self._finish(job_id, FAILED, error=str(e))
+            return
+
+        if isinstance(result, dict) and "error" in result:
+            self._finish(job_id, FAILED, error=result["error"], result=result)
+        else:
+            self._finish(job_id, DONE, result=result)
+
+    def shutdown(self, wait: bool = False):
+        for event in list(self._cancel_events.values()):
+            event.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def public_job(job: dict) -> dict:
+    """JSON-friendly view of a job record"""
+    data = {key: value for key, value in job.items() if key != "_id"}
+    data["job_id"] = job["_id"]
+    data["pdf_id"] = str(job["pdf_id"])
+    for key in ("created_at", "updated_at", "finished_at"):
+        if isinstance(data.get(key), datetime):
+            data[key] = data[key].isoformat()
+    return data
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def _run_ingest(job: dict, progress):
+    from services.llm.llm import injestPdf
+    return injestPdf(job["user_id"], progress=progress, pdf_id=job["pdf_id"])
+
+
+def get_ingest_queue() -> IngestQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                store = MemoryJobStore() if INGEST_JOB_STORE == "memory" else MongoJobStore()
+                _queue = IngestQueue(_run_ingest, store=store)
+    return _queue
+
+
+def shutdown_ingest_queue():
+    global _queue
+    if _queue is not None:
+        _queue.shutdown()
+        _queue = None
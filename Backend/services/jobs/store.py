@@ -0,0 +1,82 @@
+import copy
+import threading
+from datetime import datetime, timedelta
+
+from conf.confilg import INGEST_STALE_SECONDS
+
+QUEUED = "queued"
+EXTRACTING = "extracting"
+EMBEDDING = "embedding"
+QA = "qa"
+# Chunks published and queryable, QA pairs still being generated (QA_STAGE=deferred)
+QA_PENDING = "qa_pending"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (QUEUED, EXTRACTING, EMBEDDING, QA, QA_PENDING)
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+
+def _stale_before():
+    # A job whose worker died never reaches a final state; stop treating it
+    # as running once it has not reported progress for a while
+    return datetime.utcnow() - timedelta(seconds=INGEST_STALE_SECONDS)
+
+
+class MemoryJobStore:
+    """In-process job records, for tests and single-process deployments"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: dict):
+        with self._lock:
+            self._jobs[job["_id"]] = copy.deepcopy(job)
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job else None
+
+    def update(self, job_id: str, fields: dict):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def find_active(self, pdf_id) -> dict | None:
+        stale_before = _stale_before()
+        with self._lock:
+            for job in self._jobs.values():
+                if (job["pdf_id"] == pdf_id and job["state"] in ACTIVE_STATES
+                        and job["updated_at"] >= stale_before):
+                    return copy.deepcopy(job)
+        return None
+
+
+class MongoJobStore:
+    """Job records in the `jobs` collection so status survives restarts"""
+
+    def __init__(self, collection=None):
+        if collection is None:
+            from conf.db import job_collection
+            collection = job_collection
+        self.collection = collection
+        self.collection.create_index([("pdf_id", 1), ("state", 1)])
+
+    def create(self, job: dict):
+        self.collection.insert_one(dict(job))
+
+    def get(self, job_id: str) -> dict | None:
+        return self.collection.find_one({"_id": job_id})
+
+    def update(self, job_id: str, fields: dict):
+        self.collection.update_one({"_id": job_id}, {"$set": fields})
+
+    def find_active(self, pdf_id) -> dict | None:
+        return self.collection.find_one({
+            "pdf_id": pdf_id,
+            "state": {"$in": list(ACTIVE_STATES)},
+            "updated_at": {"$gte": _stale_before()},
+        })
@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+
+from conf.confilg import ANN_MIN_ROWS, ANN_PROBES, RETRIEVAL_MODE
+from services.store.vectors import VectorMatrix
+
+# Assign rows to centroids this many at a time to bound the score matrix
+_ASSIGN_BLOCK = 8192
+
+
+def _nearest(vectors: VectorMatrix, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for each unit-length row"""
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK):
+        block = vectors.dense(slice(start, start + _ASSIGN_BLOCK))
+        assign[start:start + _ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def _group(assign: np.ndarray, n_lists: int) -> list[np.ndarray]:
+    """Row ids of each list, in row order"""
+    order = np.argsort(assign, kind="stable")
+    bounds = np.searchsorted(assign[order], np.arange(n_lists + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(n_lists)]
+
+
+def _kmeans(sample: np.ndarray, n_lists: int, iterations: int, rng) -> np.ndarray:
+    """Spherical k-means: centroids stay unit length so scoring is a dot product"""
+    centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(VectorMatrix(sample), centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        centroids[filled] = np.add.reduceat(sample[order], starts, axis=0)
+        # Reseed empty lists from random rows
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample.shape[0], len(empty), replace=False)]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids /= norms
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over the rows of a unit-normalized matrix. Rows are
+    clustered around `n_lists` centroids; a query scores only the rows of its
+    `n_probe` nearest lists instead of the whole matrix. The index holds row
+    ids only, so it searches whatever matrix it was built for.
+    """
+
+    def __init__(self, centroids: np.ndarray, lists: list[np.ndarray], n_probe: int = ANN_PROBES, trained_rows: int = 0):
+        self.centroids = centroids
+        self.lists = lists
+        self.n_probe = max(1, n_probe)
+        self.trained_rows = trained_rows
+
+    @classmethod
+    def train(cls, matrix: VectorMatrix, n_lists: int | None = None, n_probe: int = ANN_PROBES,
+              iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        rows = len(matrix)
+        n_lists = min(rows, n_lists or max(1, int(np.sqrt(rows))))
+        rng = np.random.default_rng(seed)
+        # k-means on a sample; ~64 rows per list is enough to place centroids
+        sample_size = min(rows, n_lists * 64)
+        sample = np.array(matrix.dense(np.sort(rng.choice(rows, sample_size, replace=False))))
+        centroids = _kmeans(sample, n_lists, iterations, rng)
+        lists = _group(_nearest(matrix, centroids), n_lists)
+        return cls(centroids, lists, n_probe=n_probe, trained_rows=rows)
+
+    @property
+    def size(self) -> int:
+        return sum(len(ids) for ids in self.lists)
+
+    def add(self, vectors: VectorMatrix, start: int):
+        """Insert rows start .. start + len(vectors) without retraining"""
+        if len(vectors) == 0:
+            return
+        assign = _nearest(vectors, self.centroids)
+        for list_id, ids in enumerate(_group(assign, len(self.lists))):
+            if len(ids):
+                self.lists[list_id] = np.concatenate((self.lists[list_id], ids + start))
+
+    def kept(self, mask: np.ndarray) -> "IVFIndex":
+        """Index over the rows where mask is true, renumbered in order"""
+        renumber = np.cumsum(mask) - 1
+        lists = [renumber[ids[mask[ids]]] for ids in self.lists]
+        return IVFIndex(self.centroids, lists, n_probe=self.n_probe, trained_rows=self.trained_rows)
+
+    def stale(self) -> bool:
+        """Centroids trained on far fewer rows than are now indexed"""
+        return self.size > 4 * self.trained_rows
+
+    def probe(self, query: np.ndarray) -> np.ndarray:
+        """Row ids in the `n_probe` lists nearest to the query"""
+        n_probe = min(self.n_probe, len(self.lists))
+        nearest = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        return np.concatenate([self.lists[i] for i in nearest])
+
+    def save(self, path: str, **meta):
+        """Write centroids and lists to one .npz file, atomically"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        offsets = np.cumsum([0] + [len(ids) for ids in self.lists])
+        ids = np.concatenate(self.lists) if self.lists else np.empty(0, np.int64)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, ids=ids, offsets=offsets,
+                 trained_rows=self.trained_rows, **{f"meta_{k}": str(v) for k, v in meta.items()})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, n_probe: int = ANN_PROBES):
+        """(index, meta) from a file written by save, or (None, {}) if missing"""
+        if not os.path.exists(path):
+            return None, {}
+        with np.load(path) as data:
+            offsets = data["offsets"]
+            ids = data["ids"]
+            lists = [ids[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+            meta = {key[5:]: str(data[key]) for key in data.files if key.startswith("meta_")}
+            index = cls(data["centroids"], lists, n_probe=n_probe, trained_rows=int(data["trained_rows"]))
+        return index, meta
+
+
+def ann_enabled(rows: int) -> bool:
+    """Whether a matrix of this many rows should be searched approximately"""
+    return RETRIEVAL_MODE == "ivf" and rows >= ANN_MIN_ROWS
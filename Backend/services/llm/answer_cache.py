@@ -0,0 +1,129 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from conf.confilg import (
+    ANSWER_CACHE_PDFS,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+)
+
+
+def normalize_question(question: str) -> str:
+    question = " ".join(question.lower().split())
+    return re.sub(r"[\s?!.]+$", "", question)
+
+
+class _PdfAnswers:
+    def __init__(self, version):
+        self.version = version
+        # normalized question -> (unit query vector or None, answer, stored_at)
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+class AnswerCache:
+    """
+    Per-PDF cache of generated answers. A question hits on its normalized
+    text first, then on a cached question whose query embedding has cosine
+    similarity >= threshold. Entries expire after `ttl` seconds, each PDF
+    keeps at most `max_entries`, and everything cached for a PDF is dropped
+    when its version (processed_at) changes.
+    """
+
+    def __init__(
+        self,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        max_pdfs: int = ANSWER_CACHE_PDFS,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_pdfs = max_pdfs
+        self.threshold = threshold
+        self._pdfs: "OrderedDict[str, _PdfAnswers]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _answers(self, pdf_id, version, create: bool = False) -> _PdfAnswers | None:
+        key = str(pdf_id)
+        answers = self._pdfs.get(key)
+        if answers is not None and answers.version != version:
+            del self._pdfs[key]
+            answers = None
+        if answers is None and create:
+            answers = self._pdfs[key] = _PdfAnswers(version)
+            while len(self._pdfs) > self.max_pdfs:
+                self._pdfs.popitem(last=False)
+        if answers is not None:
+            self._pdfs.move_to_end(key)
+        return answers
+
+    def _expire(self, answers: _PdfAnswers):
+        cutoff = time.monotonic() - self.ttl
+        for question in [q for q, entry in answers.entries.items() if entry[2] < cutoff]:
+            del answers.entries[question]
+
+    def get_exact(self, pdf_id, version, question: str) -> str | None:
+        """Exact lookup; a miss here is only counted once get_similar also misses"""
+        with self._lock:
+            answers = self._answers(pdf_id, version)
+            if answers is None:
+                return None
+            self._expire(answers)
+            entry = answers.entries.get(normalize_question(question))
+            if entry is None:
+                return None
+            self.exact_hits += 1
+            return entry[1]
+
+    def get_similar(self, pdf_id, version, query: np.ndarray) -> str | None:
+        """Near-duplicate lookup by unit-length query embedding"""
+        with self._lock:
+            answers = self._answers(pdf_id, version)
+            if answers is not None:
+                self._expire(answers)
+                cached = [(entry[0], entry[1]) for entry in answers.entries.values() if entry[0] is not None]
+                if cached:
+                    scores = np.stack([vector for vector, _ in cached]) @ query
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        self.semantic_hits += 1
+                        return cached[best][1]
+            self.misses += 1
+            return None
+
+    def put(self, pdf_id, version, question: str, query: np.ndarray | None, answer: str):
+        with self._lock:
+            answers = self._answers(pdf_id, version, create=True)
+            key = normalize_question(question)
+            answers.entries[key] = (query, answer, time.monotonic())
+            answers.entries.move_to_end(key)
+            while len(answers.entries) > self.max_entries:
+                answers.entries.popitem(last=False)
+
+    def invalidate(self, pdf_id):
+        with self._lock:
+            self._pdfs.pop(str(pdf_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "pdfs": len(self._pdfs),
+                "entries": sum(len(a.entries) for a in self._pdfs.values()),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache()
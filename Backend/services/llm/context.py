@@ -0,0 +1,160 @@
+import re
+
+from conf.confilg import CONTEXT_DEDUP_SIMILARITY, CONTEXT_TOKEN_BUDGET
+from services.llm.lexical import tokenize
+from services.llm.pipeline import CHUNK_OVERLAP
+from services.monitoring.metrics import CONTEXT_TOKENS
+
+# Context of an /llm prompt, packed from the retrieved matches. Chunks that
+# are neighbours in their PDF are merged into one passage with their shared
+# overlap written once; a QA pair whose answer is taken from a retrieved
+# chunk is folded into that chunk (which keeps the better score), and a
+# passage whose terms mostly appear in a more relevant one is dropped. What
+# is left goes in by relevance until the token budget is spent, a passage
+# that does not fit being cut at a sentence end. Tokens are estimated
+# locally, no tokenizer call is made.
+
+QA_MIN_SCORE = 0.5
+CHUNK_MIN_SCORE = 0.3
+# Shorter suffix/prefix matches between neighbour chunks are not overlap
+MIN_OVERLAP_CHARS = 16
+# A passage is only cut to fit when at least this many tokens of it would
+MIN_PART_TOKENS = 24
+
+SECTIONS = (("qa", "Previously answered questions from the document:"),
+            ("chunk", "Relevant sections from the document:"))
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """About what a subword tokenizer makes of `text`: a token per punctuation mark and per 4 letters of a word"""
+    return sum(1 + (len(piece) - 1) // 4 for piece in _PIECE.findall(text))
+
+
+def overlap(left: str, right: str, limit: int = CHUNK_OVERLAP) -> int:
+    """Length of the longest start of `right`, up to `limit` characters, that `left` ends with"""
+    for size in range(min(limit, len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def source_label(match) -> str:
+    """Attribution prefix for matches from a cross-document search"""
+    return f"[{match['filename']}] " if match.get("filename") else ""
+
+
+def _passage(kind: str, score: float, text: str, match: dict) -> dict:
+    return {"kind": kind, "score": score, "text": text, "label": source_label(match),
+            "terms": frozenset(tokenize(text))}
+
+
+def _qa_text(qa: dict) -> str:
+    return f"Q: {qa['question']}\n   A: {qa['answer']}"
+
+
+def _merge_chunks(chunks: list[dict], saved: dict) -> list[dict]:
+    """One passage per run of neighbour chunks, the overlap of each pair kept once"""
+    runs = []
+    for match in sorted(chunks, key=lambda m: (str(m.get("pdf_id")), m.get("chunk_id", -1))):
+        last = runs[-1] if runs else None
+        if (last is not None and last["chunk_id"] is not None and last["pdf_id"] == match.get("pdf_id")
+                and last["chunk_id"] + 1 == match.get("chunk_id")):
+            text = match["chunk"]
+            shared = overlap(last["text"], text)
+            saved["duplicate"] += estimate_tokens(text[:shared])
+            last["text"] = f"{last['text']}{text[shared:]}" if shared else f"{last['text']} {text}"
+            last["score"] = max(last["score"], match["score"])
+            last["chunk_id"] = match["chunk_id"]
+            continue
+        runs.append({"score": match["score"], "text": match["chunk"], "match": match,
+                     "pdf_id": match.get("pdf_id"), "chunk_id": match.get("chunk_id")})
+    return [_passage("chunk", run["score"], run["text"], run["match"]) for run in runs]
+
+
+def _contained(terms: frozenset, other: frozenset) -> bool:
+    return bool(terms) and len(terms & other) / len(terms) >= CONTEXT_DEDUP_SIMILARITY
+
+
+def _fold_qa(qa_matches: list[dict], chunks: list[dict], saved: dict) -> list[dict]:
+    """QA passages whose answer is not already in a chunk passage"""
+    passages = []
+    for qa in qa_matches:
+        terms = frozenset(tokenize(qa["answer"]))
+        source = next((chunk for chunk in chunks if _contained(terms, chunk["terms"])), None)
+        if source is not None:
+            source["score"] = max(source["score"], qa["score"])
+            saved["duplicate"] += estimate_tokens(_qa_text(qa))
+            continue
+        passages.append(_passage("qa", qa["score"], _qa_text(qa), qa))
+    return passages
+
+
+def _cut(text: str, tokens: int) -> str:
+    """The leading whole sentences of `text` that fit in `tokens`, or ''"""
+    kept, used = [], 0
+    for sentence in _SENTENCE_END.split(text):
+        cost = estimate_tokens(sentence)
+        if used + cost > tokens:
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept)
+
+
+def _fill(passages: list[dict], budget: int, saved: dict) -> list[dict]:
+    # Headings, and each passage's number and label, count against the budget
+    kept, kept_terms = [], []
+    left = budget - sum(estimate_tokens(heading) for _, heading in SECTIONS)
+    for passage in sorted(passages, key=lambda p: p["score"], reverse=True):
+        tokens = estimate_tokens(passage["text"])
+        overhead = 2 + estimate_tokens(passage["label"])
+        if any(_contained(passage["terms"], terms) for terms in kept_terms):
+            saved["duplicate"] += tokens
+            continue
+        if tokens + overhead > left:
+            # QA pairs are not cut: half an answer is worse than none
+            room = left - overhead
+            part = _cut(passage["text"], room) if passage["kind"] == "chunk" and room >= MIN_PART_TOKENS else ""
+            saved["over_budget"] += tokens - estimate_tokens(part)
+            if not part:
+                continue
+            passage = {**passage, "text": part}
+            tokens = estimate_tokens(part)
+        kept.append(passage)
+        kept_terms.append(passage["terms"])
+        left -= tokens + overhead
+    return kept
+
+
+def pack_context(retrieved: dict, budget: int = CONTEXT_TOKEN_BUDGET) -> tuple[str, dict]:
+    """
+    (context, stats) for the retrieved matches: the context is "" when
+    nothing is relevant enough. Stats are the estimated tokens sent and
+    those saved, as overlap or duplicates and as over the budget.
+    """
+    saved = {"duplicate": 0, "over_budget": 0}
+    chunks = _merge_chunks([m for m in retrieved["chunk_matches"] if m["score"] > CHUNK_MIN_SCORE], saved)
+    qa = _fold_qa([m for m in retrieved["qa_matches"] if m["score"] > QA_MIN_SCORE], chunks, saved)
+    kept = _fill(qa + chunks, budget, saved)
+
+    parts = []
+    for kind, heading in SECTIONS:
+        passages = [p for p in kept if p["kind"] == kind]
+        if passages:
+            parts.append(heading)
+            parts += [f"{idx}. {p['label']}{p['text']}" for idx, p in enumerate(passages, 1)]
+            parts.append("")
+    context = "\n".join(parts).strip()
+
+    stats = {
+        "context_tokens": estimate_tokens(context),
+        "context_duplicate_tokens": saved["duplicate"],
+        "context_over_budget_tokens": saved["over_budget"],
+    }
+    CONTEXT_TOKENS.inc(stats["context_tokens"], kind="sent")
+    CONTEXT_TOKENS.inc(saved["duplicate"], kind="duplicate")
+    CONTEXT_TOKENS.inc(saved["over_budget"], kind="over_budget")
+    return context, stats
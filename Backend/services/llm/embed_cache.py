@@ -0,0 +1,150 @@
+import dbm
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from bson.binary import Binary
+
+from conf.confilg import EMBED_CACHE_PATH, EMBED_CACHE_SIZE, EMBED_CACHE_STORE
+from services.monitoring.logs import get_logger
+
+log = get_logger("embed_cache")
+
+VECTOR_DTYPE = np.dtype("<f4")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class MongoCacheStore:
+    """Persistent tier in the `embedding_cache` collection, shared by all workers"""
+
+    def __init__(self, collection=None):
+        if collection is None:
+            from conf.db import embedding_cache_collection
+            collection = embedding_cache_collection
+        self.collection = collection
+
+    def get_many(self, keys: list[str]) -> dict:
+        docs = self.collection.find({"_id": {"$in": keys}}, {"vector": 1})
+        return {doc["_id"]: np.frombuffer(doc["vector"], dtype=VECTOR_DTYPE) for doc in docs}
+
+    def put_many(self, items: dict):
+        from pymongo import UpdateOne
+        ops = [
+            UpdateOne({"_id": key}, {"$setOnInsert": {"vector": Binary(vector.tobytes())}}, upsert=True)
+            for key, vector in items.items()
+        ]
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+
+class DiskCacheStore:
+    """Persistent tier in a local dbm file, for single-host deployments"""
+
+    def __init__(self, path: str = EMBED_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = dbm.open(path, "c")
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list[str]) -> dict:
+        found = {}
+        with self._lock:
+            for key in keys:
+                raw = self._db.get(key)
+                if raw is not None:
+                    found[key] = np.frombuffer(raw, dtype=VECTOR_DTYPE)
+        return found
+
+    def put_many(self, items: dict):
+        with self._lock:
+            for key, vector in items.items():
+                self._db[key] = vector.tobytes()
+
+
+class EmbeddingCache:
+    """
+    Read-through cache keyed by (model, SHA-256 of the normalized text): a
+    bounded in-memory LRU in front of an optional persistent store.
+    """
+
+    def __init__(self, max_items: int = EMBED_CACHE_SIZE, store=None):
+        self.max_items = max_items
+        self.store = store
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> dict:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vector
+            self.memory_hits += len(found)
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.store is not None:
+            try:
+                stored = self.store.get_many(missing)
+            except Exception as e:
+                log.warning("Error reading embedding cache: %s", e)
+                stored = {}
+            with self._lock:
+                for key, vector in stored.items():
+                    self._remember(key, vector)
+                self.store_hits += len(stored)
+            found.update(stored)
+
+        with self._lock:
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict):
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+        if items and self.store is not None:
+            try:
+                self.store.put_many(items)
+            except Exception as e:
+                log.warning("Error writing embedding cache: %s", e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.store_hits + self.misses
+            return {
+                "size": len(self._lru),
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.store_hits) / lookups if lookups else 0.0,
+            }
+
+
+def make_embedding_cache() -> EmbeddingCache | None:
+    if EMBED_CACHE_STORE == "none":
+        return None
+    if EMBED_CACHE_STORE == "memory":
+        return EmbeddingCache()
+    store = DiskCacheStore() if EMBED_CACHE_STORE == "disk" else MongoCacheStore()
+    return EmbeddingCache(store=store)
@@ -0,0 +1,282 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from conf.confilg import (
+    EMBED_BATCH_SIZE,
+    EMBED_CONCURRENCY,
+    EMBED_MODEL,
+    EMBED_RETRIES,
+    EMBED_TIMEOUT,
+    OLLAMA_URL,
+)
+from services.llm.embed_cache import EmbeddingCache, cache_key, make_embedding_cache
+from services.monitoring.logs import get_logger
+from services.monitoring.metrics import EMBED_TEXTS, stage
+
+log = get_logger("embedding")
+
+
+class EmbeddingClient:
+    """Pooled Ollama client that sends many inputs per /api/embed request"""
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_URL,
+        model: str = EMBED_MODEL,
+        batch_size: int = EMBED_BATCH_SIZE,
+        concurrency: int = EMBED_CONCURRENCY,
+        retries: int = EMBED_RETRIES,
+        timeout: float = EMBED_TIMEOUT,
+        backoff: float = 0.5,
+        cache: EmbeddingCache | None = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.retries = max(0, retries)
+        self.timeout = timeout
+        self.backoff = backoff
+        self.cache = cache
+
+        # One keep-alive connection per concurrent batch
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="embed"
+        )
+
+    def _post_batch(self, inputs: list[str]) -> list[np.ndarray]:
+        """Embed one batch, retrying the whole batch on failure"""
+        url = f"{self.base_url}/api/embed"
+        for attempt in range(self.retries + 1):
+            try:
+                with stage("embed"):
+                    response = self.session.post(
+                        url,
+                        json={"model": self.model, "input": inputs},
+                        timeout=self.timeout,
+                    )
+                    response.raise_for_status()
+                    vectors = response.json()["embeddings"]
+                if len(vectors) != len(inputs):
+                    raise ValueError(
+                        f"Expected {len(inputs)} embeddings, got {len(vectors)}"
+                    )
+                return [np.asarray(v, dtype=np.float32) for v in vectors]
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                log.warning("Embedding batch failed (%s), retrying in %.1fs", e, delay)
+                time.sleep(delay)
+
+    def _post_batch_safe(self, inputs: list[str]):
+        try:
+            return self._post_batch(inputs)
+        except Exception as e:
+            log.error("Error embedding batch of %d: %s", len(inputs), e)
+            return [None] * len(inputs)
+
+    def _embed_uncached(self, texts: list[str], skip_failed: bool) -> list:
+        batches = [
+            texts[i:i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        post = self._post_batch_safe if skip_failed else self._post_batch
+
+        if len(batches) == 1:
+            return post(batches[0])
+
+        vectors = []
+        for batch_vectors in self._executor.map(post, batches):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def embed_many(self, texts: list[str], skip_failed: bool = False) -> list:
+        """
+        Embed texts as float32 vectors, reading through the cache and sending
+        the misses in batches, up to `concurrency` batches at once. Output
+        order matches input order. With skip_failed, a batch that still fails
+        after its retries yields None for each of its inputs instead of
+        raising.
+        """
+        if not texts:
+            return []
+        if self.cache is None:
+            EMBED_TEXTS.inc(len(texts), source="model")
+            return self._embed_uncached(texts, skip_failed)
+
+        keys = [cache_key(self.model, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        # Each distinct missing text is embedded once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        EMBED_TEXTS.inc(len(texts) - len(missing), source="cache")
+        EMBED_TEXTS.inc(len(missing), source="model")
+        if missing:
+            vectors = self._embed_uncached(list(missing.values()), skip_failed)
+            fresh = {key: vector for key, vector in zip(missing, vectors) if vector is not None}
+            self.cache.put_many(fresh)
+            found.update(fresh)
+
+        return [found.get(key) for key in keys]
+
+    def warm_up(self):
+        """One uncached request, so Ollama has the model loaded before the first real one"""
+        self._post_batch(["warm-up"])
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embed_many([text])[0]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+class AsyncEmbeddingClient:
+    """
+    asyncio counterpart of EmbeddingClient for the async request path: one
+    shared aiohttp session, at most `concurrency` batches per call in flight,
+    same cache. aiohttp rather than httpx because httpx's connection pool
+    slows down sharply with hundreds of queued requests.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_URL,
+        model: str = EMBED_MODEL,
+        batch_size: int = EMBED_BATCH_SIZE,
+        concurrency: int = EMBED_CONCURRENCY,
+        retries: int = EMBED_RETRIES,
+        timeout: float = EMBED_TIMEOUT,
+        backoff: float = 0.5,
+        cache: EmbeddingCache | None = None,
+        max_connections: int = 100,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.retries = max(0, retries)
+        self.timeout = timeout
+        self.backoff = backoff
+        self.cache = cache
+        self.max_connections = max_connections
+        self._session = None
+
+    def _http(self):
+        # aiohttp sessions must be created inside the running event loop
+        if self._session is None:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def _post_batch(self, inputs: list[str]) -> list[np.ndarray]:
+        url = f"{self.base_url}/api/embed"
+        for attempt in range(self.retries + 1):
+            try:
+                with stage("embed"):
+                    async with self._http().post(url, json={"model": self.model, "input": inputs}) as response:
+                        response.raise_for_status()
+                        vectors = (await response.json())["embeddings"]
+                if len(vectors) != len(inputs):
+                    raise ValueError(
+                        f"Expected {len(inputs)} embeddings, got {len(vectors)}"
+                    )
+                return [np.asarray(v, dtype=np.float32) for v in vectors]
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                log.warning("Embedding batch failed (%s), retrying in %.1fs", e, delay)
+                await asyncio.sleep(delay)
+
+    async def embed_many(self, texts: list[str]) -> list[np.ndarray]:
+        if not texts:
+            return []
+
+        keys = [cache_key(self.model, text) for text in texts]
+        found = {}
+        if self.cache is not None:
+            # The persistent tier may be Mongo or disk, so keep it off the loop
+            found = await asyncio.to_thread(self.cache.get_many, list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        EMBED_TEXTS.inc(len(texts) - len(missing), source="cache")
+        EMBED_TEXTS.inc(len(missing), source="model")
+        if missing:
+            inputs = list(missing.values())
+            # At most `concurrency` batches of this call in flight at once
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def post(batch):
+                async with semaphore:
+                    return await self._post_batch(batch)
+
+            results = await asyncio.gather(*[
+                post(inputs[i:i + self.batch_size])
+                for i in range(0, len(inputs), self.batch_size)
+            ])
+            fresh = dict(zip(missing, [v for batch in results for v in batch]))
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put_many, fresh)
+            found.update(fresh)
+
+        return [found[key] for key in keys]
+
+    async def embed(self, text: str) -> np.ndarray:
+        return (await self.embed_many([text]))[0]
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+
+
+def get_embedding_client() -> EmbeddingClient:
+    """Process-wide client so every caller shares the same connection pool"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = EmbeddingClient(cache=make_embedding_cache())
+    return _client
+
+
+def get_async_embedding_client() -> AsyncEmbeddingClient:
+    """Shared async client; created by the app lifespan, shares the sync client's cache"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncEmbeddingClient(cache=get_embedding_client().cache)
+    return _async_client
+
+
+async def close_async_embedding_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
@@ -0,0 +1,301 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
+
+from conf.confilg import (
+    FAKE_LLM_LATENCY_MS,
+    LLM_MAX_IN_FLIGHT,
+    LLM_MODEL,
+    LLM_PROVIDER,
+    LLM_RETRIES,
+)
+from services.monitoring.metrics import LLM_TOKENS, STAGE_ERRORS, record_stage
+
+
+class LLMResult:
+    def __init__(self, text: str, input_tokens: int = 0, output_tokens: int = 0):
+        self.text = text
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+def _usage(response) -> tuple[int, int]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    return usage.prompt_token_count or 0, usage.candidates_token_count or 0
+
+
+class GeminiProvider:
+    """google-genai with one long-lived client per process"""
+
+    def __init__(self, api_key: str | None = None):
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google import genai
+                    self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    def generate(self, model: str, prompt: str) -> LLMResult:
+        response = self.client.models.generate_content(model=model, contents=prompt)
+        return LLMResult(response.text or "", *_usage(response))
+
+    def stream(self, model: str, prompt: str):
+        """Yield text pieces; the last item is the LLMResult with usage"""
+        parts, usage = [], (0, 0)
+        for chunk in self.client.models.generate_content_stream(model=model, contents=prompt):
+            usage = _usage(chunk) if getattr(chunk, "usage_metadata", None) else usage
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+        yield LLMResult("".join(parts), *usage)
+
+    async def agenerate(self, model: str, prompt: str) -> LLMResult:
+        response = await self.client.aio.models.generate_content(model=model, contents=prompt)
+        return LLMResult(response.text or "", *_usage(response))
+
+
+class FakeProvider:
+    """
+    Deterministic offline stand-in (LLM_PROVIDER=fake) for load tests and CI.
+    QA-generation prompts get a JSON array of pairs built from the document
+    text; anything else gets an answer derived from a hash of the prompt.
+    """
+
+    def __init__(self, latency_ms: float = FAKE_LLM_LATENCY_MS):
+        self.latency_ms = latency_ms
+
+    @staticmethod
+    def _tokens(text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def _respond(self, prompt: str) -> LLMResult:
+        if "Question-Answer pairs" in prompt:
+            document = prompt.split("Document content:", 1)[-1].split("\n\nGenerate", 1)[0]
+            sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", document) if len(s.strip()) > 40]
+            pairs = [
+                {"question": f"What does the document say about {' '.join(s.split()[:6])}?", "answer": s}
+                for s in sentences[:20]
+            ]
+            text = json.dumps(pairs)
+        else:
+            digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+            text = f"Based on the document, here is a deterministic answer ({digest}) for testing."
+        return LLMResult(text, self._tokens(prompt), self._tokens(text))
+
+    def generate(self, model: str, prompt: str) -> LLMResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._respond(prompt)
+
+    def stream(self, model: str, prompt: str):
+        result = self.generate(model, prompt)
+        for word in re.findall(r"\S+\s*", result.text):
+            yield word
+        yield result
+
+    async def agenerate(self, model: str, prompt: str) -> LLMResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._respond(prompt)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    code = getattr(error, "code", None)
+    return code in (429, 503) or "RESOURCE_EXHAUSTED" in str(error)
+
+
+class LLMGateway:
+    """
+    Single entry point for LLM calls. Limits in-flight calls per process,
+    retries rate-limited calls with exponential backoff, merges identical
+    in-flight prompts into one call and records latency and token usage.
+    The sync and async paths have separate in-flight limits.
+    """
+
+    def __init__(self, provider, model: str = LLM_MODEL, max_in_flight: int = LLM_MAX_IN_FLIGHT,
+                 retries: int = LLM_RETRIES, backoff: float = 1.0):
+        self.provider = provider
+        self.model = model
+        self.max_in_flight = max(1, max_in_flight)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self._semaphore = threading.BoundedSemaphore(self.max_in_flight)
+        self._inflight: dict[tuple, Future] = {}
+        # Semaphore and in-flight futures of the async path, per event loop:
+        # asyncio objects are bound to the loop that first uses them
+        self._loops: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.calls = 0
+        self.merged = 0
+        self.retried = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def _record(self, started: float, result: LLMResult | None):
+        elapsed = time.perf_counter() - started
+        record_stage("llm", elapsed)
+        if result is None:
+            STAGE_ERRORS.inc(stage="llm")
+        else:
+            LLM_TOKENS.inc(result.input_tokens, direction="input")
+            LLM_TOKENS.inc(result.output_tokens, direction="output")
+        with self._lock:
+            self.calls += 1
+            self._latencies.append(elapsed)
+            if result is None:
+                self.errors += 1
+            else:
+                self.input_tokens += result.input_tokens
+                self.output_tokens += result.output_tokens
+
+    def _call(self, prompt: str, model: str) -> LLMResult:
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                with self._semaphore:
+                    result = self.provider.generate(model, prompt)
+                self._record(started, result)
+                return result
+            except Exception as e:
+                if attempt == self.retries or not is_rate_limited(e):
+                    self._record(started, None)
+                    raise
+                with self._lock:
+                    self.retried += 1
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def generate(self, prompt: str, model: str | None = None) -> LLMResult:
+        model = model or self.model
+        key = (model, prompt)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.merged += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._call(prompt, model)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stream(self, prompt: str, model: str | None = None):
+        """Yield text pieces, then the final LLMResult. Streams are not merged or retried."""
+        model = model or self.model
+        started = time.perf_counter()
+        result = None
+        with self._semaphore:
+            try:
+                for item in self.provider.stream(model, prompt):
+                    if isinstance(item, LLMResult):
+                        result = item
+                    yield item
+            finally:
+                self._record(started, result)
+
+    def _loop_state(self) -> tuple[asyncio.Semaphore, dict]:
+        loop = asyncio.get_running_loop()
+        if loop not in self._loops:
+            self._loops[loop] = (asyncio.Semaphore(self.max_in_flight), {})
+        return self._loops[loop]
+
+    async def agenerate(self, prompt: str, model: str | None = None) -> LLMResult:
+        model = model or self.model
+        key = (model, prompt)
+        semaphore, inflight = self._loop_state()
+        while (future := inflight.get(key)) is not None:
+            self.merged += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The caller making the call was cancelled, not this one:
+                # make it again
+                if not future.cancelled():
+                    raise
+
+        future = inflight[key] = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    async with semaphore:
+                        result = await self.provider.agenerate(model, prompt)
+                    break
+                except Exception as e:
+                    if attempt == self.retries or not is_rate_limited(e):
+                        raise
+                    self.retried += 1
+                    await asyncio.sleep(self.backoff * (2 ** attempt))
+            self._record(started, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            self._record(started, None)
+            future.set_exception(e)
+            # Mark retrieved so asyncio doesn't warn when nobody else awaited it
+            future.exception()
+            raise
+        finally:
+            # Cancelled (CancelledError is not an Exception): release the
+            # callers merged onto this one
+            if not future.done():
+                future.cancel()
+            inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else None
+        return {
+            "provider": type(self.provider).__name__,
+            "model": self.model,
+            "calls": self.calls,
+            "merged": self.merged,
+            "retried": self.retried,
+            "errors": self.errors,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "latency_p50_ms": pct(0.5),
+            "latency_p95_ms": pct(0.95),
+        }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                provider = FakeProvider() if LLM_PROVIDER == "fake" else GeminiProvider()
+                _gateway = LLMGateway(provider)
+    return _gateway
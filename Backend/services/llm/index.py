@@ -0,0 +1,490 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from conf.confilg import (
+    ANN_INDEX_PATH,
+    CHUNK_VECTOR_FORMAT,
+    INDEX_CACHE_SIZE,
+    LEXICAL_PREFILTER_CANDIDATES,
+    LEXICAL_PREFILTER_ROWS,
+    LEXICAL_WEIGHT,
+    LIBRARY_CACHE_SIZE,
+    QA_VECTOR_FORMAT,
+    RERANK_FACTOR,
+    RETRIEVAL_MODE,
+    VECTOR_KEEP_FULL,
+)
+from conf.db import pdf_collection
+from conf.repository import find_library_pdfs
+from services.llm.ann import IVFIndex, ann_enabled
+from services.llm.lexical import LexicalIndex
+from services.store.chunk_store import load_chunks, load_full_vectors, load_qa, migrate_pdf
+from services.store.vectors import VectorMatrix, normalize_rows
+
+
+def vector_matrix(vectors, fmt: str) -> VectorMatrix:
+    """Raw embeddings as unit-length rows in `fmt`"""
+    return VectorMatrix.from_dense(normalize_rows(vectors), fmt) if len(vectors) else VectorMatrix.empty(fmt)
+
+
+def top_k_ids(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Positions of the top_k highest scores, best first"""
+    if top_k < scores.shape[0]:
+        ids = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        ids = np.arange(scores.shape[0])
+    return ids[np.argsort(-scores[ids])]
+
+
+def top_k_scores(matrix, query: np.ndarray, top_k: int):
+    """Score every row with one matmul, return (row ids, scores) best first"""
+    if len(matrix) == 0 or top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    scores = matrix.scores(query) if isinstance(matrix, VectorMatrix) else matrix @ query
+    ids = top_k_ids(scores, top_k)
+    return ids, scores[ids]
+
+
+def search_rows(matrix: VectorMatrix, query: np.ndarray, top_k: int, ann: IVFIndex | None = None, full_vectors=None,
+                candidates: np.ndarray | None = None):
+    """
+    (row ids, scores) best first, scored on the matrix as held: every row,
+    the given candidate rows, or the rows an ANN index probes. For a compact
+    matrix the best RERANK_FACTOR x top_k rows are re-scored with the
+    float32 vectors that `full_vectors(rows)` returns as {row: vector}.
+    """
+    if len(matrix) == 0 or top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    rerank = full_vectors is not None and VECTOR_KEEP_FULL and matrix.format != "float32"
+
+    if candidates is None and ann is not None:
+        candidates = ann.probe(query)
+    scores = matrix.scores(query, candidates)
+    ids = top_k_ids(scores, top_k * max(1, RERANK_FACTOR) if rerank else top_k)
+    rows = ids if candidates is None else candidates[ids]
+    scores = scores[ids]
+
+    if rerank:
+        full = full_vectors(rows.tolist())
+        if full:
+            positions = [i for i, row in enumerate(rows.tolist()) if row in full]
+            scores = scores.copy()
+            scores[positions] = normalize_rows([full[rows[i]] for i in positions]) @ query
+            order = np.argsort(-scores, kind="stable")
+            rows, scores = rows[order], scores[order]
+    return rows[:top_k], scores[:top_k]
+
+
+def search_hybrid(matrix: VectorMatrix, lexical: LexicalIndex, query: np.ndarray | None, question: str | None,
+                  top_k: int, ann: IVFIndex | None = None, full_vectors=None):
+    """
+    (row ids, scores, lexical scores) best first. The best vector rows and
+    the best BM25 rows are pooled and ranked by cosine + LEXICAL_WEIGHT x
+    the row's coverage of the question's terms. With no query embedding
+    rows are ranked by BM25 alone and scored by coverage; on a very large
+    matrix only the best lexical matches are vector-scored.
+    """
+    empty = np.empty(0, dtype=np.float32)
+    matched = lexical.score(question) if question else None
+    if matched is None:
+        if query is None:
+            return np.empty(0, dtype=np.int64), empty, empty
+        rows, scores = search_rows(matrix, query, top_k, ann, full_vectors)
+        return rows, scores, np.zeros_like(scores)
+
+    bm25, coverage = matched
+    hits = np.flatnonzero(bm25)
+    if query is None:
+        rows = hits[top_k_ids(bm25[hits], top_k)]
+        return rows, coverage[rows], coverage[rows]
+
+    pool = top_k * 4
+    candidates = None
+    if len(matrix) >= LEXICAL_PREFILTER_ROWS and len(hits) >= pool:
+        candidates = np.sort(hits[top_k_ids(bm25[hits], LEXICAL_PREFILTER_CANDIDATES)])
+    rows, cosine = search_rows(matrix, query, pool, ann, full_vectors, candidates)
+    # Strong term matches the vector search ranked too low still compete
+    extra = np.setdiff1d(hits[top_k_ids(bm25[hits], pool)], rows)
+    if len(extra):
+        rows = np.concatenate((rows, extra))
+        cosine = np.concatenate((cosine, matrix.scores(query, extra)))
+    fused = cosine + LEXICAL_WEIGHT * coverage[rows]
+    best = top_k_ids(fused, top_k)
+    rows = rows[best]
+    return rows, fused[best], coverage[rows]
+
+
+def _fetch_full(kind: str, keys: dict) -> dict:
+    """float32 vectors of rows from the chunk store; keys maps row -> (pdf_id, generation, index)"""
+    groups = {}
+    for pdf_id, generation, index in keys.values():
+        groups.setdefault((pdf_id, generation), []).append(index)
+    found = load_full_vectors(kind, [(pdf_id, generation, ids) for (pdf_id, generation), ids in groups.items()])
+    return {row: found[key] for row, key in keys.items() if key in found}
+
+
+_UNBUILT = object()
+
+
+class PdfIndex:
+    """In-memory retrieval index for one processed PDF"""
+
+    def __init__(self, chunks, chunk_matrix: VectorMatrix, qa_pairs, qa_matrix: VectorMatrix, version=None,
+                 chunk_pages=None, chunk_ids=None, qa_ids=None, source=None, lexical=None):
+        self.chunks = chunks
+        self.qa_pairs = qa_pairs
+        self.version = version
+        # (page, page_hash) of each chunk row, for patching after a re-ingest
+        self.chunk_pages = chunk_pages or [(None, None)] * len(chunks)
+        self.chunk_matrix = chunk_matrix
+        self.qa_matrix = qa_matrix
+        # Where each row is stored, (pdf_id, generation) and index, to fetch
+        # float32 vectors for re-ranking compact matrices
+        self.source = source
+        self.chunk_ids = np.asarray(chunk_ids if chunk_ids is not None else range(len(chunks)), dtype=np.int64)
+        self.qa_ids = np.asarray(qa_ids if qa_ids is not None else range(len(qa_pairs)), dtype=np.int64)
+        # BM25 postings of the chunk texts, built with the index
+        self.lexical = lexical if lexical is not None else LexicalIndex.build(chunks)
+        self._chunk_ann = _UNBUILT
+
+    @property
+    def chunk_ann(self) -> IVFIndex | None:
+        # Trained on first search, so only PDFs that are searched pay for it
+        if self._chunk_ann is _UNBUILT:
+            self._chunk_ann = IVFIndex.train(self.chunk_matrix) if ann_enabled(len(self.chunks)) else None
+        return self._chunk_ann
+
+    @classmethod
+    def load(cls, pdf: dict) -> "PdfIndex":
+        """Load vectors for a PDF metadata document from the chunk store"""
+        generation = pdf.get("chunk_generation")
+        if pdf.get("vector_store") != "chunks":
+            # Older ingestions kept vectors inline in the pdfs document
+            migrate_pdf(pdf["_id"])
+            current = pdf_collection.find_one({"_id": pdf["_id"]}, {"chunk_generation": 1}) or {}
+            generation = current.get("chunk_generation")
+        chunks, chunk_matrix, chunk_ids, chunk_pages = load_chunks(pdf["_id"], generation)
+        qa_pairs, qa_matrix, qa_ids = load_qa(pdf["_id"], generation)
+        return cls(chunks, chunk_matrix, qa_pairs, qa_matrix, version=pdf.get("processed_at"),
+                   chunk_pages=chunk_pages, chunk_ids=chunk_ids, qa_ids=qa_ids, source=(pdf["_id"], generation))
+
+    def clone(self, version=None, source=None) -> "PdfIndex":
+        """Same vectors under another version, for a PDF with identical content"""
+        index = PdfIndex(self.chunks, self.chunk_matrix, self.qa_pairs, self.qa_matrix, version=version,
+                         chunk_pages=self.chunk_pages, chunk_ids=self.chunk_ids, qa_ids=self.qa_ids, source=source, lexical=self.lexical)
+        index._chunk_ann = self._chunk_ann
+        return index
+
+    def with_qa(self, qa_pairs, qa_matrix: VectorMatrix, qa_ids, version=None) -> "PdfIndex":
+        """Same chunks under another version with a new set of QA pairs"""
+        index = PdfIndex(self.chunks, self.chunk_matrix, qa_pairs, qa_matrix, version=version,
+                         chunk_pages=self.chunk_pages, chunk_ids=self.chunk_ids, qa_ids=qa_ids, source=self.source,
+                         lexical=self.lexical)
+        index._chunk_ann = self._chunk_ann
+        return index
+
+    def page_rows(self) -> dict:
+        """Row numbers of each page's chunks, by page number"""
+        rows = {}
+        for row, (page, _) in enumerate(self.chunk_pages):
+            rows.setdefault(page, []).append(row)
+        return rows
+
+    def patched(self, segments: list, qa_pairs, qa_vectors, version=None, source=None, qa_ids=None) -> "PdfIndex":
+        """
+        Index for a re-ingested PDF built from this one: `segments` lists the
+        new pages in order, either ("reuse", old_page, page, page_hash) for a
+        page whose rows are copied from here, or ("new", chunks, vectors,
+        page, page_hash) for a re-embedded page. Only new rows are normalized.
+        `qa_vectors` is this index's qa_matrix when the QA pairs were carried
+        over, or raw vectors.
+        """
+        old_rows = self.page_rows()
+        texts, pages, parts = [], [], []
+        for segment in segments:
+            if segment[0] == "reuse":
+                _, old_page, page, digest = segment
+                rows = old_rows.get(old_page, [])
+                texts.extend(self.chunks[row] for row in rows)
+                parts.append(self.chunk_matrix.take(rows))
+            else:
+                _, chunks, vectors, page, digest = segment
+                rows = chunks
+                texts.extend(chunks)
+                if vectors:
+                    parts.append(vector_matrix(vectors, CHUNK_VECTOR_FORMAT))
+            pages.extend([(page, digest)] * len(rows))
+        matrix = VectorMatrix.stack(parts, CHUNK_VECTOR_FORMAT)
+        if not isinstance(qa_vectors, VectorMatrix):
+            qa_vectors = vector_matrix(qa_vectors, QA_VECTOR_FORMAT)
+        # The new generation's chunks are stored with indexes 0..n-1 in row order
+        return PdfIndex(texts, matrix, qa_pairs, qa_vectors, version=version, chunk_pages=pages,
+                        qa_ids=qa_ids, source=source)
+
+    def _full_vectors(self, kind: str):
+        if self.source is None:
+            return None
+        ids = self.chunk_ids if kind == "chunk" else self.qa_ids
+        return lambda rows: _fetch_full(kind, {row: (*self.source, int(ids[row])) for row in rows})
+
+    def search_chunks(self, query: np.ndarray | None, top_k: int = 3, question: str | None = None) -> list[dict]:
+        ann = self.chunk_ann if query is not None else None
+        ids, scores, lexical = search_hybrid(self.chunk_matrix, self.lexical, query, question, top_k, ann,
+                                             self._full_vectors("chunk"))
+        return [
+            {"score": float(score), "lexical_score": float(lex), "chunk": self.chunks[i],
+             "chunk_id": int(self.chunk_ids[i])}
+            for i, score, lex in zip(ids.tolist(), scores.tolist(), lexical.tolist())
+        ]
+
+    def search_qa(self, query: np.ndarray, top_k: int = 3) -> list[dict]:
+        ids, scores = search_rows(self.qa_matrix, query, top_k, full_vectors=self._full_vectors("qa"))
+        return [
+            {"score": float(score), **self.qa_pairs[i]}
+            for i, score in zip(ids.tolist(), scores.tolist())
+        ]
+
+
+_indexes: "OrderedDict[str, PdfIndex]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def cache_index(pdf_id, index: PdfIndex) -> PdfIndex:
+    key = str(pdf_id)
+    with _lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def get_index(pdf: dict) -> PdfIndex:
+    """
+    Return the cached index for a PDF, building it on first use. An index
+    built from an older ingestion (different processed_at) is rebuilt, so a
+    re-ingest done by another worker process is picked up as well.
+    """
+    key = str(pdf["_id"])
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None and index.version == pdf.get("processed_at"):
+            _indexes.move_to_end(key)
+            return index
+    return cache_index(pdf["_id"], PdfIndex.load(pdf))
+
+
+def peek_index(pdf: dict) -> PdfIndex | None:
+    """The cached index for a PDF if it is current, without loading one"""
+    with _lock:
+        index = _indexes.get(str(pdf["_id"]))
+    if index is not None and index.version == pdf.get("processed_at"):
+        return index
+    return None
+
+
+def invalidate_index(pdf_id):
+    with _lock:
+        _indexes.pop(str(pdf_id), None)
+
+
+def _current_or_load(pdf: dict) -> PdfIndex:
+    # Reuse a cached per-PDF index, but don't push a user's whole library
+    # through the per-PDF LRU while building their combined index
+    return peek_index(pdf) or PdfIndex.load(pdf)
+
+
+def _source_key(pdf: dict) -> str:
+    # A PDF's rows change only when it is re-ingested
+    return f"{pdf['_id']}:{pdf.get('processed_at')}"
+
+
+def _ann_path(user_id) -> str:
+    return os.path.join(ANN_INDEX_PATH, f"{user_id}.npz")
+
+
+class LibraryIndex:
+    """
+    All processed PDFs of one user in a single matrix per kind, each row
+    tagged with its source PDF, so a cross-document question is one matmul
+    over the library instead of a search per document. In ivf mode a large
+    library's chunks are searched through an IVFIndex instead.
+    """
+
+    def __init__(self, pdfs: list[dict] = (), indexes: list[PdfIndex] = (), version=None):
+        self.version = version
+        self.sources = []
+        self.keys = []
+        # (pdf_id, generation) of each source, and stored index of each row
+        self.origins = []
+        self.chunk_ids = np.empty(0, dtype=np.int64)
+        self.qa_ids = np.empty(0, dtype=np.int64)
+        self.chunks = []
+        self.qa_pairs = []
+        self.chunk_source = np.empty(0, dtype=np.int64)
+        self.qa_source = np.empty(0, dtype=np.int64)
+        self.chunk_matrix = VectorMatrix.empty(CHUNK_VECTOR_FORMAT)
+        self.qa_matrix = VectorMatrix.empty(QA_VECTOR_FORMAT)
+        self.chunk_ann = None
+        # Per-source BM25 postings, combined into one on first search
+        self.lexicals = []
+        self._lexical = None
+        self._extend(pdfs, indexes)
+
+    def _extend(self, pdfs: list[dict], indexes: list[PdfIndex]):
+        """Append PDFs after the current rows; their chunks join the ANN index"""
+        first = len(self.sources)
+        start = len(self.chunks)
+        self.sources += [
+            {"pdf_id": str(pdf["_id"]), "filename": pdf.get("filename")} for pdf in pdfs
+        ]
+        self.keys += [_source_key(pdf) for pdf in pdfs]
+        self.origins += [index.source for index in indexes]
+        self.lexicals += [index.lexical for index in indexes]
+        self._lexical = None
+        self.chunk_ids = np.concatenate([self.chunk_ids] + [index.chunk_ids for index in indexes])
+        self.qa_ids = np.concatenate([self.qa_ids] + [index.qa_ids for index in indexes])
+        self.chunks += [chunk for index in indexes for chunk in index.chunks]
+        self.qa_pairs += [qa for index in indexes for qa in index.qa_pairs]
+        positions = np.arange(first, first + len(indexes))
+        self.chunk_source = np.concatenate((self.chunk_source, np.repeat(positions, [len(index.chunks) for index in indexes])))
+        self.qa_source = np.concatenate((self.qa_source, np.repeat(positions, [len(index.qa_pairs) for index in indexes])))
+        self.chunk_matrix = VectorMatrix.stack([self.chunk_matrix] + [index.chunk_matrix for index in indexes], CHUNK_VECTOR_FORMAT)
+        self.qa_matrix = VectorMatrix.stack([self.qa_matrix] + [index.qa_matrix for index in indexes], QA_VECTOR_FORMAT)
+        if self.chunk_ann is not None:
+            self.chunk_ann.add(self.chunk_matrix.take(slice(start, None)), start)
+
+    def _subset(self, keep: list[int]) -> "LibraryIndex":
+        """Library of the sources at positions `keep`, rows renumbered in order"""
+        renumber = np.full(len(self.sources), -1, dtype=np.int64)
+        renumber[keep] = np.arange(len(keep))
+        chunk_rows = renumber[self.chunk_source] >= 0
+        qa_rows = renumber[self.qa_source] >= 0
+
+        library = LibraryIndex(version=self.version)
+        library.sources = [self.sources[i] for i in keep]
+        library.keys = [self.keys[i] for i in keep]
+        library.origins = [self.origins[i] for i in keep]
+        library.lexicals = [self.lexicals[i] for i in keep]
+        library.chunk_ids = self.chunk_ids[chunk_rows]
+        library.qa_ids = self.qa_ids[qa_rows]
+        library.chunks = [chunk for chunk, row in zip(self.chunks, chunk_rows) if row]
+        library.qa_pairs = [qa for qa, row in zip(self.qa_pairs, qa_rows) if row]
+        library.chunk_source = renumber[self.chunk_source[chunk_rows]]
+        library.qa_source = renumber[self.qa_source[qa_rows]]
+        library.chunk_matrix = self.chunk_matrix.take(chunk_rows) if len(library.chunks) else VectorMatrix.empty(CHUNK_VECTOR_FORMAT)
+        library.qa_matrix = self.qa_matrix.take(qa_rows) if len(library.qa_pairs) else VectorMatrix.empty(QA_VECTOR_FORMAT)
+        if self.chunk_ann is not None:
+            # Always a copy: this library may still be serving queries
+            library.chunk_ann = self.chunk_ann.kept(chunk_rows)
+        return library
+
+    @classmethod
+    def load(cls, user_id, version=None) -> "LibraryIndex":
+        pdfs = find_library_pdfs(user_id)
+        ann, meta = IVFIndex.load(_ann_path(user_id)) if RETRIEVAL_MODE == "ivf" else (None, {})
+        saved = meta.get("sources", "").split(",")
+        if ann is not None and sorted(saved) == sorted(map(_source_key, pdfs)):
+            # Same PDFs as the saved index: lay rows out in its order
+            position = {key: i for i, key in enumerate(saved)}
+            pdfs.sort(key=lambda pdf: position[_source_key(pdf)])
+        else:
+            ann = None
+
+        library = cls(pdfs, [_current_or_load(pdf) for pdf in pdfs], version=version)
+        if ann is not None and ann.size == len(library.chunks):
+            library.chunk_ann = ann
+        else:
+            library._index_chunks(user_id)
+        return library
+
+    def updated(self, user_id, version) -> "LibraryIndex":
+        """
+        The library at a new version, built from this one: rows of unchanged
+        PDFs are kept, only new or re-ingested PDFs are loaded, and their
+        chunks are added to the ANN index without retraining it.
+        """
+        pdfs = find_library_pdfs(user_id)
+        wanted = {_source_key(pdf) for pdf in pdfs}
+        keep = [i for i, key in enumerate(self.keys) if key in wanted]
+        have = {self.keys[i] for i in keep}
+        added = [pdf for pdf in pdfs if _source_key(pdf) not in have]
+
+        library = self._subset(keep)
+        library.version = version
+        library._extend(added, [_current_or_load(pdf) for pdf in added])
+        library._index_chunks(user_id)
+        return library
+
+    def _index_chunks(self, user_id):
+        """Train or drop the ANN index to suit RETRIEVAL_MODE and the row count, and save it"""
+        if not ann_enabled(len(self.chunks)):
+            self.chunk_ann = None
+            return
+        if self.chunk_ann is None or self.chunk_ann.stale():
+            self.chunk_ann = IVFIndex.train(self.chunk_matrix)
+        self.chunk_ann.save(_ann_path(user_id), sources=",".join(self.keys))
+
+    @property
+    def lexical(self) -> LexicalIndex:
+        if self._lexical is None:
+            self._lexical = LexicalIndex.combine(self.lexicals)
+        return self._lexical
+
+    def _full_vectors(self, kind: str):
+        row_source, ids = (self.chunk_source, self.chunk_ids) if kind == "chunk" else (self.qa_source, self.qa_ids)
+        return lambda rows: _fetch_full(kind, {
+            row: (*self.origins[row_source[row]], int(ids[row]))
+            for row in rows if self.origins[row_source[row]] is not None
+        })
+
+    def search_chunks(self, query: np.ndarray | None, top_k: int = 3, question: str | None = None) -> list[dict]:
+        ids, scores, lexical = search_hybrid(self.chunk_matrix, self.lexical, query, question, top_k, self.chunk_ann,
+                                             self._full_vectors("chunk"))
+        return [
+            {"score": float(score), "lexical_score": float(lex), "chunk": self.chunks[i],
+             "chunk_id": int(self.chunk_ids[i]), **self.sources[self.chunk_source[i]]}
+            for i, score, lex in zip(ids.tolist(), scores.tolist(), lexical.tolist())
+        ]
+
+    def search_qa(self, query: np.ndarray, top_k: int = 3) -> list[dict]:
+        ids, scores = search_rows(self.qa_matrix, query, top_k, full_vectors=self._full_vectors("qa"))
+        return [
+            {"score": float(score), **self.qa_pairs[i], **self.sources[self.qa_source[i]]}
+            for i, score in zip(ids.tolist(), scores.tolist())
+        ]
+
+
+_libraries: "OrderedDict[str, LibraryIndex]" = OrderedDict()
+
+
+def get_library_index(user_id, version) -> LibraryIndex:
+    """
+    Cached cross-document index for a user. `version` is the user's
+    library_version, which every ingestion bumps, so the library is updated
+    once per change rather than re-read on every question.
+    """
+    key = str(user_id)
+    with _lock:
+        library = _libraries.get(key)
+        if library is not None and library.version == version:
+            _libraries.move_to_end(key)
+            return library
+    if library is not None:
+        library = library.updated(user_id, version)
+    else:
+        library = LibraryIndex.load(user_id, version)
+    with _lock:
+        _libraries[key] = library
+        _libraries.move_to_end(key)
+        while len(_libraries) > LIBRARY_CACHE_SIZE:
+            _libraries.popitem(last=False)
+    return library
+
+
+def normalize_query(vector) -> np.ndarray:
+    return normalize_rows(vector)[0]
@@ -0,0 +1,128 @@
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Words and identifiers: "A-113.2", "clause 4.1.3" and "ISO/IEC" stay whole
+_TOKEN = re.compile(r"\w+(?:[-./:]\w+)*")
+_SEPARATORS = re.compile(r"[-./:]")
+
+STOPWORDS = frozenset("""
+a about an and any are as at be been but by can could did do does for from had has have
+how i if in into is it its me my no not of on or our so than that the their them then there
+these they this those to was we were what when where which who whom why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased terms without stop words; identifiers also yield their parts"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token not in STOPWORDS:
+            tokens.append(token)
+        if _SEPARATORS.search(token):
+            tokens.extend(part for part in _SEPARATORS.split(token) if part and part not in STOPWORDS)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    BM25 over the rows of a PdfIndex or LibraryIndex. Postings are held as
+    flat arrays: the rows and term frequencies of term t are
+    rows[offsets[t]:offsets[t + 1]] and tfs[...], with term ids from `vocab`.
+    """
+
+    def __init__(self, vocab: dict, offsets: np.ndarray, rows: np.ndarray, tfs: np.ndarray, lengths: np.ndarray):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.lengths = lengths
+        self.n = len(lengths)
+        self.avg_length = float(lengths.mean()) if self.n and lengths.sum() else 1.0
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((self.n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        # Weight of a query term that occurs nowhere, as rare as a term can be
+        self.missing_idf = math.log1p((self.n + 0.5) / 0.5)
+
+    @classmethod
+    def _from_postings(cls, vocab: dict, term_ids: np.ndarray, rows: np.ndarray, tfs: np.ndarray, lengths: np.ndarray):
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(term_ids, minlength=len(vocab)))))
+        return cls(vocab, offsets, rows[order], tfs[order], lengths)
+
+    @classmethod
+    def build(cls, texts: list[str]) -> "LexicalIndex":
+        vocab, term_ids, rows, tfs, lengths = {}, [], [], [], []
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                rows.append(row)
+                tfs.append(tf)
+        return cls._from_postings(
+            vocab,
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(rows, dtype=np.int32),
+            np.asarray(tfs, dtype=np.float32),
+            np.asarray(lengths, dtype=np.float32),
+        )
+
+    @classmethod
+    def combine(cls, parts: list["LexicalIndex"]) -> "LexicalIndex":
+        """One index over the rows of several, in order, without re-tokenizing"""
+        vocab, term_ids, rows, tfs, lengths = {}, [], [], [], []
+        start = 0
+        for part in parts:
+            # vocab ids follow insertion order
+            remap = np.asarray([vocab.setdefault(term, len(vocab)) for term in part.vocab], dtype=np.int64)
+            term_ids.append(remap[np.repeat(np.arange(len(part.vocab)), np.diff(part.offsets))])
+            rows.append(part.rows + start)
+            tfs.append(part.tfs)
+            lengths.append(part.lengths)
+            start += part.n
+        if not parts:
+            return cls.build([])
+        return cls._from_postings(
+            vocab, np.concatenate(term_ids), np.concatenate(rows), np.concatenate(tfs), np.concatenate(lengths)
+        )
+
+    def score(self, question: str):
+        """
+        (BM25 score, coverage) of every row for a question, or None when no
+        term of it occurs. Coverage is the idf-weighted share of the
+        question's terms that a row contains, from 0 to 1.
+        """
+        terms = set(tokenize(question))
+        if not terms or not self.n:
+            return None
+        bm25 = np.zeros(self.n, dtype=np.float32)
+        coverage = np.zeros(self.n, dtype=np.float32)
+        total = 0.0
+        matched = False
+        for term in terms:
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                total += self.missing_idf
+                continue
+            matched = True
+            idf = self.idf[term_id]
+            total += float(idf)
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows, tf = self.rows[start:end], self.tfs[start:end]
+            norm = tf + K1 * (1 - B + B * self.lengths[rows] / self.avg_length)
+            bm25[rows] += idf * tf * (K1 + 1) / norm
+            coverage[rows] += idf
+        if not matched:
+            return None
+        return bm25, coverage / total
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.rows.nbytes + self.tfs.nbytes + self.lengths.nbytes + self.idf.nbytes
@@ -1,38 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 from datetime import datetime
-import requests
-from litellm import completion
-import os
 import json
-import numpy as np
-from conf.db import pdf_collection, message_collection
-from constant.extra import extract_text_from_pdf
-from google import genai
+import time
+from conf.confilg import CONTEXT_CANDIDATES, QA_STAGE, QUERY_EMBED_TIMEOUT
+from conf.db import pdf_collection
+from conf.repository import (
+    INGEST_PROJECTION,
+    bump_library_version,
+    find_ingested_blob,
+    find_library_version,
+    find_user_pdf,
+    insert_message,
+)
+from constant.extra import iter_pdf_pages, open_pdf
+from services.llm.embedding import get_embedding_client
+from services.llm.gateway import LLMResult, get_llm_gateway
+from services.jobs.queue import JobCancelled
+from services.llm.answer_cache import answer_cache
+from services.llm.context import pack_context
+from services.llm.index import cache_index, get_index, get_library_index, invalidate_index, normalize_query, peek_index
+from services.llm.pipeline import CHUNK_OVERLAP, CHUNK_SIZE, chunk_page, page_hash
+from services.llm.qa import dedupe_qa, generate_section_qa, qa_sections
+from services.monitoring.logs import get_logger
+from services.monitoring.metrics import stage, timed
+from services.store.chunk_store import (
+    append_chunks,
+    append_qa,
+    copy_generation,
+    copy_qa,
+    delete_generation,
+    delete_other_generations,
+    load_page_chunks,
+    load_qa,
+    new_generation,
+    stored_vector,
+)
 
+log = get_logger("llm")
+# Written on every question, so sampled
+request_log = get_logger("llm.request", sampled=True)
 
-def get_embedding(text: str, model: str = "nomic-embed-text"):
+
+def get_embedding(text: str):
     """Get embedding vector from Ollama"""
     try:
-        url = "http://localhost:11434/api/embeddings"
-        response = requests.post(url, json={"model": model, "prompt": text}, timeout=30)
-        response.raise_for_status()
-        return response.json()["embedding"]
+        return get_embedding_client().embed(text)
     except Exception as e:
-        print(f"Error getting embedding: {e}")
+        log.error("Error getting embedding: %s", e)
         raise
 
 
-def cosine_similarity(a, b):
-    """Calculate cosine similarity between two vectors"""
-    a = np.array(a)
-    b = np.array(b)
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+# Question embeddings run here so a slow Ollama can be given up on
+_query_embedder = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embed")
+
+
+def embed_question(question: str):
+    """
+    Normalized embedding of a question, or None when the embedding service
+    fails or takes longer than QUERY_EMBED_TIMEOUT; retrieval then falls back
+    to lexical matches.
+    """
+    # In the request's context, so its time and queries count toward the request
+    future = _query_embedder.submit(contextvars.copy_context().run, get_embedding, question)
+    try:
+        return normalize_query(future.result(timeout=QUERY_EMBED_TIMEOUT))
+    except Exception as e:
+        log.warning("Query embedding unavailable, using lexical retrieval: %r", e)
+        return None
+
+
+def _no_progress(state, **fields):
+    pass
 
 
-def injestPdf(user_id ):
-    """Process PDF: extract text, create embeddings, and generate QA pairs"""
-    print(f"Processing PDF for user: {user_id}")
+def injestPdf(user_id, progress=_no_progress, pdf_id=None):
+    """
+    Process PDF: extract text, create embeddings, and generate QA pairs.
+    Pages stream through chunking, embedding and storage in batches, so
+    memory for vectors depends on the batch size rather than the document
+    size. With QA_STAGE=deferred the chunks are published before QA pairs
+    are generated, and the PDF is published again once they are.
+    `progress(state, **fields)` is called between stages when run as a job.
+    Processes `pdf_id`, or the user's latest upload when None.
+    """
+    log.info("Processing PDF for user: %s", user_id)
     
-    pdf = pdf_collection.find_one({"user_id": user_id})
+    pdf = find_user_pdf(user_id, pdf_id, projection=INGEST_PROJECTION)
     if not pdf:
         return {"error": "PDF not found"}
     
@@ -42,210 +96,374 @@ def injestPdf(user_id ):
     if not file_path:
         return {"error": "File path not found in PDF record"}
     
-    # Extract text from PDF
+    # Content that was ingested before (by any user) is copied, not re-processed
+    content_hash = pdf.get("content_hash")
+    source = None
+    if content_hash and pdf.get("ingested_hash") == content_hash and pdf.get("chunk_count"):
+        source = pdf
+    elif content_hash:
+        source = find_ingested_blob(content_hash)
+    if source is not None:
+        return reuse_ingested(user_id, pdf, source)
+    
+    progress("extracting")
     try:
-        text = extract_text_from_pdf(file_path)
-        if not text or len(text.strip()) < 50:
-            return {"error": "PDF text extraction failed or insufficient content"}
+        with stage("extract"):
+            reader = open_pdf(file_path)
+            pages_total = len(reader.pages)
     except Exception as e:
-        print(f"Error extracting text: {e}")
+        log.error("Error extracting text: %s", e)
         return {"error": f"Failed to extract text: {str(e)}"}
+
+    # New chunks go to a fresh generation; the current one stays queryable
+    # until the pdfs document is switched over at the end
+    generation = new_generation()
+    embedder = get_embedding_client()
+    batch_size = embedder.batch_size * embedder.concurrency
+    # (page_hash, [chunk text]) of each page, split into sections for QA
+    page_chunks = []
+    stats = {"pages": 0, "text_length": 0}
+
+    # A re-ingest reuses the stored chunks of pages whose text is unchanged
+    previous = pdf.get("chunk_generation") if pdf.get("vector_store") == "chunks" else None
+    known_pages = set(pdf.get("page_hashes") or []) if previous else set()
+    old_index = peek_index(pdf) if known_pages else None
+    page_hashes = []
+    # Page layout of the new generation, to patch the cached index with
+    segments = []
+
+    def pages():
+        for page_number, text in enumerate(timed(iter_pdf_pages(reader), "extract")):
+            stats["pages"] += 1
+            stats["text_length"] += len(text)
+            digest = page_hash(text)
+            page_hashes.append(digest)
+            yield page_number, text, digest
+
+    def store(pending):
+        """Embed the chunks of changed pages and write a batch of pages in page order"""
+        nonlocal chunk_count, embeddings_created, chunks_reused
+        reusable = [digest for _, _, digest in pending if digest in known_pages]
+        stored = load_page_chunks(pdf_id, previous, reusable) if reusable else {}
+
+        with stage("chunk"):
+            fresh = [
+                {**c, "page_hash": digest}
+                for page_number, text, digest in pending if digest not in stored
+                for c in chunk_page(text, page_number)
+            ]
+        # Generate embeddings for chunks (batched, failed batches are skipped)
+        vectors = embedder.embed_many([c["chunk"] for c in fresh], skip_failed=True)
+        embedded = {}
+        for c, vector in zip(fresh, vectors):
+            if vector is not None:
+                embedded.setdefault(c["page"], []).append({**c, "vector": vector})
+
+        items = []
+        for page_number, text, digest in pending:
+            if digest in stored:
+                old_page, docs = stored[digest]
+                page_items = [
+                    {"chunk": doc["text"], "stored": stored_vector(doc),
+                     "page": page_number, "page_hash": digest}
+                    for doc in docs
+                ]
+                chunks_reused += len(page_items)
+                segments.append(("reuse", old_page, page_number, digest))
+            else:
+                page_items = embedded.get(page_number, [])
+                segments.append(("new", [c["chunk"] for c in page_items],
+                                 [c["vector"] for c in page_items] if old_index else None,
+                                 page_number, digest))
+            page_chunks.append((digest, [item["chunk"] for item in page_items]))
+            # Stored chunks are numbered 0..n-1 in order, so index rows map to them
+            for item in page_items:
+                item["index"] = embeddings_created + len(items)
+                items.append(item)
+
+        append_chunks(pdf_id, generation, items)
+        chunk_count += len(items) + len(fresh) - sum(len(v) for v in embedded.values())
+        embeddings_created += len(items)
+
+    chunk_count = 0
+    embeddings_created = 0
+    chunks_reused = 0
+    progress("embedding", pages_total=pages_total, pages_done=0, chunks_done=0)
+    try:
+        pending, pending_chunks = [], 0
+        for page in pages():
+            pending.append(page)
+            # Roughly one embedding round (batch_size chunks) per flush
+            pending_chunks += len(page[1]) // (CHUNK_SIZE - CHUNK_OVERLAP) + 1
+            if pending_chunks >= batch_size:
+                store(pending)
+                pending, pending_chunks = [], 0
+                progress("embedding", pages_done=stats["pages"], chunks_done=chunk_count)
+        if pending:
+            store(pending)
+            progress("embedding", pages_done=stats["pages"], chunks_done=chunk_count)
+    except JobCancelled:
+        delete_generation(pdf_id, generation)
+        raise
+    except Exception as e:
+        log.error("Error processing PDF: %s", e)
+        delete_generation(pdf_id, generation)
+        return {"error": f"Failed to process PDF: {str(e)}"}
+
+    chunks_recomputed = embeddings_created - chunks_reused
+    log.info("Reused %d chunks, recomputed %d", chunks_reused, chunks_recomputed)
+    log.info("Extracted %d characters from %d pages", stats["text_length"], stats["pages"])
+    log.info("Created %d chunks", chunk_count)
     
-    print(f"Extracted {len(text)} characters from PDF")
-    
-    # Create chunks with overlap
-    chunk_size = 800
-    overlap = 100
-    chunks = []
-    
-    for i in range(0, len(text), chunk_size - overlap):
-        chunk = text[i:i + chunk_size].strip()
-        if len(chunk) > 50:  # Only add substantial chunks
-            chunks.append(chunk)
+    if not chunk_count:
+        delete_generation(pdf_id, generation)
+        return {"error": "PDF text extraction failed or insufficient content"}
     
-    print(f"Created {len(chunks)} chunks")
+    if not embeddings_created:
+        delete_generation(pdf_id, generation)
+        return {"error": "Failed to create embeddings"}
     
-    if not chunks:
-        return {"error": "No valid chunks created from PDF"}
+    log.info("Created %d embeddings", embeddings_created)
     
-    # Generate embeddings for chunks
-    embedding_data = []
-    for idx, chunk in enumerate(chunks):
+    # QA pairs of sections whose text is unchanged are carried over from the
+    # previous generation; the other sections are sent to the LLM
+    sections = qa_sections(page_chunks) if QA_STAGE != "off" else []
+    try:
+        reused_qa = copy_qa(pdf_id, previous, generation, [s["hash"] for s in sections]) if previous and sections else []
+    except Exception as e:
+        log.error("Error copying QA pairs: %s", e)
+        delete_generation(pdf_id, generation)
+        return {"error": f"Failed to save to database: {str(e)}"}
+    if reused_qa:
+        log.info("Reused %d QA pairs", len(reused_qa))
+    covered = {qa["section"] for qa in reused_qa}
+    missing = [section for section in sections if section["hash"] not in covered]
+    qa_deferred = bool(missing) and QA_STAGE == "deferred"
+    qa_embeddings = []
+
+    def generate_missing(state="qa", **fields):
+        """Generate, embed and store QA pairs for the sections not carried over"""
+        done = len(sections) - len(missing)
+        progress(state, qa_sections_done=done, **fields)
+        embeddings = generate_qa(missing, embedder, reused_qa,
+                                 on_done=lambda count: progress(state, qa_sections_done=done + count))
+        append_qa(pdf_id, generation, embeddings)
+        return embeddings
+
+    try:
+        progress("qa", chunks_total=chunk_count, embeddings_created=embeddings_created,
+                 qa_sections_total=len(sections), qa_sections_done=len(sections) - len(missing))
+        if missing and not qa_deferred:
+            try:
+                qa_embeddings = generate_missing()
+            except JobCancelled:
+                raise
+            except Exception as e:
+                log.error("Error generating QA pairs: %s", e)
+                # Continue without QA pairs if generation fails
+    except JobCancelled:
+        delete_generation(pdf_id, generation)
+        raise
+
+    meta = {
+        "qa_pairs": qa_fields(reused_qa + qa_embeddings),
+        "qa_state": "pending" if qa_deferred else "done",
+        "page_count": stats["pages"],
+        "text_length": stats["text_length"],
+        "chunk_count": chunk_count,
+        "page_hashes": page_hashes,
+        # Set once the QA pairs are done too, so that an identical upload is
+        # not copied from a half-finished ingestion
+        "ingested_hash": None if qa_deferred else content_hash,
+    }
+    try:
+        meta = switch_generation(user_id, pdf_id, generation, meta)
+    except Exception as e:
+        log.error("Error updating database: %s", e)
+        delete_generation(pdf_id, generation)
+        return {"error": f"Failed to save to database: {str(e)}"}
+    processed_at = meta["processed_at"]
+
+    # Build the retrieval index (vectors and BM25 postings) now so the first
+    # question doesn't pay for it. After a re-ingest the previous index is
+    # patched: only changed pages' rows are new, the rest are copied over.
+    if old_index is not None:
+        index_qa, index_qa_matrix, index_qa_ids = load_qa(pdf_id, generation)
+        index = cache_index(pdf_id, old_index.patched(segments, index_qa, index_qa_matrix, version=processed_at,
+                                                      source=(pdf_id, generation), qa_ids=index_qa_ids))
+    else:
+        index = get_index({**pdf, **meta})
+
+    qa_state = meta["qa_state"]
+    if qa_deferred:
+        # The chunks are queryable from here on, and the job says so with
+        # the qa_pending state; a failed or cancelled QA stage leaves the
+        # PDF without the missing pairs
         try:
-            vector = get_embedding(chunk)
-            embedding_data.append({
-                "index": idx,
-                "chunk": chunk,
-                "vector": vector
+            qa_embeddings = generate_missing("qa_pending", queryable=True)
+            meta = switch_generation(user_id, pdf_id, generation, {
+                "qa_pairs": qa_fields(reused_qa + qa_embeddings),
+                "qa_state": "done",
+                "ingested_hash": content_hash,
             })
-            if (idx + 1) % 10 == 0:
-                print(f"Processed {idx + 1}/{len(chunks)} chunks")
+            cache_index(pdf_id, index.with_qa(*load_qa(pdf_id, generation), version=meta["processed_at"]))
+            qa_state = "done"
+        except JobCancelled:
+            set_qa_state(pdf_id, "cancelled")
+            raise
         except Exception as e:
-            print(f"Error embedding chunk {idx}: {e}")
-            continue
-    
-    if not embedding_data:
-        return {"error": "Failed to create embeddings"}
+            log.error("Error generating QA pairs: %s", e)
+            qa_state = "failed"
+            set_qa_state(pdf_id, qa_state)
     
-    print(f"Created {len(embedding_data)} embeddings")
-    
-    # Generate QA pairs using Gemini
-    max_chunks_for_qa = 20
-    sample_chunks = chunks[:max_chunks_for_qa] if len(chunks) > max_chunks_for_qa else chunks
-    
-    qa_prompt = f"""Based on the following document content, generate relevant Question-Answer pairs.
+    return {
+        "status": "success",
+        "pages_processed": stats["pages"],
+        "chunks_created": chunk_count,
+        "embeddings_created": embeddings_created,
+        "chunks_reused": chunks_reused,
+        "chunks_recomputed": chunks_recomputed,
+        "qa_sections": len(sections),
+        "qa_pairs_created": len(reused_qa) + len(qa_embeddings),
+        "qa_embeddings_created": len(qa_embeddings),
+        "qa_reused": bool(reused_qa),
+        "qa_pairs_reused": len(reused_qa),
+        "qa_state": qa_state,
+    }
 
-Document content:
-{' '.join(sample_chunks)}
 
-Generate comprehensive Q&A pairs covering:
-- Main topics and concepts
-- Important facts and details
-- Definitions and explanations
-- Key relationships and connections
+def qa_fields(pairs: list[dict]) -> list[dict]:
+    return [{"question": qa["question"], "answer": qa["answer"]} for qa in pairs]
 
-Return ONLY a valid JSON array with this exact format:
-[
-    {{"question": "What is...", "answer": "..."}},
-    {{"question": "How does...", "answer": "..."}}
-]
 
-Generate 20-30 Q&A pairs. Make questions specific and answers detailed based strictly on the document content."""
-    
-    qa_pairs = []
-    qa_embeddings = []
-    
+def set_qa_state(pdf_id, state: str):
     try:
-        client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=qa_prompt,
-        )
-        
-        # Parse QA pairs
-        qa_text = response.text.strip()
-        
-        # Remove markdown code blocks if present
-        if qa_text.startswith("```json"):
-            qa_text = qa_text.replace("```json", "").replace("```", "").strip()
-        elif qa_text.startswith("```"):
-            qa_text = qa_text.replace("```", "").strip()
-        
-        qa_pairs = json.loads(qa_text)
-        print(f"Generated {len(qa_pairs)} QA pairs")
-        
-        # Create embeddings for QA pairs
-        for idx, qa in enumerate(qa_pairs):
-            try:
-                # Combine question and answer for better semantic search
-                combined_text = f"Q: {qa['question']} A: {qa['answer']}"
-                qa_vector = get_embedding(combined_text)
-                qa_embeddings.append({
-                    "index": idx,
-                    "question": qa["question"],
-                    "answer": qa["answer"],
-                    "vector": qa_vector
-                })
-            except Exception as e:
-                print(f"Error embedding QA pair {idx}: {e}")
-                continue
-        
-        print(f"Created {len(qa_embeddings)} QA embeddings")
-        
+        pdf_collection.update_one({"_id": pdf_id}, {"$set": {"qa_state": state}})
     except Exception as e:
-        print(f"Error generating QA pairs: {e}")
-        # Continue without QA pairs if generation fails
-    
-    # Update database with embeddings and QA pairs
+        log.error("Error updating QA state: %s", e)
+
+
+def switch_generation(user_id, pdf_id, generation, meta: dict) -> dict:
+    """
+    Point the pdfs document at a finished generation and drop everything
+    that referred to the previous one. Returns the metadata that was set.
+    """
+    # Mongo keeps milliseconds, so truncate to match the stored value that
+    # get_index compares against
+    now = datetime.utcnow()
+    processed_at = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    meta = {**meta, "vector_store": "chunks", "chunk_generation": generation, "processed_at": processed_at}
+    # Only metadata lives in the pdfs document
+    pdf_collection.update_one(
+        {"_id": pdf_id},
+        {
+            "$set": meta,
+            "$unset": {"embeddings": "", "qa_embeddings": ""}
+        }
+    )
+    invalidate_index(pdf_id)
+    answer_cache.invalidate(pdf_id)
+    delete_other_generations(pdf_id, generation)
+    bump_library_version(user_id, processed_at)
+    return meta
+
+
+def reuse_ingested(user_id, pdf: dict, source: dict):
+    """
+    Ingest a PDF whose file content was already ingested for `source` by
+    copying source's chunks, vectors and QA pairs; nothing is extracted or
+    embedded.
+    """
+    pdf_id = pdf["_id"]
+    chunk_count = source.get("chunk_count", 0)
+    result = {
+        "status": "success",
+        "pages_processed": source.get("page_count", 0),
+        "chunks_created": chunk_count,
+        "embeddings_created": chunk_count,
+        "chunks_reused": chunk_count,
+        "chunks_recomputed": 0,
+        "qa_reused": True,
+    }
+    if source["_id"] == pdf_id:
+        log.info("PDF is unchanged since it was last ingested")
+        return {**result, "qa_pairs_created": 0, "qa_embeddings_created": 0, "unchanged": True}
+
+    log.info("Reusing chunks of identical PDF %s", source["_id"])
+    generation = new_generation()
     try:
-        pdf_collection.update_one(
-            {"user_id": user_id},
-            {
-                "$set": {
-                    "embeddings": embedding_data,
-                    "qa_pairs": qa_pairs,
-                    "qa_embeddings": qa_embeddings,
-                    "processed_at": datetime.utcnow(),
-                    "text_length": len(text),
-                    "chunk_count": len(chunks)
-                }
-            },
-            upsert=True
-        )
+        chunk_count, qa_pairs = copy_generation(source["_id"], source["chunk_generation"], pdf_id, generation)
+        meta = switch_generation(user_id, pdf_id, generation, {
+            "qa_pairs": qa_pairs,
+            "page_count": source.get("page_count"),
+            "text_length": source.get("text_length"),
+            "chunk_count": chunk_count,
+            "page_hashes": source.get("page_hashes"),
+            "ingested_hash": source["ingested_hash"],
+            "deduplicated_from": source["_id"],
+        })
     except Exception as e:
-        print(f"Error updating database: {e}")
+        log.error("Error copying chunks: %s", e)
+        delete_generation(pdf_id, generation)
         return {"error": f"Failed to save to database: {str(e)}"}
-    
+
+    source_index = peek_index(source)
+    if source_index is not None:
+        cache_index(pdf_id, source_index.clone(version=meta["processed_at"], source=(pdf_id, generation)))
+    else:
+        get_index({**pdf, **meta})
+
     return {
-        "status": "success",
-        "chunks_created": len(chunks),
-        "embeddings_created": len(embedding_data),
+        **result,
+        "chunks_created": chunk_count,
+        "embeddings_created": chunk_count,
+        "chunks_reused": chunk_count,
         "qa_pairs_created": len(qa_pairs),
-        "qa_embeddings_created": len(qa_embeddings)
+        "qa_embeddings_created": len(qa_pairs),
+        "deduplicated_from": str(source["_id"]),
     }
 
 
-def retrieve_relevant_content(user_id, user_question, top_k=3):
+def generate_qa(sections: list[dict], embedder, existing: list[dict] = (), on_done=None) -> list[dict]:
     """
-    Retrieve relevant content using hybrid approach:
-    1. Search QA pairs first (faster, pre-generated)
-    2. Fall back to chunk search if needed
+    Ask the LLM for QA pairs of each document section, drop near-duplicate
+    questions (also of `existing` pairs) and embed the rest. Returns the
+    embedded pairs, numbered after `existing`.
     """
-    try:
-        query_vector = get_embedding(user_question)
-    except Exception as e:
-        print(f"Error getting query embedding: {e}")
-        return {"qa_matches": [], "chunk_matches": [], "error": "Failed to process question"}
+    qa_pairs = dedupe_qa(generate_section_qa(sections, on_done), seen=existing)
+    log.info("Generated %d QA pairs from %d sections", len(qa_pairs), len(sections))
     
-    pdf = pdf_collection.find_one({"user_id": user_id})
-    if not pdf:
-        return {"qa_matches": [], "chunk_matches": [], "error": "PDF not found"}
-    
-    qa_matches = []
-    chunk_matches = []
+    # Create embeddings for QA pairs
+    # Combine question and answer for better semantic search
+    combined_texts = [f"Q: {qa['question']} A: {qa['answer']}" for qa in qa_pairs]
+    qa_vectors = embedder.embed_many(combined_texts, skip_failed=True)
+    qa_embeddings = []
+    for qa, qa_vector in zip(qa_pairs, qa_vectors):
+        if qa_vector is None:
+            continue
+        qa_embeddings.append({"index": len(existing) + len(qa_embeddings), **qa, "vector": qa_vector})
     
+    log.info("Created %d QA embeddings", len(qa_embeddings))
+    return qa_embeddings
+
+
+# `scope` value that searches every processed PDF of the user at once
+LIBRARY_SCOPE = "all"
+
+
+def search_index(index, query, top_k=3, question=None):
+    """
+    Score a normalized query and the question's terms against a PdfIndex or
+    LibraryIndex. With no query (embedding unavailable) only chunks are
+    searched, lexically.
+    """
     # Search in QA embeddings first
-    if "qa_embeddings" in pdf and pdf["qa_embeddings"]:
-        qa_similarities = []
-        for qa_emb in pdf["qa_embeddings"]:
-            try:
-                score = cosine_similarity(query_vector, qa_emb["vector"])
-                qa_similarities.append({
-                    "score": float(score),
-                    "question": qa_emb["question"],
-                    "answer": qa_emb["answer"]
-                })
-            except Exception as e:
-                print(f"Error calculating QA similarity: {e}")
-                continue
-        
-        # Sort and get top matches
-        qa_similarities.sort(reverse=True, key=lambda x: x["score"])
-        qa_matches = qa_similarities[:top_k]
-        print(f"Found {len(qa_matches)} QA matches")
-    else:
-        print("No QA embeddings found")
+    qa_matches = index.search_qa(query, top_k) if query is not None else []
     
     # Search in chunk embeddings
-    if "embeddings" in pdf and pdf["embeddings"]:
-        chunk_similarities = []
-        for emb in pdf["embeddings"]:
-            try:
-                score = cosine_similarity(query_vector, emb["vector"])
-                chunk_similarities.append({
-                    "score": float(score),
-                    "chunk": emb["chunk"]
-                })
-            except Exception as e:
-                print(f"Error calculating chunk similarity: {e}")
-                continue
-        
-        # Sort and get top matches
-        chunk_similarities.sort(reverse=True, key=lambda x: x["score"])
-        chunk_matches = chunk_similarities[:top_k]
-        print(f"Found {len(chunk_matches)} chunk matches")
-    else:
-        print("No chunk embeddings found")
+    chunk_matches = index.search_chunks(query, top_k, question)
+    request_log.debug("Found %d of %d QA pairs, %d of %d chunks",
+                      len(qa_matches), len(index.qa_pairs), len(chunk_matches), len(index.chunks))
     
     return {
         "qa_matches": qa_matches,
@@ -253,66 +471,74 @@ def retrieve_relevant_content(user_id, user_question, top_k=3):
     }
 
 
-def takeLLMresponse(user_id, user_question):
-    """Generate answer using retrieved context"""
-    if not user_id:
-        return {"Error": "User not found"}
-    
-    if not user_question or len(user_question.strip()) < 3:
-        return {"Error": "Question is too short or empty"}
-    
-    pdf = pdf_collection.find_one({"user_id": user_id})
+def search_pdf(pdf, query, top_k=3, question=None):
+    """Score a normalized query against a PDF's index (loading it if needed)"""
+    return search_index(get_index(pdf), query, top_k, question)
+
+
+def pdf_target(pdf):
+    """What a single-PDF question is asked against, or {"Error": ...}"""
     if not pdf:
         return {"Error": "PDF not found. Please upload a PDF first."}
     
     # Check if PDF has been processed
-    if "embeddings" not in pdf or not pdf["embeddings"]:
+    if not pdf.get("processed_at") or not pdf.get("chunk_count"):
         return {"Error": "PDF has not been processed yet. Please wait for processing to complete."}
     
-    pdf_id = pdf["_id"]
+    return {"pdf": pdf, "pdf_id": pdf["_id"], "cache_id": pdf["_id"], "version": pdf.get("processed_at")}
+
+
+def library_target(user_id, version):
+    """What a question over all of a user's PDFs is asked against, or {"Error": ...}"""
+    if not version:
+        return {"Error": "No processed PDFs found. Please upload and process a PDF first."}
+    # History for library questions is kept under pdf_id None
+    return {"pdf": None, "pdf_id": None, "cache_id": f"library:{user_id}", "version": version, "scope": LIBRARY_SCOPE}
+
+
+def search_target(user_id, target, query, top_k=3, question=None):
+    # Includes loading the index when it is not cached
+    with stage("search"):
+        if target["pdf"] is not None:
+            return search_pdf(target["pdf"], query, top_k, question)
+        return search_index(get_library_index(user_id, target["version"]), query, top_k, question)
+
+
+def target_fields(target) -> dict:
+    return {"scope": target["scope"]} if "scope" in target else {}
+
+
+def retrieve_relevant_content(user_id, user_question, top_k=3, query=None, pdf=None, pdf_id=None):
+    """
+    Retrieve relevant content using hybrid approach:
+    1. Search QA pairs first (faster, pre-generated)
+    2. Fall back to chunk search if needed
+    `query` is the normalized question embedding and `pdf` the PDF metadata
+    document when the caller has them already. Chunks are also matched on
+    the question's terms, and on those alone when no embedding is available.
+    """
+    if query is None:
+        query = embed_question(user_question)
     
-    # Retrieve relevant content
-    retrieved = retrieve_relevant_content(user_id, user_question, top_k=3)
-    
-    if "error" in retrieved:
-        return {"Error": retrieved["error"]}
-    
-    # Build context from retrieved information
-    context_parts = []
-    has_relevant_content = False
-    
-    # Add QA matches (prioritize these as they're pre-generated answers)
-    if retrieved["qa_matches"]:
-        relevant_qa = [qa for qa in retrieved["qa_matches"][:3] if qa["score"] > 0.5]
-        if relevant_qa:
-            has_relevant_content = True
-            context_parts.append("Previously answered questions from the document:")
-            for idx, qa in enumerate(relevant_qa, 1):
-                context_parts.append(f"\n{idx}. Q: {qa['question']}")
-                context_parts.append(f"   A: {qa['answer']}")
-                context_parts.append(f"   (Relevance: {qa['score']:.2f})")
-    
-    # Add chunk matches for additional context
-    if retrieved["chunk_matches"]:
-        relevant_chunks = [chunk for chunk in retrieved["chunk_matches"][:3] if chunk["score"] > 0.3]
-        if relevant_chunks:
-            has_relevant_content = True
-            context_parts.append("\n\nRelevant sections from the document:")
-            for idx, chunk in enumerate(relevant_chunks, 1):
-                # Use more of the chunk text for better context
-                chunk_text = chunk['chunk'][:500]
-                context_parts.append(f"\n{idx}. {chunk_text}...")
-                context_parts.append(f"   (Relevance: {chunk['score']:.2f})")
-    
-    # Debug: Print context to see what's being used
-    context = "\n".join(context_parts)
-    print(f"\n=== CONTEXT BEING SENT ===")
-    print(f"Has relevant content: {has_relevant_content}")
-    print(f"Context length: {len(context)}")
-    print(f"Context preview:\n{context[:500]}...")
-    print(f"=== END CONTEXT ===\n")
-    
-    if not has_relevant_content:
+    if pdf is None:
+        pdf = find_user_pdf(user_id, pdf_id)
+    if not pdf:
+        return {"qa_matches": [], "chunk_matches": [], "error": "PDF not found"}
+    
+    return search_pdf(pdf, query, top_k, user_question)
+
+
+def build_prompt(user_question, retrieved):
+    """
+    Build the context and final prompt from retrieved matches; also returns
+    the context's token stats (see pack_context)
+    """
+    context, stats = pack_context(retrieved)
+    request_log.info("Context: %d tokens, %d duplicate and %d over budget left out", stats["context_tokens"],
+                     stats["context_duplicate_tokens"], stats["context_over_budget_tokens"])
+    request_log.debug("Context preview: %.500s", context)
+    
+    if not context:
         context = "No highly relevant content found in the document for this question."
     
     # Build prompt
@@ -332,35 +558,186 @@ Instructions:
 
 Answer:"""
     
+    return context, final_prompt, stats
+
+
+def prepare_llm_request(user_id, user_question, pdf_id=None, scope=None):
+    """
+    Everything before generation: validation, answer cache, retrieval and
+    prompt building. Asks about `pdf_id` (the latest upload when None), or
+    about every processed PDF of the user with scope="all". Returns
+    {"Error": ...}, {"cached": answer} (already saved to history) or the
+    request to generate for.
+    """
+    if not user_id:
+        return {"Error": "User not found"}
+    
+    if not user_question or len(user_question.strip()) < 3:
+        return {"Error": "Question is too short or empty"}
+    
+    if scope == LIBRARY_SCOPE:
+        target = library_target(user_id, find_library_version(user_id))
+    else:
+        target = pdf_target(find_user_pdf(user_id, pdf_id))
+    if "Error" in target:
+        return target
+    
+    pdf_id = target["pdf_id"]
+    cache_id = target["cache_id"]
+    version = target["version"]
+    extra = target_fields(target)
+    
+    # Answer from the cache when the same question was asked about this PDF
+    cached = answer_cache.get_exact(cache_id, version, user_question)
+    if cached is not None:
+        save_message(user_id, pdf_id, user_question, cached, cached="exact", **extra)
+        return {"cached": cached}
+    
+    query = embed_question(user_question)
+    if query is None:
+        extra = {**extra, "retrieval": "lexical"}
+    else:
+        cached = answer_cache.get_similar(cache_id, version, query)
+        if cached is not None:
+            answer_cache.put(cache_id, version, user_question, query, cached)
+            save_message(user_id, pdf_id, user_question, cached, cached="semantic", **extra)
+            return {"cached": cached}
+    
+    # Retrieve relevant content
+    retrieved = search_target(user_id, target, query, top_k=CONTEXT_CANDIDATES, question=user_question)
+    
+    with stage("prompt"):
+        context, final_prompt, stats = build_prompt(user_question, retrieved)
+    
+    return {
+        "pdf_id": pdf_id,
+        "cache_id": cache_id,
+        "version": version,
+        "fields": {**extra, **stats},
+        "query": query,
+        "retrieved": retrieved,
+        "context": context,
+        "prompt": final_prompt,
+    }
+
+
+def finish_llm_request(user_id, user_question, request: dict, answer: str, generated: bool, **fields):
+    """Cache a generated answer and save the exchange to history"""
+    # An answer from lexical matches alone is not cached
+    if generated and request["query"] is not None:
+        answer_cache.put(request["cache_id"], request["version"], user_question, request["query"], answer)
+    save_message(user_id, request["pdf_id"], user_question, answer, **history_fields(request), **fields)
+
+
+def takeLLMresponse(user_id, user_question, pdf_id=None, scope=None):
+    """Generate answer using retrieved context"""
+    request = prepare_llm_request(user_id, user_question, pdf_id, scope)
+    if "Error" in request:
+        return request
+    if "cached" in request:
+        return request["cached"]
+    
     # Get response from Gemini
+    generated = False
     try:
-        client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=final_prompt,
-        )
+        response = get_llm_gateway().generate(request["prompt"])
         answer = response.text.strip()
+        generated = bool(answer)
         
         if not answer:
             answer = "I apologize, but I couldn't generate a response. Please try again."
             
     except Exception as e:
-        print(f"Error calling Gemini: {e}")
+        log.error("Error calling Gemini: %s", e)
         answer = "Sorry, I encountered an error generating a response. Please try again."
     
-    # Save to message history
+    finish_llm_request(user_id, user_question, request, answer, generated)
+    return answer
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def streamLLMresponse(user_id, user_question, pdf_id=None, scope=None):
+    """
+    Same as takeLLMresponse, but yields Server-Sent Events: `token` events
+    as Gemini produces text, then one `done` event with the full answer and
+    timings, or an `error` event. History is written once the stream ends.
+    """
+    started = time.perf_counter()
+    request = prepare_llm_request(user_id, user_question, pdf_id, scope)
+    if "Error" in request:
+        yield _sse("error", {"error": request["Error"]})
+        return
+    if "cached" in request:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        yield _sse("token", {"text": request["cached"]})
+        yield _sse("done", {"answer": request["cached"], "cached": True,
+                            "ttft_ms": elapsed_ms, "total_ms": elapsed_ms})
+        return
+    
+    parts = []
+    ttft_ms = None
+    interrupted = False
     try:
-        message_collection.insert_one({
-            "user_id": user_id,
-            "pdf_id": pdf_id,
-            "question": user_question,
-            "answer": answer,
-            "context_used": context[:1000],  # Store first 1000 chars of context
-            "qa_matches_count": len(retrieved.get("qa_matches", [])),
-            "chunk_matches_count": len(retrieved.get("chunk_matches", [])),
-            "created_at": datetime.utcnow()
-        })
+        for text in get_llm_gateway().stream(request["prompt"]):
+            if isinstance(text, LLMResult) or not text:
+                continue
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            parts.append(text)
+            yield _sse("token", {"text": text})
     except Exception as e:
-        print(f"Error saving to message history: {e}")
-    
-    return answer
\ No newline at end of file
+        log.error("Error calling Gemini: %s", e)
+        if not parts:
+            yield _sse("error", {"error": "Sorry, I encountered an error generating a response. Please try again."})
+            return
+        # Keep what was streamed for history, but don't cache a partial answer
+        interrupted = True
+    
+    total_ms = (time.perf_counter() - started) * 1000
+    answer = "".join(parts).strip()
+    generated = bool(answer) and not interrupted
+    if not answer:
+        answer = "I apologize, but I couldn't generate a response. Please try again."
+        yield _sse("token", {"text": answer})
+    request_log.info("Streamed answer: ttft %.0f ms, total %.0f ms", ttft_ms or total_ms, total_ms)
+    
+    finish_llm_request(user_id, user_question, request, answer, generated,
+                       ttft_ms=ttft_ms, total_ms=total_ms)
+    yield _sse("done", {"answer": answer, "cached": False, "ttft_ms": ttft_ms, "total_ms": total_ms})
+
+
+def message_doc(user_id, pdf_id, question, answer, **fields):
+    return {
+        "user_id": user_id,
+        "pdf_id": pdf_id,
+        "question": question,
+        "answer": answer,
+        **fields,
+        "created_at": datetime.utcnow()
+    }
+
+
+def history_fields(request: dict) -> dict:
+    retrieved = request["retrieved"]
+    fields = {
+        "context_used": request["context"][:1000],  # Store first 1000 chars of context
+        "qa_matches_count": len(retrieved.get("qa_matches", [])),
+        "chunk_matches_count": len(retrieved.get("chunk_matches", [])),
+        **request.get("fields", {}),
+    }
+    matches = retrieved.get("qa_matches", []) + retrieved.get("chunk_matches", [])
+    sources = list(dict.fromkeys(m["pdf_id"] for m in matches if "pdf_id" in m))
+    if sources:
+        fields["sources"] = sources
+    return fields
+
+
+def save_message(user_id, pdf_id, question, answer, **fields):
+    """Save to message history"""
+    try:
+        insert_message(message_doc(user_id, pdf_id, question, answer, **fields))
+    except Exception as e:
+        log.error("Error saving to message history: %s", e)
@@ -0,0 +1,119 @@
+import asyncio
+
+from conf.confilg import CONTEXT_CANDIDATES, QUERY_EMBED_TIMEOUT
+from conf.repository import afind_library_version, afind_user_pdf, ainsert_message
+from services.llm.answer_cache import answer_cache
+from services.llm.embedding import get_async_embedding_client
+from services.llm.gateway import get_llm_gateway
+from services.llm.index import normalize_query
+from services.llm.llm import (
+    LIBRARY_SCOPE,
+    build_prompt,
+    history_fields,
+    library_target,
+    message_doc,
+    pdf_target,
+    search_target,
+    target_fields,
+)
+from services.monitoring.logs import get_logger
+from services.monitoring.metrics import stage
+
+log = get_logger("llm")
+
+# Async variants of the /llm path (ASYNC_MODE=1). Mongo goes through motor,
+# Ollama through the shared aiohttp client and the LLM through the gateway's
+# async path, so a slow upstream call holds a coroutine instead of a
+# threadpool thread.
+
+
+async def asave_message(user_id, pdf_id, question, answer, **fields):
+    try:
+        await ainsert_message(message_doc(user_id, pdf_id, question, answer, **fields))
+    except Exception as e:
+        log.error("Error saving to message history: %s", e)
+
+
+async def aprepare_llm_request(user_id, user_question, pdf_id=None, scope=None):
+    """Async prepare_llm_request"""
+    if not user_id:
+        return {"Error": "User not found"}
+
+    if not user_question or len(user_question.strip()) < 3:
+        return {"Error": "Question is too short or empty"}
+
+    if scope == LIBRARY_SCOPE:
+        target = library_target(user_id, await afind_library_version(user_id))
+    else:
+        target = pdf_target(await afind_user_pdf(user_id, pdf_id))
+    if "Error" in target:
+        return target
+
+    pdf_id = target["pdf_id"]
+    cache_id = target["cache_id"]
+    version = target["version"]
+    extra = target_fields(target)
+
+    cached = answer_cache.get_exact(cache_id, version, user_question)
+    if cached is not None:
+        await asave_message(user_id, pdf_id, user_question, cached, cached="exact", **extra)
+        return {"cached": cached}
+
+    try:
+        embedding = await asyncio.wait_for(get_async_embedding_client().embed(user_question), QUERY_EMBED_TIMEOUT)
+        query = normalize_query(embedding)
+    except Exception as e:
+        log.warning("Query embedding unavailable, using lexical retrieval: %r", e)
+        query = None
+
+    if query is None:
+        extra = {**extra, "retrieval": "lexical"}
+    else:
+        cached = answer_cache.get_similar(cache_id, version, query)
+        if cached is not None:
+            answer_cache.put(cache_id, version, user_question, query, cached)
+            await asave_message(user_id, pdf_id, user_question, cached, cached="semantic", **extra)
+            return {"cached": cached}
+
+    # A cold index is loaded from the chunk store; keep that off the event loop
+    retrieved = await asyncio.to_thread(search_target, user_id, target, query, CONTEXT_CANDIDATES, user_question)
+    with stage("prompt"):
+        context, final_prompt, stats = build_prompt(user_question, retrieved)
+
+    return {
+        "pdf_id": pdf_id,
+        "cache_id": cache_id,
+        "version": version,
+        "fields": {**extra, **stats},
+        "query": query,
+        "retrieved": retrieved,
+        "context": context,
+        "prompt": final_prompt,
+    }
+
+
+async def atakeLLMresponse(user_id, user_question, pdf_id=None, scope=None):
+    """Async takeLLMresponse"""
+    request = await aprepare_llm_request(user_id, user_question, pdf_id, scope)
+    if "Error" in request:
+        return request
+    if "cached" in request:
+        return request["cached"]
+
+    generated = False
+    try:
+        response = await get_llm_gateway().agenerate(request["prompt"])
+        answer = response.text.strip()
+        generated = bool(answer)
+
+        if not answer:
+            answer = "I apologize, but I couldn't generate a response. Please try again."
+
+    except Exception as e:
+        log.error("Error calling Gemini: %s", e)
+        answer = "Sorry, I encountered an error generating a response. Please try again."
+
+    if generated and request["query"] is not None:
+        answer_cache.put(request["cache_id"], request["version"], user_question, request["query"], answer)
+    await asave_message(user_id, request["pdf_id"], user_question, answer, **history_fields(request))
+    return answer
@@ -0,0 +1,74 @@
+import hashlib
+from typing import Iterable, Iterator
+
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+MIN_CHUNK_CHARS = 50
+
+
+def chunk_pages(
+    pages: Iterable[str],
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+) -> Iterator[dict]:
+    """
+    Split a stream of page texts into overlapping chunks, yielding
+    {"index", "page", "chunk"} as soon as each chunk is complete. Chunks run
+    across page boundaries exactly as if the pages had been concatenated, so
+    only the current window of text is held in memory. `page` is the page
+    the chunk starts on.
+    """
+    step = chunk_size - overlap
+    buffer = ""
+    # Page number of each page start inside the buffer, as (offset, page)
+    starts = []
+    index = 0
+
+    def emit(text):
+        nonlocal index
+        text = text.strip()
+        if len(text) > MIN_CHUNK_CHARS:  # Only add substantial chunks
+            page = max(p for offset, p in starts if offset <= 0) if starts else 0
+            index += 1
+            return {"index": index - 1, "page": page, "chunk": text}
+        return None
+
+    def advance():
+        nonlocal buffer, starts
+        buffer = buffer[step:]
+        shifted = [(offset - step, p) for offset, p in starts]
+        # Keep the last page that begins at or before the new buffer start
+        before = [item for item in shifted if item[0] <= 0]
+        starts = before[-1:] + [item for item in shifted if item[0] > 0]
+
+    for page_number, text in enumerate(pages):
+        if not text:
+            continue
+        starts.append((len(buffer), page_number))
+        buffer += text
+        while len(buffer) >= chunk_size:
+            chunk = emit(buffer[:chunk_size])
+            if chunk:
+                yield chunk
+            advance()
+
+    while buffer:
+        chunk = emit(buffer[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(buffer) <= step:
+            break
+        advance()
+
+
+def chunk_page(text: str, page: int, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[dict]:
+    """
+    Chunks of a single page. Ingestion chunks page by page so a page's
+    chunks depend only on that page's text, and an unchanged page in a
+    revised PDF produces the same chunks as before. `index` is per page.
+    """
+    return [{**chunk, "page": page} for chunk in chunk_pages([text], chunk_size, overlap)]
+
+
+def page_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
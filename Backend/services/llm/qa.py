@@ -0,0 +1,159 @@
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from conf.confilg import (
+    QA_CONCURRENCY,
+    QA_DEDUP_SIMILARITY,
+    QA_MAX_SECTIONS,
+    QA_PAIRS_PER_SECTION,
+    QA_SECTION_CHARS,
+)
+from services.llm.gateway import get_llm_gateway
+from services.llm.lexical import tokenize
+from services.llm.pipeline import page_hash
+from services.monitoring.logs import get_logger
+
+log = get_logger("qa")
+
+# Map-reduce QA generation: each section of the document gets its own LLM
+# call (map), the pairs are then merged and near-duplicates dropped (reduce)
+
+# A fenced block, closed or cut off
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.S)
+
+
+def qa_sections(pages: list[tuple[str, list[str]]]) -> list[dict]:
+    """
+    Split a document, given as (page_hash, [chunk text]) per page, into
+    {hash, text} sections of whole pages of about QA_SECTION_CHARS
+    characters. A section's hash depends only on its own text, so after a
+    re-ingest sections that did not change keep their QA pairs.
+    """
+    sections, texts, size = [], [], 0
+
+    def close():
+        text = " ".join(texts)[:2 * QA_SECTION_CHARS]
+        sections.append({"hash": page_hash(f"{QA_PAIRS_PER_SECTION}:{text}"), "text": text})
+
+    for _, chunks in pages:
+        texts.extend(chunks)
+        size += sum(len(chunk) for chunk in chunks)
+        if size >= QA_SECTION_CHARS:
+            close()
+            texts, size = [], 0
+    if texts:
+        close()
+    if len(sections) > QA_MAX_SECTIONS:
+        # Cover the whole document rather than its opening sections
+        sections = [sections[i * len(sections) // QA_MAX_SECTIONS] for i in range(QA_MAX_SECTIONS)]
+    return sections
+
+
+def qa_prompt(text: str) -> str:
+    return f"""Based on the following document content, generate relevant Question-Answer pairs.
+
+Document content:
+{text}
+
+Generate comprehensive Q&A pairs covering:
+- Main topics and concepts
+- Important facts and details
+- Definitions and explanations
+- Key relationships and connections
+
+Return ONLY a valid JSON array with this exact format:
+[
+    {{"question": "What is...", "answer": "..."}},
+    {{"question": "How does...", "answer": "..."}}
+]
+
+Generate {QA_PAIRS_PER_SECTION} Q&A pairs. Make questions specific and answers detailed based strictly on the document content."""
+
+
+def _decode(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Decode objects one at a time, so a truncated or malformed array still
+    # yields its complete pairs
+    decoder = json.JSONDecoder()
+    items, position = [], text.find("{")
+    while position != -1:
+        try:
+            item, end = decoder.raw_decode(text, position)
+        except ValueError:
+            position = text.find("{", position + 1)
+            continue
+        items.append(item)
+        position = text.find("{", end)
+    return items
+
+
+def parse_qa(text: str) -> list[dict]:
+    """
+    {question, answer} pairs from an LLM reply: a JSON array, fenced or
+    not, surrounded by prose, wrapped in an object, or cut off part way.
+    """
+    fenced = _FENCE.search(text)
+    data = _decode((fenced.group(1) if fenced else text).strip())
+    if isinstance(data, dict):
+        # {"pairs": [...]} or a single pair
+        data = next((value for value in data.values() if isinstance(value, list)), [data])
+
+    pairs = []
+    for item in data if isinstance(data, list) else []:
+        if not isinstance(item, dict):
+            continue
+        item = {str(key).lower(): value for key, value in item.items()}
+        question, answer = item.get("question"), item.get("answer")
+        if isinstance(question, str) and isinstance(answer, str) and question.strip() and answer.strip():
+            pairs.append({"question": question.strip(), "answer": answer.strip()})
+    return pairs
+
+
+def dedupe_qa(pairs: list[dict], seen: list[dict] = ()) -> list[dict]:
+    """
+    Pairs whose question does not nearly repeat an earlier one (or one in
+    `seen`): questions sharing QA_DEDUP_SIMILARITY of their terms (Jaccard)
+    are duplicates.
+    """
+    kept = []
+    kept_terms = [frozenset(tokenize(pair["question"])) for pair in seen]
+    for pair in pairs:
+        terms = frozenset(tokenize(pair["question"]))
+        if not terms or any(len(terms & other) / len(terms | other) >= QA_DEDUP_SIMILARITY for other in kept_terms):
+            continue
+        kept.append(pair)
+        kept_terms.append(terms)
+    return kept
+
+
+def generate_section_qa(sections: list[dict], on_done=None) -> list[dict]:
+    """
+    QA pairs for each section, QA_CONCURRENCY LLM calls at a time, in
+    section order, each tagged with its section's hash. A section whose
+    call fails is left out. `on_done(sections_done)` is called as calls
+    finish; an exception from it cancels the calls not yet started.
+    """
+    gateway = get_llm_gateway()
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, QA_CONCURRENCY), thread_name_prefix="qa") as pool:
+        futures = {pool.submit(gateway.generate, qa_prompt(section["text"])): section for section in sections}
+        try:
+            for future in as_completed(futures):
+                section = futures[future]
+                try:
+                    pairs = parse_qa(future.result().text)
+                except Exception as e:
+                    log.warning("Error generating QA pairs for a section: %s", e)
+                    pairs = []
+                results[section["hash"]] = [{**pair, "section": section["hash"]} for pair in pairs]
+                if on_done is not None:
+                    on_done(len(results))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return [pair for section in sections for pair in results.get(section["hash"], [])]
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pymongo
+
+from conf.confilg import READY_TIMEOUT, WARMUP, WARMUP_PDFS
+from conf.db import get_client
+from services.monitoring.logs import get_logger
+
+log = get_logger("health")
+
+# Liveness is the process answering at all. Readiness is startup finished,
+# warm-up (when enabled) done, not shutting down, and Mongo reachable.
+
+_state = {"started": False, "warm": False, "stopping": False}
+
+
+def _warm_up():
+    started = time.perf_counter()
+    # Imported here: they pull in the retrieval stack, which the warm-up
+    # is also there to load
+    from conf.repository import find_recent_pdfs
+    from services.llm.embedding import get_embedding_client
+    from services.llm.index import get_index
+    from services.user.passwords import start_password_pool
+
+    steps = {"embedding model": lambda: get_embedding_client().warm_up(), "password workers": start_password_pool}
+    for name, step in steps.items():
+        try:
+            step()
+        except Exception as e:
+            log.warning("Warm-up of the %s failed: %s", name, e)
+
+    indexes = 0
+    try:
+        for pdf in find_recent_pdfs(WARMUP_PDFS):
+            get_index(pdf)
+            indexes += 1
+    except Exception as e:
+        log.warning("Warm-up of the recent indexes failed: %s", e)
+
+    _state["warm"] = True
+    log.info("Warmed up in %.0f ms (%d indexes)", (time.perf_counter() - started) * 1000, indexes)
+
+
+def mark_started():
+    """Startup is done; warm up in the background if enabled"""
+    _state.update(started=True, stopping=False, warm=not WARMUP)
+    if WARMUP:
+        threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+
+
+def mark_stopping():
+    """Shutting down: fail readiness so no new traffic is routed here"""
+    _state["stopping"] = True
+
+
+def readiness() -> tuple[bool, dict]:
+    checks = {
+        "started": _state["started"] and not _state["stopping"],
+        "warm": _state["warm"],
+    }
+    if not checks["started"]:
+        return False, checks
+    try:
+        with pymongo.timeout(READY_TIMEOUT):
+            get_client().admin.command("ping")
+        checks["mongo"] = True
+    except Exception as e:
+        log.warning("Readiness: Mongo ping failed: %s", e)
+        checks["mongo"] = False
+    return all(checks.values()), checks
@@ -0,0 +1,45 @@
+import logging
+import random
+import sys
+
+from conf.confilg import LOG_LEVEL, LOG_SAMPLE_RATE
+
+_ROOT = "chatpdf"
+_configured = False
+
+
+class _Sample(logging.Filter):
+    """Keep a fraction of the records below WARNING; warnings and errors always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def _configure():
+    global _configured
+    root = logging.getLogger(_ROOT)
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL.upper())
+        root.propagate = False
+    _configured = True
+
+
+def get_logger(name: str, sampled: bool = False) -> logging.Logger:
+    """
+    Logger under "chatpdf" at LOG_LEVEL. A sampled logger is for records
+    written on every request: only LOG_SAMPLE_RATE of its records below
+    WARNING are kept.
+    """
+    if not _configured:
+        _configure()
+    logger = logging.getLogger(f"{_ROOT}.{name}")
+    if sampled and not any(isinstance(f, _Sample) for f in logger.filters):
+        logger.addFilter(_Sample(LOG_SAMPLE_RATE))
+    return logger
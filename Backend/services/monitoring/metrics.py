@@ -0,0 +1,175 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Prometheus text-format metrics kept in process. Each worker process has
+# its own, so with several workers every one is scraped (or summed) apart.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += [line for key, value in items for line in self._lines(key, value)]
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _lines(self, key, value):
+        return [f"{self.name}_total{_label_text(self.labels, key)} {_number(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _lines(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_number(bound)}"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(total)}")
+        lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+HTTP_SECONDS = Histogram("chatpdf_http_request_seconds", "HTTP request latency", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("chatpdf_stage_seconds", "Latency of hot-path stages", ("stage",))
+STAGE_ERRORS = Counter("chatpdf_stage_errors", "Stages that raised", ("stage",))
+MONGO_SECONDS = Histogram("chatpdf_mongo_command_seconds", "MongoDB command latency", ("command",))
+MONGO_ERRORS = Counter("chatpdf_mongo_command_errors", "Failed MongoDB commands", ("command",))
+LLM_TOKENS = Counter("chatpdf_llm_tokens", "LLM tokens used", ("direction",))
+CONTEXT_TOKENS = Counter("chatpdf_context_tokens", "Prompt context tokens, by whether they were sent", ("kind",))
+EMBED_TEXTS = Counter("chatpdf_embedded_texts", "Texts embedded, by whether the cache had them", ("source",))
+
+
+class RequestTimings:
+    """Time spent per stage while serving one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self) -> str:
+        """Server-Timing header value, milliseconds per stage and in total"""
+        with self._lock:
+            stages = list(self.stages.items())
+        total = time.perf_counter() - self.started
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages + [("total", total)])
+
+
+_request_timings: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> RequestTimings:
+    """
+    Start collecting stage timings for the current request; shared with
+    threadpool workers that copy the context, like the query counter.
+    """
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(stage: str, seconds: float, histogram: Histogram = STAGE_SECONDS, **labels):
+    histogram.observe(seconds, **(labels or {"stage": stage}))
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as stage `name`, for /metrics and the request's Server-Timing header"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+_END = object()
+
+
+def timed(iterable, name: str):
+    """Iterate, timing each step as stage `name` (for lazy producers such as PDF page text)"""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
@@ -0,0 +1,249 @@
+import hmac
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from conf.confilg import (
+    PROFILE_ADMIN_TOKEN,
+    PROFILE_INTERVAL_MS,
+    PROFILE_KEEP,
+    PROFILE_PATH,
+    PROFILE_SAMPLE_EVERY,
+)
+from services.monitoring.logs import get_logger
+
+log = get_logger("profiler")
+
+# On-demand sampling profiler. While a profile is running, a thread of its
+# own reads every thread's stack with sys._current_frames() every
+# PROFILE_INTERVAL_MS and keeps the stacks that pass through the app's code;
+# idle pool workers and the event loop waiting on I/O have none, while a
+# thread blocked on Ollama, Gemini or Mongo does. Stacks are wall-clock
+# samples, so waiting shows up as well as CPU time. Other requests running
+# at the same time are sampled too; each thread is a separate profile in
+# the speedscope file. Nothing runs for requests that are not profiled.
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_SAMPLER_PREFIX = "profiler-"
+TOP_FUNCTIONS = 20
+
+_current_profile: ContextVar["Profile | None"] = ContextVar("current_profile", default=None)
+_request_count = itertools.count(1)
+_recent = deque()
+_recent_lock = threading.Lock()
+
+
+def _is_app_file(path: str) -> bool:
+    return path.startswith(APP_ROOT) and "site-packages" not in path
+
+
+def _frame_key(code) -> tuple:
+    path = code.co_filename
+    if _is_app_file(path):
+        path = os.path.relpath(path, APP_ROOT)
+    return getattr(code, "co_qualname", code.co_name), path, code.co_firstlineno
+
+
+def _stack(frame) -> tuple | None:
+    """Root-first frame keys, or None if no frame is the app's"""
+    keys, app = [], False
+    while frame is not None:
+        code = frame.f_code
+        app = app or _is_app_file(code.co_filename)
+        keys.append(_frame_key(code))
+        frame = frame.f_back
+    return tuple(reversed(keys)) if app else None
+
+
+class Profile:
+    """Stack samples of the process while one request or job runs"""
+
+    def __init__(self, label: str, trigger: str, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.trigger = trigger
+        self.interval = interval_ms / 1000
+        self.started_at = datetime.utcnow()
+        self.duration_ms = 0.0
+        self.samples = {}  # thread name -> [(stack, weight ms)]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name=_SAMPLER_PREFIX + self.id, daemon=True)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+
+    def _sample(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = (now - last) * 1000, now
+            threads = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = threads.get(ident, str(ident))
+                if name.startswith(_SAMPLER_PREFIX):
+                    continue
+                stack = _stack(frame)
+                if stack is not None:
+                    self.samples.setdefault(name, []).append((stack, weight))
+
+    def summary(self, top: int = TOP_FUNCTIONS) -> dict:
+        """The `top` functions with the most time at the top of the stack (self) and anywhere in it (total)"""
+        own, total, sampled = {}, {}, 0.0
+        for samples in self.samples.values():
+            for stack, weight in samples:
+                sampled += weight
+                own[stack[-1]] = own.get(stack[-1], 0.0) + weight
+                for key in set(stack):
+                    total[key] = total.get(key, 0.0) + weight
+
+        def ranked(times: dict) -> list[dict]:
+            best = sorted(times.items(), key=lambda item: item[1], reverse=True)[:top]
+            return [{"function": f"{name} ({path}:{line})", "ms": round(ms, 1),
+                     "percent": round(100 * ms / sampled, 1) if sampled else 0.0}
+                    for (name, path, line), ms in best]
+
+        return {
+            "id": self.id,
+            "label": self.label,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 1),
+            "threads": {name: len(samples) for name, samples in self.samples.items()},
+            "top_self": ranked(own),
+            "top_total": ranked(total),
+        }
+
+    def speedscope(self) -> dict:
+        """The samples in speedscope's file format, one profile per thread"""
+        frames, indexes = [], {}
+
+        def index(key):
+            if key not in indexes:
+                indexes[key] = len(frames)
+                name, path, line = key
+                frames.append({"name": name, "file": path, "line": line})
+            return indexes[key]
+
+        profiles = []
+        for thread, samples in self.samples.items():
+            profiles.append({
+                "type": "sampled",
+                "name": thread,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weight for _, weight in samples), 3),
+                "samples": [[index(key) for key in stack] for stack, _ in samples],
+                "weights": [round(weight, 3) for _, weight in samples],
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.label} ({self.started_at.isoformat(timespec='seconds')})",
+            "exporter": "chatpdf",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def folded(self) -> str:
+        """Collapsed stacks ("a;b;c milliseconds"), the input of flamegraph.pl"""
+        counts = {}
+        for thread, samples in self.samples.items():
+            for stack, weight in samples:
+                line = ";".join([thread] + [name for name, _, _ in stack])
+                counts[line] = counts.get(line, 0.0) + weight
+        return "".join(f"{line} {round(ms)}\n" for line, ms in counts.items())
+
+    @property
+    def path(self) -> str:
+        return os.path.join(PROFILE_PATH, f"{self.id}.speedscope.json")
+
+
+def _keep(profile: Profile):
+    """Save a finished profile and add it to the ring of recent ones"""
+    try:
+        os.makedirs(PROFILE_PATH, exist_ok=True)
+        with open(profile.path, "w") as f:
+            json.dump(profile.speedscope(), f)
+    except OSError as e:
+        log.warning("Could not save profile %s: %s", profile.id, e)
+
+    with _recent_lock:
+        _recent.append(profile)
+        dropped = _recent.popleft() if len(_recent) > PROFILE_KEEP else None
+    if dropped is not None:
+        try:
+            os.remove(dropped.path)
+        except OSError:
+            pass
+
+
+def start_profile(label: str, trigger: str) -> Profile:
+    """Start profiling the current request; finish_profile() ends it"""
+    profile = Profile(label, trigger)
+    _current_profile.set(profile)
+    profile.start()
+    return profile
+
+
+def finish_profile(profile: Profile):
+    profile.stop()
+    _keep(profile)
+    log.info("Profiled %s in %.0f ms as %s", profile.label, profile.duration_ms, profile.id)
+
+
+@contextmanager
+def profiled(label: str, trigger: str):
+    """Profile the block, such as a background job; the profile is kept when it ends"""
+    reset = _current_profile.set(None)
+    profile = start_profile(label, trigger)
+    try:
+        yield profile
+    finally:
+        finish_profile(profile)
+        _current_profile.reset(reset)
+
+
+def current_trigger() -> str | None:
+    """The trigger of the current request's profile, None when it isn't profiled"""
+    profile = _current_profile.get()
+    return profile.trigger if profile is not None else None
+
+
+def is_admin(token: str | None) -> bool:
+    # As bytes: compare_digest refuses str with non-ASCII characters
+    return bool(PROFILE_ADMIN_TOKEN) and token is not None and hmac.compare_digest(
+        token.encode("utf-8", "surrogateescape"), PROFILE_ADMIN_TOKEN.encode("utf-8"))
+
+
+def profile_trigger(token: str | None) -> str | None:
+    """
+    Why to profile a request: "admin" when it carries the admin token,
+    "sampled" for 1 in PROFILE_SAMPLE_EVERY requests, otherwise None
+    """
+    if token is not None and is_admin(token):
+        return "admin"
+    if PROFILE_SAMPLE_EVERY > 0 and next(_request_count) % PROFILE_SAMPLE_EVERY == 0:
+        return "sampled"
+    return None
+
+
+def recent_profiles() -> list[Profile]:
+    with _recent_lock:
+        return list(reversed(_recent))
+
+
+def find_profile(profile_id: str) -> Profile | None:
+    return next((profile for profile in recent_profiles() if profile.id == profile_id), None)
@@ -0,0 +1,315 @@
+import uuid
+
+import numpy as np
+from bson.binary import Binary
+from pymongo import ASCENDING
+
+from conf.confilg import CHUNK_VECTOR_FORMAT, QA_VECTOR_FORMAT, VECTOR_KEEP_FULL
+from conf.db import chunk_collection, pdf_collection
+from services.store.vectors import VECTOR_DTYPES, VectorMatrix, normalize_rows, quantize
+
+# Vectors are packed little-endian float32, one chunk per document:
+#   {pdf_id, generation, kind: "chunk" | "qa", index, text | question/answer, dim, vector: Binary}
+# In a compact format (float16 | int8) the unit-normalized vector is also
+# stored as qvector (with qformat, and qscale for int8); the float32 vector
+# is then optional and only read to re-rank search results.
+# Each ingestion writes a new generation and the pdfs document points at the
+# current one (`chunk_generation`), so readers never see a half-written set.
+VECTOR_DTYPE = np.dtype("<f4")
+
+INSERT_BATCH = 500
+
+VECTOR_FIELDS = {"dim": 1, "vector": 1, "qformat": 1, "qvector": 1, "qscale": 1}
+COMPACT_FIELDS = {"dim": 1, "qformat": 1, "qvector": 1, "qscale": 1}
+
+_indexes_ready = False
+
+
+def ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        chunk_collection.create_index(
+            [("pdf_id", ASCENDING), ("generation", ASCENDING), ("kind", ASCENDING), ("index", ASCENDING)]
+        )
+        _indexes_ready = True
+
+
+def encode_vector(vector) -> Binary:
+    return Binary(np.asarray(vector, dtype=VECTOR_DTYPE).tobytes())
+
+
+def decode_vectors(blobs: list[bytes], dim: int) -> np.ndarray:
+    """Join packed vectors into one (n, dim) float32 matrix without per-float decoding"""
+    if not blobs:
+        return np.empty((0, dim), dtype=np.float32)
+    return np.frombuffer(b"".join(blobs), dtype=VECTOR_DTYPE).reshape(len(blobs), dim)
+
+
+def vector_fields(vector, fmt: str, keep_full: bool = VECTOR_KEEP_FULL) -> dict:
+    """Stored fields of one raw embedding in `fmt`"""
+    vector = np.asarray(vector, dtype=VECTOR_DTYPE)
+    fields = {"dim": len(vector)}
+    if fmt == "float32" or keep_full:
+        fields["vector"] = encode_vector(vector)
+    if fmt != "float32":
+        data, scale = quantize(normalize_rows(vector), fmt)
+        fields["qformat"] = fmt
+        fields["qvector"] = Binary(data.tobytes())
+        if scale is not None:
+            fields["qscale"] = float(scale[0])
+    return fields
+
+
+def stored_vector(doc: dict) -> dict:
+    """The vector fields of a stored doc, to copy into another generation as they are"""
+    return {key: doc[key] for key in VECTOR_FIELDS if key in doc}
+
+
+def _dense_row(doc: dict) -> np.ndarray:
+    if "vector" in doc:
+        return np.frombuffer(doc["vector"], dtype=VECTOR_DTYPE)
+    row = np.frombuffer(doc["qvector"], dtype=VECTOR_DTYPES[doc["qformat"]]).astype(np.float32)
+    return row * doc.get("qscale", 1.0)
+
+
+def decode_matrix(docs: list[dict], fmt: str) -> VectorMatrix:
+    """
+    Normalized vectors of stored docs in `fmt`. Compact vectors already in
+    that format are joined as they are; anything else goes through float32.
+    """
+    if not docs:
+        return VectorMatrix.empty(fmt)
+    dim = docs[0]["dim"]
+    if fmt != "float32" and all(doc.get("qformat") == fmt for doc in docs):
+        data = np.frombuffer(b"".join(doc["qvector"] for doc in docs), dtype=VECTOR_DTYPES[fmt])
+        scale = np.array([doc["qscale"] for doc in docs], dtype=np.float32) if fmt == "int8" else None
+        return VectorMatrix(data.reshape(len(docs), dim), scale)
+    if fmt == "float32" and all("vector" in doc for doc in docs):
+        return VectorMatrix(normalize_rows(decode_vectors([doc["vector"] for doc in docs], dim)))
+    return VectorMatrix.from_dense(normalize_rows([_dense_row(doc) for doc in docs]), fmt)
+
+
+def new_generation() -> str:
+    return uuid.uuid4().hex
+
+
+def _chunk_doc(pdf_id, item: dict, generation: str = None, fmt: str = CHUNK_VECTOR_FORMAT) -> dict:
+    doc = {
+        "pdf_id": pdf_id,
+        "generation": generation,
+        "kind": "chunk",
+        "index": item["index"],
+        "text": item["chunk"],
+        # Vectors reused from an earlier generation are copied as stored
+        **(item["stored"] if "stored" in item else vector_fields(item["vector"], fmt)),
+    }
+    if "page_hash" in item:
+        doc["page"] = item["page"]
+        doc["page_hash"] = item["page_hash"]
+    return doc
+
+
+def _qa_doc(pdf_id, item: dict, generation: str = None) -> dict:
+    doc = {
+        "pdf_id": pdf_id,
+        "generation": generation,
+        "kind": "qa",
+        "index": item["index"],
+        "question": item["question"],
+        "answer": item["answer"],
+        **vector_fields(item["vector"], QA_VECTOR_FORMAT),
+    }
+    if "section" in item:
+        # Hash of the document section the pair was generated from
+        doc["section"] = item["section"]
+    return doc
+
+
+def _insert(docs: list[dict]):
+    for i in range(0, len(docs), INSERT_BATCH):
+        chunk_collection.insert_many(docs[i:i + INSERT_BATCH], ordered=False)
+
+
+def append_chunks(pdf_id, generation: str, embedding_data: list[dict]):
+    """Add chunk vectors ({index, chunk, vector} items) to a generation"""
+    ensure_indexes()
+    _insert([_chunk_doc(pdf_id, item, generation) for item in embedding_data])
+
+
+def append_qa(pdf_id, generation: str, qa_embeddings: list[dict]):
+    """Add QA-pair vectors ({index, question, answer, vector, section} items) to a generation"""
+    ensure_indexes()
+    _insert([_qa_doc(pdf_id, item, generation) for item in qa_embeddings])
+
+
+def _vector_projection(fmt: str) -> dict:
+    # Compact formats leave the float32 vectors in the database
+    return VECTOR_FIELDS if fmt == "float32" else COMPACT_FIELDS
+
+
+def _fill_missing(pdf_id, generation: str, kind: str, docs: list[dict], fmt: str):
+    """Fetch float32 vectors for docs that have no compact vector in `fmt`"""
+    missing = [doc for doc in docs if fmt != "float32" and doc.get("qformat") != fmt]
+    if missing:
+        full = load_full_vectors(kind, [(pdf_id, generation, [doc["index"] for doc in missing])])
+        for doc in missing:
+            vector = full.get((pdf_id, generation, doc["index"]))
+            if vector is not None:
+                doc["vector"] = vector
+
+
+def load_chunks(pdf_id, generation: str = None, fmt: str = CHUNK_VECTOR_FORMAT):
+    """
+    Return ([chunk text], VectorMatrix in `fmt`, [stored index],
+    [(page, page_hash)]) in chunk order; pages are (None, None) for chunks
+    stored before pages were tracked.
+    """
+    docs = list(chunk_collection.find(
+        {"pdf_id": pdf_id, "generation": generation, "kind": "chunk"},
+        {"_id": 0, "index": 1, "text": 1, "page": 1, "page_hash": 1, **_vector_projection(fmt)},
+    ).sort("index", ASCENDING))
+    _fill_missing(pdf_id, generation, "chunk", docs, fmt)
+    texts = [doc["text"] for doc in docs]
+    ids = [doc["index"] for doc in docs]
+    pages = [(doc.get("page"), doc.get("page_hash")) for doc in docs]
+    return texts, decode_matrix(docs, fmt), ids, pages
+
+
+def load_page_chunks(pdf_id, generation: str, hashes: list[str]) -> dict:
+    """
+    Stored chunks of the pages with the given content hashes, as
+    {page_hash: (page, [chunk doc])}. When several pages share a hash the
+    first one's chunks are returned.
+    """
+    cursor = chunk_collection.find(
+        {"pdf_id": pdf_id, "generation": generation, "kind": "chunk", "page_hash": {"$in": hashes}},
+        {"_id": 0, "text": 1, "page": 1, "page_hash": 1, **VECTOR_FIELDS},
+    ).sort("index", ASCENDING)
+    pages = {}
+    for doc in cursor:
+        page, docs = pages.setdefault(doc["page_hash"], (doc["page"], []))
+        if doc["page"] == page:
+            docs.append(doc)
+    return pages
+
+
+def copy_qa(pdf_id, from_generation: str, to_generation: str, sections: list[str]) -> list[dict]:
+    """
+    Carry the QA pairs generated from the given sections of one generation
+    into another, numbered from 0; returns the {question, answer, section}
+    pairs.
+    """
+    docs = list(chunk_collection.find(
+        {"pdf_id": pdf_id, "generation": from_generation, "kind": "qa", "section": {"$in": sections}},
+        {"_id": 0},
+    ).sort("index", ASCENDING))
+    for index, doc in enumerate(docs):
+        doc["generation"] = to_generation
+        doc["index"] = index
+    if docs:
+        ensure_indexes()
+        _insert(docs)
+    return [{"question": doc["question"], "answer": doc["answer"], "section": doc["section"]} for doc in docs]
+
+
+def load_qa(pdf_id, generation: str = None, fmt: str = QA_VECTOR_FORMAT):
+    """Return ([{question, answer}], VectorMatrix in `fmt`, [stored index]) in QA order"""
+    docs = list(chunk_collection.find(
+        {"pdf_id": pdf_id, "generation": generation, "kind": "qa"},
+        {"_id": 0, "index": 1, "question": 1, "answer": 1, **_vector_projection(fmt)},
+    ).sort("index", ASCENDING))
+    _fill_missing(pdf_id, generation, "qa", docs, fmt)
+    pairs = [{"question": doc["question"], "answer": doc["answer"]} for doc in docs]
+    return pairs, decode_matrix(docs, fmt), [doc["index"] for doc in docs]
+
+
+def load_full_vectors(kind: str, groups: list[tuple]) -> dict:
+    """
+    Stored float32 vectors (not normalized) for (pdf_id, generation,
+    [index]) groups, in one query, keyed by (pdf_id, generation, index).
+    Rows stored without a float32 vector are left out.
+    """
+    if not groups:
+        return {}
+    cursor = chunk_collection.find(
+        {"$or": [
+            {"pdf_id": pdf_id, "generation": generation, "kind": kind, "index": {"$in": list(ids)}}
+            for pdf_id, generation, ids in groups
+        ], "vector": {"$exists": True}},
+        {"_id": 0, "pdf_id": 1, "generation": 1, "index": 1, "vector": 1},
+    )
+    return {
+        (doc["pdf_id"], doc["generation"], doc["index"]): np.frombuffer(doc["vector"], dtype=VECTOR_DTYPE)
+        for doc in cursor
+    }
+
+
+def copy_generation(from_pdf_id, from_generation: str, to_pdf_id, to_generation: str) -> tuple[int, list[dict]]:
+    """
+    Copy every chunk and QA vector of one PDF's generation to another PDF,
+    as stored, in batches. Returns (chunks copied, QA pairs).
+    """
+    ensure_indexes()
+    cursor = chunk_collection.find(
+        {"pdf_id": from_pdf_id, "generation": from_generation},
+        {"_id": 0},
+    ).sort([("kind", ASCENDING), ("index", ASCENDING)])
+    chunks, qa_pairs, batch = 0, [], []
+    for doc in cursor:
+        doc["pdf_id"] = to_pdf_id
+        doc["generation"] = to_generation
+        if doc["kind"] == "qa":
+            qa_pairs.append({"question": doc["question"], "answer": doc["answer"]})
+        else:
+            chunks += 1
+        batch.append(doc)
+        if len(batch) >= INSERT_BATCH:
+            _insert(batch)
+            batch = []
+    if batch:
+        _insert(batch)
+    return chunks, qa_pairs
+
+
+def delete_generation(pdf_id, generation: str):
+    chunk_collection.delete_many({"pdf_id": pdf_id, "generation": generation})
+
+
+def delete_other_generations(pdf_id, keep: str):
+    """Drop everything but the current generation once the pdfs document points at it"""
+    chunk_collection.delete_many({"pdf_id": pdf_id, "generation": {"$ne": keep}})
+
+
+def migrate_pdf(pdf_id) -> bool:
+    """
+    Move legacy inline `embeddings` / `qa_embeddings` arrays of one PDF into
+    the chunk store and drop them from the `pdfs` document. Returns False if
+    the PDF had nothing to migrate.
+    """
+    pdf = pdf_collection.find_one(
+        {"_id": pdf_id},
+        {"embeddings": 1, "qa_embeddings": 1, "vector_store": 1},
+    )
+    if not pdf or pdf.get("vector_store") == "chunks":
+        return False
+
+    embeddings = [e for e in pdf.get("embeddings") or [] if e.get("vector")]
+    qa_embeddings = [e for e in pdf.get("qa_embeddings") or [] if e.get("vector")]
+    if not embeddings and not qa_embeddings:
+        return False
+
+    generation = new_generation()
+    append_chunks(pdf_id, generation, embeddings)
+    append_qa(pdf_id, generation, qa_embeddings)
+    # Another request may have migrated it meanwhile; its generation stays
+    switched = pdf_collection.update_one(
+        {"_id": pdf_id, "vector_store": {"$ne": "chunks"}},
+        {
+            "$set": {"vector_store": "chunks", "chunk_generation": generation},
+            "$unset": {"embeddings": "", "qa_embeddings": ""},
+        },
+    )
+    if switched.matched_count == 0:
+        delete_generation(pdf_id, generation)
+        return False
+    return True
@@ -0,0 +1,30 @@
+"""
+One-off migration of inline `embeddings` / `qa_embeddings` arrays in `pdfs`
+into the binary chunk store.
+
+    python -m services.store.migrate
+
+PDFs that are not migrated here are migrated lazily on their first question.
+"""
+from conf.db import pdf_collection
+from services.store.chunk_store import migrate_pdf
+
+
+def main():
+    legacy = pdf_collection.find(
+        {"vector_store": {"$ne": "chunks"}, "embeddings.0": {"$exists": True}},
+        {"_id": 1},
+    )
+    migrated = 0
+    for pdf in legacy:
+        try:
+            if migrate_pdf(pdf["_id"]):
+                migrated += 1
+                print(f"Migrated {pdf['_id']}")
+        except Exception as e:
+            print(f"Error migrating {pdf['_id']}: {e}")
+    print(f"Migrated {migrated} PDFs")
+
+
+if __name__ == "__main__":
+    main()
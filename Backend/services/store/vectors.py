@@ -0,0 +1,104 @@
+import numpy as np
+
+# In-memory and stored forms of unit-length embedding rows. float16 halves
+# and int8 (one float32 scale per row) quarters the float32 size.
+VECTOR_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2"), "int8": np.dtype("i1")}
+
+# Compact rows are widened to float32 this many at a time when scoring, so
+# the matmul stays in BLAS without a full-size float32 copy
+_SCORE_BLOCK = 8192
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """Stack vectors into a contiguous float32 matrix with unit-length rows"""
+    matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(matrix: np.ndarray, fmt: str):
+    """(data, per-row scale or None) of a float32 matrix in `fmt`"""
+    if fmt == "float16":
+        return matrix.astype(VECTOR_DTYPES["float16"]), None
+    if fmt == "int8":
+        scale = np.abs(matrix).max(axis=1) / 127
+        scale[scale == 0] = 1.0
+        data = np.round(matrix / scale[:, None]).astype(VECTOR_DTYPES["int8"])
+        return data, scale.astype(np.float32)
+    return np.ascontiguousarray(matrix, dtype=np.float32), None
+
+
+class VectorMatrix:
+    """Unit-length rows held as float32, float16 or per-row-scaled int8"""
+
+    def __init__(self, data: np.ndarray, scale: np.ndarray | None = None):
+        self.data = data
+        self.scale = scale
+
+    @classmethod
+    def empty(cls, fmt: str = "float32") -> "VectorMatrix":
+        scale = np.empty(0, np.float32) if fmt == "int8" else None
+        return cls(np.empty((0, 0), VECTOR_DTYPES[fmt]), scale)
+
+    @classmethod
+    def from_dense(cls, matrix: np.ndarray, fmt: str = "float32") -> "VectorMatrix":
+        if matrix.shape[0] == 0:
+            return cls.empty(fmt)
+        return cls(*quantize(matrix, fmt))
+
+    @classmethod
+    def stack(cls, parts: list["VectorMatrix"], fmt: str = "float32") -> "VectorMatrix":
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty(fmt)
+        if len(parts) == 1:
+            return parts[0]
+        scale = np.concatenate([part.scale for part in parts]) if parts[0].scale is not None else None
+        return cls(np.vstack([part.data for part in parts]), scale)
+
+    @property
+    def format(self) -> str:
+        return self.data.dtype.name
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    def take(self, rows) -> "VectorMatrix":
+        """Rows by index array, boolean mask or slice"""
+        return VectorMatrix(self.data[rows], self.scale[rows] if self.scale is not None else None)
+
+    def to_format(self, fmt: str) -> "VectorMatrix":
+        return self if self.format == fmt else VectorMatrix.from_dense(self.dense(), fmt)
+
+    def dense(self, rows=None) -> np.ndarray:
+        """float32 rows; float32 data is returned without a copy"""
+        data = self.data if rows is None else self.data[rows]
+        if self.format == "float32":
+            return data
+        dense = data.astype(np.float32)
+        if self.scale is not None:
+            dense *= (self.scale if rows is None else self.scale[rows])[:, None]
+        return dense
+
+    def scores(self, query: np.ndarray, rows=None) -> np.ndarray:
+        """Dot product of each row (or the given rows) with a float32 query"""
+        data = self.data if rows is None else self.data[rows]
+        if self.format == "float32":
+            return data @ query
+        scores = np.empty(data.shape[0], dtype=np.float32)
+        for start in range(0, data.shape[0], _SCORE_BLOCK):
+            scores[start:start + _SCORE_BLOCK] = data[start:start + _SCORE_BLOCK].astype(np.float32) @ query
+        if self.scale is not None:
+            scores *= self.scale if rows is None else self.scale[rows]
+        return scores
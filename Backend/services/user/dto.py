@@ -24,3 +24,7 @@ class LoginResponseDTO(BaseModel):
 
 class ChatRequest(BaseModel):
     user_question: str
+    # The PDF to ask about; the latest upload when omitted
+    pdf_id: str | None = None
+    # "all" searches every processed PDF of the user
+    scope: str | None = None
@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
+
+from conf.confilg import PASSWORD_QUEUE_LIMIT, PASSWORD_WORKER_NICE, PASSWORD_WORKERS
+from constant.extra import hashPassword, verify_and_update_password
+
+# bcrypt is CPU-bound on purpose. Run inline, a burst of logins takes
+# Starlette's threadpool and the GIL away from /llm; here it runs in a small
+# pool of its own processes, and a request thread only waits for the
+# result. At most PASSWORD_QUEUE_LIMIT hashes are running or queued, so
+# login storms can tie up that many request threads at most; past that
+# they are refused straight away.
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _lower_priority():
+    # When the CPU is saturated, request handling gets it before hashing
+    if hasattr(os, "nice"):
+        os.nice(PASSWORD_WORKER_NICE)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: forking a process that has threads
+                # running can copy a lock held by one of them
+                _pool = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_lower_priority)
+    return _pool
+
+
+def _release(_future=None):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+def _run(fn, *args):
+    if PASSWORD_WORKERS <= 0:
+        return fn(*args)
+
+    global _pending
+    with _pending_lock:
+        if _pending >= PASSWORD_QUEUE_LIMIT:
+            raise HTTPException(status_code=503, detail="Too many sign-ins at once, try again shortly",
+                                headers={"Retry-After": "1"})
+        _pending += 1
+    try:
+        future = _get_pool().submit(fn, *args)
+    except BaseException:
+        _release()
+        raise
+    future.add_done_callback(_release)
+    return future.result()
+
+
+def hash_password(password: str) -> str:
+    return _run(hashPassword, password)
+
+
+def check_password(password: str, hashed: str) -> tuple[bool, str | None]:
+    """(valid, new hash or None): a new hash when the stored one is not at BCRYPT_ROUNDS"""
+    return _run(verify_and_update_password, password, hashed)
+
+
+def start_password_pool():
+    """Start the worker processes ahead of the first sign-in"""
+    if PASSWORD_WORKERS > 0:
+        pool = _get_pool()
+        for future in [pool.submit(int) for _ in range(PASSWORD_WORKERS)]:
+            future.result()
+
+
+def shutdown_password_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -1,11 +1,15 @@
 from fastapi import HTTPException
 from uuid import uuid4
 
-from constant.extra import get_user_by_email, hashPassword, save_user, verify_password
+from conf.repository import email_exists, find_user_by_email, insert_user, replace_password_hash
 
 from jwt_Str.access import create_access_token
+from services.monitoring.logs import get_logger
+from services.user.passwords import check_password, hash_password
 from services.user.dto import UserLoginDTO, UserResponseDTO, UserSignupDTO
 
+log = get_logger("user")
+
 
 class User_Service:
     def __init__(self):
@@ -13,15 +17,15 @@ class User_Service:
 
     def signUp(self, signUp: UserSignupDTO):
         try:
-            if get_user_by_email(signUp.email):
+            if email_exists(signUp.email):
                 raise HTTPException(status_code=400, detail="Email Already reg")
             user = {
                 
                 "userName": signUp.userName,
                 "email": signUp.email,
-                "password": hashPassword(signUp.password)
+                "password": hash_password(signUp.password)
             }
-            data = save_user(user)
+            data = insert_user(user)
             # return UserResponseDTO(
             #     id=user["id"],
             #     userName=user["userName"],
@@ -33,18 +37,21 @@ class User_Service:
         except HTTPException as e:
             raise e
         except Exception as e:
-            print(f"Signup error: {e}")
+            log.error("Signup error: %s", e)
             raise HTTPException(status_code=500, detail="Failed to signup")
         
     def login(self, login: UserLoginDTO):
-        user = get_user_by_email(login.email)
-        print("user",user)
+        user = find_user_by_email(login.email)
         if not user:
             raise HTTPException(status_code=404, detail='user not found')
 
         try:
-            if not verify_password(login.password, user["password"]):
+            valid, new_hash = check_password(login.password, user["password"])
+            if not valid:
                 raise HTTPException(status_code=400, detail="invalid password")
+            if new_hash:
+                # Stored at another cost than BCRYPT_ROUNDS
+                replace_password_hash(user["_id"], user["password"], new_hash)
 
             # return UserResponseDTO(
             #     id=user["_id"],
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+# Settings are read when the app's modules are first imported
+os.environ.update({
+    "LLM_PROVIDER": "fake",
+    "EMBED_CACHE_STORE": "memory",
+    "QA_STAGE": "inline",
+    "ASYNC_MODE": "0",
+    "WARMUP": "0",
+    "PASSWORD_WORKERS": "0",
+    "LOG_LEVEL": "WARNING",
+})
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """The app's database, on an empty in-memory Mongo"""
+    import mongomock
+
+    import conf.db
+
+    conf.db.close_clients()
+    monkeypatch.setattr(conf.db, "MongoClient", lambda *args, **kwargs: mongomock.MongoClient())
+    conf.db.get_client().drop_database(conf.db.DB_NAME)
+    yield conf.db.get_db()
+    conf.db.close_clients()
@@ -0,0 +1,44 @@
+import numpy as np
+
+from services.llm.ann import IVFIndex, _group, _nearest
+from services.store.vectors import VectorMatrix, normalize_rows
+
+
+def clustered(rows=600, dim=16, clusters=8, seed=0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return normalize_rows(centers[rng.integers(0, clusters, rows)] + 0.3 * rng.normal(size=(rows, dim)))
+
+
+def test_probing_every_list_returns_every_row():
+    matrix = VectorMatrix(clustered())
+    index = IVFIndex.train(matrix, n_lists=12)
+    index.n_probe = len(index.lists)
+    rows = index.probe(matrix.dense(slice(0, 1))[0])
+    assert np.array_equal(np.sort(rows), np.arange(len(matrix)))
+
+
+def test_kept_matches_rebuild_over_masked_rows():
+    dense = clustered()
+    index = IVFIndex.train(VectorMatrix(dense), n_lists=12)
+    mask = np.random.default_rng(1).random(len(dense)) < 0.6
+    rebuilt = _group(_nearest(VectorMatrix(dense[mask]), index.centroids), len(index.lists))
+    kept = index.kept(mask)
+    assert kept.size == mask.sum()
+    for ids, expected in zip(kept.lists, rebuilt):
+        assert np.array_equal(ids, expected)
+
+
+def test_save_load_round_trip(tmp_path):
+    index = IVFIndex.train(VectorMatrix(clustered()), n_lists=12)
+    index.add(VectorMatrix(clustered(rows=50, seed=2)), 600)
+    path = str(tmp_path / "ivf" / "pdf.npz")
+    index.save(path, generation="g1")
+    loaded, meta = IVFIndex.load(path, n_probe=3)
+    assert meta == {"generation": "g1"}
+    assert loaded.trained_rows == 600 and loaded.n_probe == 3
+    assert np.array_equal(loaded.centroids, index.centroids)
+    assert len(loaded.lists) == len(index.lists)
+    for ids, expected in zip(loaded.lists, index.lists):
+        assert np.array_equal(ids, expected)
+    assert IVFIndex.load(str(tmp_path / "missing.npz")) == (None, {})
@@ -0,0 +1,33 @@
+from services.store import chunk_store
+
+
+def legacy_pdf(db):
+    vector = [0.1] * 8
+    return db.pdfs.insert_one({
+        "embeddings": [{"index": i, "chunk": f"chunk {i}", "vector": vector} for i in range(3)],
+        "qa_embeddings": [{"index": 0, "question": "q", "answer": "a", "vector": vector}],
+    }).inserted_id
+
+
+def test_migrate_pdf(mongo):
+    pdf_id = legacy_pdf(mongo)
+    assert chunk_store.migrate_pdf(pdf_id)
+    pdf = mongo.pdfs.find_one({"_id": pdf_id})
+    assert pdf["vector_store"] == "chunks" and "embeddings" not in pdf
+    assert mongo.chunks.count_documents({"pdf_id": pdf_id, "generation": pdf["chunk_generation"]}) == 4
+    assert not chunk_store.migrate_pdf(pdf_id)
+
+
+def test_concurrent_migration_leaves_no_orphaned_generation(mongo, monkeypatch):
+    pdf_id = legacy_pdf(mongo)
+    append_qa = chunk_store.append_qa
+
+    def migrated_meanwhile(*args):
+        # Another request finishes migrating while this one writes its chunks
+        append_qa(*args)
+        mongo.pdfs.update_one({"_id": pdf_id}, {"$set": {"vector_store": "chunks", "chunk_generation": "other"}})
+
+    monkeypatch.setattr(chunk_store, "append_qa", migrated_meanwhile)
+    assert not chunk_store.migrate_pdf(pdf_id)
+    assert mongo.pdfs.find_one({"_id": pdf_id})["chunk_generation"] == "other"
+    assert mongo.chunks.count_documents({"pdf_id": pdf_id}) == 0
@@ -0,0 +1,57 @@
+from services.llm.context import SECTIONS, estimate_tokens, pack_context
+from services.llm.pipeline import CHUNK_OVERLAP, chunk_page
+
+
+def sentences(tag: str, count: int) -> str:
+    """`count` sentences of terms found nowhere else"""
+    return " ".join(f"Item {tag}{i} holds w{tag}{i}a and w{tag}{i}b, not w{tag}{i}c." for i in range(count))
+
+
+def chunk(pdf_id: str, chunk_id: int, text: str, score: float) -> dict:
+    return {"pdf_id": pdf_id, "chunk_id": chunk_id, "chunk": text, "score": score}
+
+
+def retrieved(chunks=(), qa=()) -> dict:
+    return {"chunk_matches": list(chunks), "qa_matches": list(qa)}
+
+
+def test_context_stays_within_budget():
+    matches = retrieved(
+        [chunk("a", 2 * i, sentences(f"c{i}x", 6 + 3 * i), 0.9 - i / 20) for i in range(8)],
+        [{"question": f"What is item q{i}?", "answer": sentences(f"q{i}x", 2), "score": 0.9 - i / 20} for i in range(4)])
+    for budget in range(0, 1200, 20):
+        context, stats = pack_context(matches, budget)
+        assert stats["context_tokens"] == estimate_tokens(context) <= budget
+
+
+def test_neighbour_chunks_merged_without_repeating_overlap():
+    text = " ".join(f"w{i:04d}" for i in range(600))
+    chunks = chunk_page(text, 0)
+    assert len(chunks) > 2
+    context, stats = pack_context(retrieved([chunk("a", c["index"], c["chunk"], 0.9) for c in chunks]), 10_000)
+    assert context == f"{SECTIONS[1][1]}\n1. {text}"
+    # Every chunk boundary's overlap, written once
+    boundary = chunks[1]["chunk"][:CHUNK_OVERLAP].strip()
+    assert context.count(boundary) == 1
+    assert stats["context_duplicate_tokens"] >= (len(chunks) - 1) * estimate_tokens(boundary) * 0.8
+
+
+def test_saved_tokens_are_input_less_output():
+    texts = [sentences(f"c{i}x", 12) for i in range(4)]
+    chunks = [chunk("a", 3 * i, text, 0.9 - i / 10) for i, text in enumerate(texts)]
+    # Repeats of a chunk's text, as a non-neighbour chunk and as a QA answer
+    chunks.append(chunk("b", 0, texts[0], 0.4))
+    qa = [{"question": "What holds item c1x0?", "answer": texts[1], "score": 0.95},
+          {"question": "What is item q0?", "answer": sentences("q0x", 1), "score": 0.9}]
+    sent = sum(estimate_tokens(c["chunk"]) for c in chunks) + \
+        sum(estimate_tokens(f"Q: {p['question']}\n   A: {p['answer']}") for p in qa)
+
+    for budget in (150, 300, 600, 10_000):
+        context, stats = pack_context(retrieved(chunks, qa), budget)
+        passages = [line for line in context.split("\n") if line[:1].isdigit()]
+        headings = sum(estimate_tokens(heading) for _, heading in SECTIONS if heading in context)
+        # Each passage is numbered "N. ", two tokens
+        packed = stats["context_tokens"] - headings - 2 * len(passages)
+        assert packed + stats["context_duplicate_tokens"] + stats["context_over_budget_tokens"] == sent
+        assert stats["context_duplicate_tokens"] > 0
+        assert (stats["context_over_budget_tokens"] > 0) == (budget < 10_000)
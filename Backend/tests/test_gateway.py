@@ -0,0 +1,58 @@
+import asyncio
+
+from services.llm.gateway import LLMGateway, LLMResult
+
+
+class SlowProvider:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.calls = 0
+
+    async def agenerate(self, model: str, prompt: str) -> LLMResult:
+        self.calls += 1
+        await asyncio.sleep(self.seconds)
+        return LLMResult(f"answer to {prompt}")
+
+
+def test_identical_prompts_are_merged():
+    provider = SlowProvider(0.05)
+    gateway = LLMGateway(provider, model="test")
+
+    async def run():
+        return await asyncio.gather(*(gateway.agenerate("q") for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert [r.text for r in results] == ["answer to q"] * 3
+    assert provider.calls == 1
+    assert gateway.merged == 2
+
+
+def test_cancelled_leader_does_not_strand_merged_callers():
+    provider = SlowProvider(0.2)
+    gateway = LLMGateway(provider, model="test")
+
+    async def run():
+        leader = asyncio.create_task(gateway.agenerate("q"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(gateway.agenerate("q"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        result = await asyncio.wait_for(follower, 1)
+        assert leader.cancelled()
+        return result
+
+    assert asyncio.run(run()).text == "answer to q"
+    # The follower made the call again once the leader was cancelled
+    assert provider.calls == 2
+
+
+def test_gateway_is_usable_from_another_event_loop():
+    provider = SlowProvider(0.01)
+    gateway = LLMGateway(provider, model="test", max_in_flight=1)
+
+    async def run():
+        return await asyncio.gather(gateway.agenerate("a"), gateway.agenerate("b"))
+
+    # A second asyncio.run, as in a restarted lifespan or a script
+    assert [r.text for r in asyncio.run(run())] == ["answer to a", "answer to b"]
+    assert [r.text for r in asyncio.run(run())] == ["answer to a", "answer to b"]
@@ -0,0 +1,22 @@
+from fastapi.testclient import TestClient
+
+from conf.confilg import UPLOAD_MAX_BYTES
+from route import app
+
+ORIGIN = "http://localhost:5173"
+
+
+def test_oversized_upload_is_refused_with_cors_headers():
+    client = TestClient(app)
+    response = client.post("/upload", headers={"Origin": ORIGIN, "Content-Length": str(UPLOAD_MAX_BYTES * 2)},
+                           content=b"")
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+
+
+def test_non_ascii_profile_token_is_not_an_error(monkeypatch):
+    monkeypatch.setattr("services.monitoring.profiler.PROFILE_ADMIN_TOKEN", "secret")
+    client = TestClient(app, raise_server_exceptions=False)
+    headers = {"X-Profile-Token": "café".encode("latin-1")}
+    assert client.get("/me", headers=headers).status_code == 401
+    assert client.get("/profiles", headers=headers).status_code == 404
@@ -0,0 +1,39 @@
+from services.llm.qa import dedupe_qa, parse_qa
+
+PAIRS = [{"question": "What is a chunk?", "answer": "A slice of a page."},
+         {"question": "How are pages hashed?", "answer": "With SHA-1."}]
+ARRAY = '[{"question": "What is a chunk?", "answer": "A slice of a page."}, ' \
+        '{"question": "How are pages hashed?", "answer": "With SHA-1."}]'
+
+
+def test_parse_fenced():
+    assert parse_qa(f"Here are the pairs:\n```json\n{ARRAY}\n```\nHope this helps.") == PAIRS
+    # The closing fence cut off
+    assert parse_qa(f"```\n{ARRAY}") == PAIRS
+
+
+def test_parse_surrounded_by_prose():
+    assert parse_qa(f"Sure! {ARRAY} Let me know if you need more.") == PAIRS
+
+
+def test_parse_truncated_keeps_complete_pairs():
+    assert parse_qa(ARRAY[:-20]) == PAIRS[:1]
+    assert parse_qa('[{"question": "What is') == []
+
+
+def test_parse_wrapped_and_malformed():
+    assert parse_qa(f'{{"pairs": {ARRAY}}}') == PAIRS
+    assert parse_qa('{"Question": " What is a chunk? ", "ANSWER": "A slice of a page."}') == PAIRS[:1]
+    assert parse_qa('[{"question": "", "answer": "x"}, {"question": "q"}, "text", 3]') == []
+    assert parse_qa("no JSON here") == []
+
+
+def test_dedupe_drops_near_duplicate_questions():
+    pairs = PAIRS + [{"question": "what is a chunk", "answer": "Again."},
+                     {"question": "What is a page?", "answer": "A PDF page."}]
+    assert dedupe_qa(pairs) == PAIRS + pairs[3:]
+
+
+def test_dedupe_against_seen():
+    assert dedupe_qa(PAIRS, seen=PAIRS[1:]) == PAIRS[:1]
+    assert dedupe_qa([{"question": "?!", "answer": "No terms."}]) == []
@@ -0,0 +1,89 @@
+import threading
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+from fastapi.testclient import TestClient
+
+import conf.db
+from bench.fake_ollama import start_fake_ollama
+from bench.synthetic_pdf import write_pdf
+
+# mongomock issues no commands, so each collection call is reported to the
+# app's command listener as the command pymongo would send for it
+COMMANDS = {
+    "find": "find", "find_one": "find", "aggregate": "aggregate", "count_documents": "aggregate",
+    "distinct": "distinct", "insert_one": "insert", "insert_many": "insert", "update_one": "update",
+    "update_many": "update", "replace_one": "update", "find_one_and_update": "findAndModify",
+    "delete_one": "delete", "delete_many": "delete", "bulk_write": "bulkWrite", "create_index": "createIndexes",
+}
+_nested = threading.local()
+
+
+def _counted(method, command):
+    def call(self, *args, **kwargs):
+        # mongomock implements some calls with others; count the outer one
+        if getattr(_nested, "depth", 0) == 0:
+            conf.db._query_listener.started(SimpleNamespace(command_name=command))
+        _nested.depth = getattr(_nested, "depth", 0) + 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _nested.depth -= 1
+    return call
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as patch:
+        for name, command in COMMANDS.items():
+            patch.setattr(mongomock.Collection, name, _counted(getattr(mongomock.Collection, name), command))
+        patch.setattr(conf.db, "MongoClient", lambda *args, **kwargs: mongomock.MongoClient())
+        ollama = start_fake_ollama()
+        from services.llm import embedding
+        patch.setattr(embedding, "_client", embedding.EmbeddingClient(base_url=ollama.url,
+                                                                      cache=embedding.make_embedding_cache()))
+        conf.db.close_clients()
+        import route
+        from conf.repository import insert_pdf
+        from services.llm.llm import injestPdf
+        from bench.suite import create_user
+
+        with TestClient(route.app) as client:
+            user_id, token = create_user("reader")
+            path = tmp_path_factory.mktemp("pdfs") / "report.pdf"
+            write_pdf(str(path), 5, seed=5)
+            pdf_id = insert_pdf({"filename": "report.pdf", "filePath": str(path), "user_id": user_id})["_id"]
+            assert injestPdf(user_id, pdf_id=pdf_id)["status"] == "success"
+            yield SimpleNamespace(client=client, headers={"Authorization": f"Bearer {token}"}, pdf_id=str(pdf_id))
+        ollama.shutdown()
+        conf.db.close_clients()
+
+
+def ask(app, question):
+    return app.client.post("/llm", headers=app.headers, json={"user_question": question, "pdf_id": app.pdf_id})
+
+
+def test_llm_query_count(app):
+    # The first question also loads the index from the chunk store
+    assert ask(app, "What does section 1 cover?").status_code == 200
+
+    response = ask(app, "What does section 2 cover?")
+    assert response.status_code == 200
+    # The pdfs document once, then the message and its session summary
+    assert response.headers["X-DB-Queries"] == "3"
+
+
+def test_cached_answer_query_count(app):
+    ask(app, "What does section 3 cover?")
+    response = ask(app, "What does section 3 cover?")
+    assert response.status_code == 200
+    assert response.headers["X-DB-Queries"] == "3"
+
+
+def test_history_query_count(app):
+    ask(app, "What does section 4 cover?")
+    response = app.client.get(f"/sessions/{app.pdf_id}/messages", headers=app.headers)
+    assert response.status_code == 200
+    assert response.json()["messages"]
+    assert response.headers["X-DB-Queries"] == "1"
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+import conf.repository as repository
+from services.history.sessions import list_messages, list_sessions
+
+START = datetime(2024, 1, 1)
+USER = "user-1"
+
+
+@pytest.fixture
+def db(mongo, monkeypatch):
+    monkeypatch.setattr(repository, "_indexes_ready", False)
+    repository.ensure_indexes()
+    return mongo
+
+
+def add_pdf(db, name):
+    return db.pdfs.insert_one({"user_id": USER, "filename": name}).inserted_id
+
+
+def add_message(pdf_id, minutes, question="q"):
+    repository.insert_message({"user_id": USER, "pdf_id": pdf_id, "question": question, "answer": "a",
+                               "created_at": START + timedelta(minutes=minutes)})
+
+
+def test_session_summary_counts_each_message(db):
+    pdf_id = add_pdf(db, "a.pdf")
+    add_message(pdf_id, 1)
+    add_message(pdf_id, 2)
+    [session] = list_sessions(USER)["sessions"]
+    assert session == {"_id": str(pdf_id), "filename": "a.pdf", "message_count": 2,
+                       "last_message": (START + timedelta(minutes=2)).isoformat()}
+
+
+def test_session_upsert_race_is_retried(db, monkeypatch):
+    pdf_id = add_pdf(db, "a.pdf")
+    add_message(pdf_id, 1)
+
+    class LosingRace:
+        # The session was created by a concurrent first message
+        def update_one(self, query, update, upsert=False):
+            if upsert:
+                raise DuplicateKeyError("E11000 duplicate key")
+            return db.chat_sessions.update_one(query, update)
+
+    monkeypatch.setattr(repository, "session_collection", LosingRace())
+    add_message(pdf_id, 2)
+    assert db.chat_sessions.find_one({"pdf_id": pdf_id})["message_count"] == 2
+
+
+def test_sessions_are_paged_newest_first(db):
+    pdf_ids = [add_pdf(db, f"{n}.pdf") for n in range(5)]
+    for minutes, pdf_id in enumerate(pdf_ids):
+        add_message(pdf_id, minutes)
+
+    seen, cursor = [], None
+    while True:
+        page = list_sessions(USER, cursor, limit=2)
+        seen += [session["_id"] for session in page["sessions"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [str(pdf_id) for pdf_id in reversed(pdf_ids)]
+
+
+def test_messages_with_equal_timestamps_are_paged_once_each(db):
+    pdf_id = add_pdf(db, "a.pdf")
+    for n in range(5):
+        add_message(pdf_id, 0, question=f"q{n}")
+
+    seen, cursor = [], None
+    while True:
+        page = list_messages(USER, str(pdf_id), cursor, limit=2)
+        seen += [message["question"] for message in page["messages"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(seen) == [f"q{n}" for n in range(5)]
+
+
+def test_invalid_cursor_is_refused(db):
+    with pytest.raises(HTTPException) as error:
+        list_sessions(USER, "not-a-cursor")
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException) as error:
+        list_messages(USER, str(ObjectId()), "bm9ufGN1cnNvcg==")
+    assert error.value.status_code == 400
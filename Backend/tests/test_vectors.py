@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from services.llm.index import search_rows
+from services.store.vectors import VectorMatrix, normalize_rows
+
+TOP_K = 5
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    # Groups of near-duplicate rows, whose scores differ by less than the
+    # compact formats resolve
+    rng = np.random.default_rng(7)
+    bases = rng.normal(size=(40, 64))
+    return normalize_rows(np.repeat(bases, 10, axis=0) + 0.002 * rng.normal(size=(400, 64)))
+
+
+def queries(matrix):
+    rng = np.random.default_rng(8)
+    return normalize_rows(matrix[rng.integers(0, len(matrix), 20)] + 0.05 * rng.normal(size=(20, matrix.shape[1])))
+
+
+@pytest.mark.parametrize("fmt", ["float16", "int8"])
+def test_reranked_compact_search_matches_float32(matrix, fmt):
+    exact = VectorMatrix.from_dense(matrix)
+    compact = VectorMatrix.from_dense(matrix, fmt)
+    assert compact.format == fmt and compact.nbytes < exact.nbytes
+
+    def full_vectors(rows):
+        return {row: matrix[row].tolist() for row in rows}
+
+    for query in queries(matrix):
+        expected_rows, expected_scores = search_rows(exact, query, TOP_K)
+        rows, scores = search_rows(compact, query, TOP_K, full_vectors=full_vectors)
+        assert rows.tolist() == expected_rows.tolist()
+        assert np.allclose(scores, expected_scores, atol=1e-6)
@@ -8,19 +8,17 @@ import { useChat } from "@/quries/useChat";
 import { Link } from "react-router-dom";
 import type { AxiosError } from "axios";
 
-interface ChatResponse {
-  answer: string;
-  success: boolean;
-}
 export default function ChatPage() {
   const { token, user, logout } = useAuth();
-  const { sendMessage, generateEmbeddings } = useChat(token!);
+  const { streamMessage, generateEmbeddings } = useChat(token!);
   const { uploadFile } = useFileUpload(token!);
 
   const [question, setQuestion] = useState("");
   const [messages, setMessages] = useState<{ q: string; a: string }[]>([]);
   const [loading, setLoading] = useState(false);
   const [hasUploadedFile, setHasUploadedFile] = useState(false);
+  const [pdfId, setPdfId] = useState<string | null>(null);
+  const [allDocuments, setAllDocuments] = useState(false);
 
   const handleSend = async () => {
     if (!hasUploadedFile) {
@@ -38,9 +36,17 @@ export default function ChatPage() {
       // Add user's question immediately
       setMessages((prev) => [...prev, { q: question, a: "..." }]);
 
-      const response: ChatResponse = await sendMessage(question);
+      // Append tokens to the last message as they arrive
+      let answer = "";
+      const response = await streamMessage(
+        question,
+        (text) => {
+          answer += text;
+          setMessages((prev) => [...prev.slice(0, -1), { q: question, a: answer }]);
+        },
+        { pdfId: pdfId ?? undefined, allDocuments }
+      );
 
-      // Update the last message with the bot's response
       setMessages((prev) => [
         ...prev.slice(0, -1),
         { q: question, a: response.answer },
@@ -72,19 +78,46 @@ export default function ChatPage() {
       setLoading(true);
       try {
         // Upload file
-        await uploadFile(file);
+        const uploaded = await uploadFile(file);
         toast.success("File uploaded successfully!");
 
-        // Generate embeddings
-        const embedPromise = generateEmbeddings();
-        toast.loading("Generating embeddings...", {
+        // Generate embeddings in a background job and follow its progress
+        const toastId = toast.loading("Generating embeddings...", {
           duration: Infinity, // Keep showing until completed
         });
 
-        const embeddingRes = await embedPromise;
-        if (embeddingRes.status === "vector done") {
-          toast.success("Embeddings generated successfully!");
+        let queryable = false;
+        const job = await generateEmbeddings(uploaded.pdf_id, (progress) => {
+          if (progress.state === "embedding" && progress.pages_total) {
+            toast.loading(
+              `Embedding page ${progress.pages_done}/${progress.pages_total} (${progress.chunks_done} chunks)...`,
+              { id: toastId, duration: Infinity }
+            );
+          } else if (progress.state === "qa_pending" && !queryable) {
+            // Chat from the chunks while the QA pairs are generated
+            queryable = true;
+            setPdfId(uploaded.pdf_id);
+            setHasUploadedFile(true);
+            toast.loading("Ready to chat. Preparing suggested answers...", {
+              id: toastId,
+              duration: Infinity,
+            });
+          }
+        });
+        toast.dismiss(toastId);
+
+        if (job.state === "done") {
+          if (job.result?.qa_state && job.result.qa_state !== "done") {
+            toast("Ready to chat, without suggested answers for this PDF");
+          } else {
+            toast.success("Embeddings generated successfully!");
+          }
+          setPdfId(uploaded.pdf_id);
           setHasUploadedFile(true);
+        } else if (queryable) {
+          toast("Ready to chat, without suggested answers for this PDF");
+        } else {
+          toast.error(job.error || `Processing ${job.state}`);
         }
       } catch (err) {
         const error = err as AxiosError<{ message?: string; detail?: string }>;
@@ -145,6 +178,14 @@ export default function ChatPage() {
               onChange={handleFileUpload}
               className="block w-full text-sm text-gray-500 file:mr-4 file:py-2 file:px-4 file:rounded-full file:border-0 file:text-sm file:font-semibold file:bg-blue-50 file:text-blue-700 hover:file:bg-blue-100"
             />
+            <label className="flex items-center gap-2 mt-3 text-sm text-gray-600">
+              <input
+                type="checkbox"
+                checked={allDocuments}
+                onChange={(e) => setAllDocuments(e.target.checked)}
+              />
+              Search all my documents
+            </label>
           </div>
         </div>
 
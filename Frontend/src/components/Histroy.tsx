@@ -15,16 +15,27 @@ interface Message {
 interface Session {
   _id: string;
   filename: string;
-  messages: Message[];
+  message_count: number;
   last_message: string;
 }
 
+interface MessagePage {
+  messages: Message[];
+  nextCursor: string | null;
+  loading: boolean;
+}
+
+const API_URL = "http://localhost:8000";
+
 export default function ChatHistory() {
   const { token, logout } = useAuth();
   const navigate = useNavigate();
   const [sessions, setSessions] = useState<Session[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [selectedSession, setSelectedSession] = useState<string | null>(null);
+  const [messages, setMessages] = useState<Record<string, MessagePage>>({});
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     if (!token) {
@@ -35,38 +46,93 @@ export default function ChatHistory() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [token, navigate]);
 
-  const fetchHistory = async () => {
+  const authHeaders = () => ({
+    Authorization: `Bearer ${token}`,
+    "Content-Type": "application/json",
+  });
+
+  const handleError = (err: unknown, fallback: string) => {
+    const error = err as AxiosError<{ detail?: string }>;
+    console.error(fallback, error);
+
+    if (error instanceof AxiosError && error.response?.status === 401) {
+      toast.error("Session expired. Please login again");
+      logout();
+      navigate("/login");
+    } else {
+      toast.error(error.response?.data?.detail || fallback);
+    }
+  };
+
+  const fetchHistory = async (cursor: string | null = null) => {
     try {
-      setLoading(true);
+      if (cursor) {
+        setLoadingMore(true);
+      } else {
+        setLoading(true);
+      }
       if (!token) {
         throw new Error("No authentication token");
       }
 
-      const response = await axios.get("http://localhost:8000/chat-history", {
-        headers: {
-          Authorization: `Bearer ${token}`,
-          "Content-Type": "application/json",
-        },
+      const response = await axios.get(`${API_URL}/sessions`, {
+        headers: authHeaders(),
+        params: cursor ? { cursor } : {},
       });
 
-      if (response.data.sessions) {
-        setSessions(response.data.sessions);
-      }
+      const page: Session[] = response.data.sessions || [];
+      setSessions((prev) => (cursor ? [...prev, ...page] : page));
+      setNextCursor(response.data.next_cursor);
     } catch (err) {
-      const error = err as AxiosError<{ detail?: string }>;
-      console.error("Error fetching history:", error);
-
-      if (error instanceof AxiosError && error.response?.status === 401) {
-        toast.error("Session expired. Please login again");
-        logout();
-        navigate("/login");
-      } else {
-        toast.error(
-          error.response?.data?.detail || "Failed to fetch chat history"
-        );
-      }
+      handleError(err, "Failed to fetch chat history");
     } finally {
       setLoading(false);
+      setLoadingMore(false);
+    }
+  };
+
+  const fetchMessages = async (sessionId: string, cursor: string | null = null) => {
+    setMessages((prev) => ({
+      ...prev,
+      [sessionId]: {
+        messages: prev[sessionId]?.messages || [],
+        nextCursor: prev[sessionId]?.nextCursor || null,
+        loading: true,
+      },
+    }));
+    try {
+      const response = await axios.get(`${API_URL}/sessions/${sessionId}/messages`, {
+        headers: authHeaders(),
+        params: cursor ? { cursor } : {},
+      });
+      setMessages((prev) => ({
+        ...prev,
+        [sessionId]: {
+          messages: [
+            ...(cursor ? prev[sessionId]?.messages || [] : []),
+            ...response.data.messages,
+          ],
+          nextCursor: response.data.next_cursor,
+          loading: false,
+        },
+      }));
+    } catch (err) {
+      setMessages((prev) => ({
+        ...prev,
+        [sessionId]: { ...prev[sessionId], loading: false },
+      }));
+      handleError(err, "Failed to fetch messages");
+    }
+  };
+
+  const toggleSession = (sessionId: string) => {
+    if (selectedSession === sessionId) {
+      setSelectedSession(null);
+      return;
+    }
+    setSelectedSession(sessionId);
+    if (!messages[sessionId]) {
+      fetchMessages(sessionId);
     }
   };
 
@@ -100,25 +166,22 @@ export default function ChatHistory() {
                   <CardTitle className="flex justify-between items-center">
                     <span>{session.filename}</span>
                     <span className="text-sm text-gray-500">
-                      Last message: {formatDate(session.last_message)}
+                      {session.message_count} messages · Last message:{" "}
+                      {formatDate(session.last_message)}
                     </span>
                   </CardTitle>
                 </CardHeader>
                 <CardContent>
                   <Button
                     variant="outline"
-                    onClick={() =>
-                      setSelectedSession(
-                        selectedSession === session._id ? null : session._id
-                      )
-                    }
+                    onClick={() => toggleSession(session._id)}
                   >
                     {selectedSession === session._id ? "Hide" : "Show"} Messages
                   </Button>
 
                   {selectedSession === session._id && (
                     <div className="mt-4 space-y-4">
-                      {session.messages.map((msg, idx) => (
+                      {messages[session._id]?.messages.map((msg, idx) => (
                         <div key={idx} className="border rounded-lg p-4">
                           <div className="mb-2">
                             <p className="font-medium">Q: {msg.question}</p>
@@ -129,11 +192,37 @@ export default function ChatHistory() {
                           <p className="text-gray-700">A: {msg.answer}</p>
                         </div>
                       ))}
+                      {messages[session._id]?.loading && (
+                        <p className="text-sm text-gray-500">Loading messages...</p>
+                      )}
+                      {messages[session._id]?.nextCursor &&
+                        !messages[session._id]?.loading && (
+                          <Button
+                            variant="outline"
+                            onClick={() =>
+                              fetchMessages(
+                                session._id,
+                                messages[session._id].nextCursor
+                              )
+                            }
+                          >
+                            Load older messages
+                          </Button>
+                        )}
                     </div>
                   )}
                 </CardContent>
               </Card>
             ))}
+            {nextCursor && (
+              <Button
+                variant="outline"
+                disabled={loadingMore}
+                onClick={() => fetchHistory(nextCursor)}
+              >
+                {loadingMore ? "Loading..." : "Load more"}
+              </Button>
+            )}
           </div>
         )}
       </div>
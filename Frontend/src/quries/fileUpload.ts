@@ -3,9 +3,9 @@ import axios from "axios";
 const API_URL = "http://localhost:8000";
 
 interface FileUploadResponse {
-  success: boolean;
-  message: string;
-  fileId?: string;
+  "file Name": string;
+  "saved path": string;
+  pdf_id: string;
 }
 
 export const useFileUpload = (token: string) => {
@@ -8,17 +8,52 @@ interface ChatResponse {
   success: boolean;
 }
 
-interface EmbeddingResponse {
-  status: string;
+export interface StreamDone {
+  answer: string;
+  cached: boolean;
+  ttft_ms: number | null;
+  total_ms: number;
 }
 
-export const useChat = (token: string) => {
-  const sendMessage = async (question: string): Promise<ChatResponse> => {
-    const chatRequest: ChatRequest = {
-      user_question: question,
-    };
+export interface IngestJob {
+  job_id: string;
+  pdf_id: string;
+  // qa_pending: the PDF can be chatted about, QA pairs are still being
+  // generated
+  state: "queued" | "extracting" | "embedding" | "qa" | "qa_pending" | "done" | "failed" | "cancelled";
+  pages_total?: number;
+  pages_done?: number;
+  chunks_total: number;
+  chunks_done: number;
+  error: string | null;
+  result?: { qa_state?: "done" | "failed" | "cancelled" };
+}
+
+// Which document(s) a question is asked against: one PDF, or all of the
+// user's processed PDFs
+export interface ChatTarget {
+  pdfId?: string;
+  allDocuments?: boolean;
+}
+
+const chatRequest = (question: string, target: ChatTarget): ChatRequest => ({
+  user_question: question,
+  ...(target.allDocuments
+    ? { scope: "all" as const }
+    : target.pdfId
+      ? { pdf_id: target.pdfId }
+      : {}),
+});
 
-    const res = await axios.post<ChatResponse>(`${API_URL}/llm`, chatRequest, {
+const FINAL_STATES = ["done", "failed", "cancelled"];
+const POLL_INTERVAL_MS = 1000;
+
+export const useChat = (token: string) => {
+  const sendMessage = async (
+    question: string,
+    target: ChatTarget = {}
+  ): Promise<ChatResponse> => {
+    const res = await axios.post<ChatResponse>(`${API_URL}/llm`, chatRequest(question, target), {
       headers: {
         Authorization: `Bearer ${token}`,
       },
@@ -27,18 +62,89 @@ export const useChat = (token: string) => {
     return res.data;
   };
 
-  const generateEmbeddings = async (): Promise<EmbeddingResponse> => {
-    const res = await axios.post<EmbeddingResponse>(
-      `${API_URL}/inset`,
-      {},
-      {
-        headers: {
-          Authorization: `Bearer ${token}`,
-        },
+  // Streams the answer over Server-Sent Events. EventSource can't send an
+  // Authorization header or a POST body, so the stream is read with fetch.
+  const streamMessage = async (
+    question: string,
+    onToken: (text: string) => void,
+    target: ChatTarget = {}
+  ): Promise<StreamDone> => {
+    const res = await fetch(`${API_URL}/llm/stream`, {
+      method: "POST",
+      headers: {
+        Authorization: `Bearer ${token}`,
+        "Content-Type": "application/json",
+        Accept: "text/event-stream",
+      },
+      body: JSON.stringify(chatRequest(question, target)),
+    });
+    if (!res.ok || !res.body) {
+      throw new Error(`Request failed with status ${res.status}`);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary = buffer.indexOf("\n\n");
+      while (boundary !== -1) {
+        const raw = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf("\n\n");
+
+        let event = "message";
+        let data = "";
+        for (const line of raw.split("\n")) {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        }
+        if (!data) continue;
+        const payload = JSON.parse(data);
+
+        if (event === "token") onToken(payload.text);
+        else if (event === "done") return payload as StreamDone;
+        else if (event === "error") throw new Error(payload.error);
       }
-    );
+    }
+    throw new Error("Stream ended before the answer was complete");
+  };
+
+  // Starts a background ingestion job and polls it until it finishes
+  const generateEmbeddings = async (
+    pdfId: string,
+    onProgress?: (job: IngestJob) => void
+  ): Promise<IngestJob> => {
+    const headers = { Authorization: `Bearer ${token}` };
+    const res = await axios.post<IngestJob>(`${API_URL}/inset`, {}, {
+      headers,
+      params: { pdf_id: pdfId },
+    });
+    let job = res.data;
+    onProgress?.(job);
+
+    while (!FINAL_STATES.includes(job.state)) {
+      await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+      const poll = await axios.get<IngestJob>(
+        `${API_URL}/ingest/${job.job_id}`,
+        { headers }
+      );
+      job = poll.data;
+      onProgress?.(job);
+    }
+    return job;
+  };
+
+  const cancelEmbeddings = async (jobId: string): Promise<IngestJob> => {
+    const res = await axios.delete<IngestJob>(`${API_URL}/ingest/${jobId}`, {
+      headers: { Authorization: `Bearer ${token}` },
+    });
     return res.data;
   };
 
-  return { sendMessage, generateEmbeddings };
+  return { sendMessage, streamMessage, generateEmbeddings, cancelEmbeddings };
 };
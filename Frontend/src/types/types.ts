@@ -24,6 +24,8 @@ export interface LoginResponseDTO {
 
 export interface ChatRequest {
   user_question: string;
+  pdf_id?: string;
+  scope?: "all";
 }
 
 export interface ApiResponse {